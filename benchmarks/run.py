@@ -0,0 +1,257 @@
+import json
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import click
+import pandas as pd
+
+from palo.data_models import User
+from palo.engine import load_engine
+from palo.generate_salary_grid_and_badge_referential import (
+    generate_data_for_badge_referential,
+    generate_data_for_salary_grid,
+    get_default_spec,
+    iter_user_referential,
+    write_user_referential,
+)
+from palo.generate_user_referential_data import earn_badge, join_user, upgrade_level
+from palo.main import calculate_salaries, fetch_data
+
+# Standalone benchmark runner. It generates a dataset of the requested size,
+# times the salary and write paths on it and dumps the results as JSON, e.g.
+#
+#   python benchmarks/run.py --users 10000 --events 20 --output before.json
+#   python benchmarks/run.py --users 10000 --events 20 --compare before.json
+
+
+def generate_dataset(
+    data_path: str, number_hives: int, number_users: int, events_per_user: int
+) -> None:
+    spec = get_default_spec(number_hives)
+    badge_referential = generate_data_for_badge_referential(spec)
+    badge_referential.to_csv(f"{data_path}/badge_referential.csv", index=False)
+    generate_data_for_salary_grid(spec).to_csv(
+        f"{data_path}/salary_grid.csv", index=False
+    )
+    write_user_referential(
+        f"{data_path}/user_referential.csv",
+        iter_user_referential(
+            badge_referential,
+            list(spec.hives),
+            number_users,
+            events_per_user,
+            seed=10,
+        ),
+    )
+
+
+def measure(function: Callable[[], object], rounds: int) -> Dict[str, float]:
+    timings: List[float] = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return {
+        "rounds": rounds,
+        "min": min(timings),
+        "median": statistics.median(timings),
+        "mean": statistics.mean(timings),
+    }
+
+
+def copy_tables(data_path: str, destination: str) -> None:
+    # Only the tables: caches and snapshots are rebuilt by the benchmarks.
+    for table in ["badge_referential", "salary_grid", "user_referential"]:
+        shutil.copy(f"{data_path}/{table}.csv", f"{destination}/{table}.csv")
+
+
+def run_benchmarks(data_path: str, rounds: int) -> Dict[str, Dict[str, float]]:
+    results = {}
+    user_referential_path = f"{data_path}/user_referential.csv"
+
+    results["load_user_referential_csv"] = measure(
+        lambda: pd.read_csv(user_referential_path), rounds
+    )
+    fetch_data(user_referential_path)
+    results["load_user_referential_cached"] = measure(
+        lambda: fetch_data(user_referential_path), rounds
+    )
+
+    salary_grid = fetch_data(f"{data_path}/salary_grid.csv")
+    badge_referential = fetch_data(f"{data_path}/badge_referential.csv")
+    user_referential = fetch_data(user_referential_path)
+    results["bulk_salary"] = measure(
+        lambda: calculate_salaries(
+            None, salary_grid, user_referential, badge_referential
+        ),
+        rounds,
+    )
+
+    username, hive = user_referential[["username", "hive"]].values[0]
+    user = User(username=username, hive=hive, level_name=None, badge_names=None)
+    results["single_user_salary_load"] = measure(
+        lambda: load_engine(data_path, username=username).calculate_salary(user),
+        rounds,
+    )
+    # What a user waits for: a new interpreter, the imports and the load.
+    command = [
+        sys.executable,
+        "-m",
+        "palo.main",
+        *["--username", username, "--hive", hive, "--data_path", data_path],
+    ]
+    results["single_user_salary_cli"] = measure(
+        lambda: subprocess.run(command, check=True, capture_output=True), rounds
+    )
+    engine = load_engine(data_path)
+    results["single_user_salary_engine"] = measure(
+        lambda: engine.calculate_salary(user), rounds * 1000
+    )
+
+    # The write paths append to the log, run them on a copy.
+    with tempfile.TemporaryDirectory() as write_path:
+        copy_tables(data_path, write_path)
+        joined = iter(range(rounds))
+        results["join_user"] = measure(
+            lambda: join_user(
+                User(
+                    username=f"benchmark{next(joined)}",
+                    hive=hive,
+                    level_name="Mid",
+                    badge_names=(),
+                ),
+                write_path,
+                load_engine(write_path, username=username),
+            ),
+            rounds,
+        )
+
+        next_badges = iter(
+            badge_referential.loc[
+                (badge_referential["hive"] == hive)
+                & (badge_referential["levelName"] == "Senior")
+            ]["badgeName"].values
+        )
+        results["earn_badge"] = measure(
+            lambda: earn_badge(
+                User(
+                    username="benchmark0",
+                    hive=hive,
+                    level_name=None,
+                    badge_names=(next(next_badges, "unknown"),),
+                ),
+                write_path,
+                load_engine(write_path, username="benchmark0"),
+            ),
+            1,
+        )
+        results["upgrade_level"] = measure(
+            lambda: upgrade_level(
+                User(
+                    username="benchmark0",
+                    hive=hive,
+                    level_name="Senior",
+                    badge_names=(),
+                ),
+                write_path,
+                load_engine(write_path, username="benchmark0"),
+            ),
+            1,
+        )
+    return results
+
+
+def get_dataset_shape(data_path: str) -> Dict[str, Any]:
+    # Events per user can't be told apart from the rows backfilled by
+    # join_user in an existing log.
+    user_referential = fetch_data(f"{data_path}/user_referential.csv")
+    return {
+        "hives": fetch_data(f"{data_path}/salary_grid.csv")["hive"].nunique(),
+        "users": user_referential["username"].nunique(),
+        "events": None,
+    }
+
+
+def get_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+@click.command()
+@click.option("--hives", "number_hives", type=int, default=2)
+@click.option("--users", "number_users", type=int, default=1000)
+@click.option("--events", "events_per_user", type=int, default=10)
+@click.option("--rounds", type=int, default=5, help="Repetitions of each benchmark.")
+@click.option(
+    "--data_path",
+    type=str,
+    default=None,
+    help="Benchmark an existing dataset instead of generating one.",
+)
+@click.option("--output", type=str, default=None, help="Where to write the JSON.")
+@click.option(
+    "--compare",
+    type=str,
+    default=None,
+    help="JSON of a previous run to compare the median timings with.",
+)
+def main(
+    number_hives,
+    number_users,
+    events_per_user,
+    rounds,
+    data_path,
+    output,
+    compare,
+):
+    # An existing dataset is benchmarked on a copy, which starts without the
+    # caches and snapshots of its directory and leaves them untouched.
+    with tempfile.TemporaryDirectory() as benchmark_path:
+        if data_path is None:
+            generate_dataset(
+                benchmark_path, number_hives, number_users, events_per_user
+            )
+            parameters = {
+                "hives": number_hives,
+                "users": number_users,
+                "events": events_per_user,
+            }
+        else:
+            copy_tables(data_path, benchmark_path)
+        results = run_benchmarks(benchmark_path, rounds)
+        if data_path is not None:
+            parameters = get_dataset_shape(benchmark_path)
+
+    report = {
+        "commit": get_commit(),
+        "python": platform.python_version(),
+        "parameters": {**parameters, "rounds": rounds},
+        "results": results,
+    }
+    if output is None:
+        click.echo(json.dumps(report, indent=2))
+    else:
+        with open(output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if compare is not None:
+        with open(compare) as f:
+            previous = json.load(f)["results"]
+        for name, result in results.items():
+            if name in previous:
+                ratio = result["median"] / previous[name]["median"]
+                click.echo(f"{name}: {ratio:.2f}x the median of {compare}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+from __future__ import annotations
+
+import io
+import os
+import pickle
+from typing import TYPE_CHECKING, Any, Dict, Optional
+
+from palo.constants import CATEGORICAL_COLUMNS
+from palo.instrumentation import count
+from palo.snapshot import get_log_digest
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# Parsed CSV tables are cached next to the data in a `.palo_cache` directory so
+# that repeated runs don't parse the same CSV again. Each entry remembers the
+# size, mtime and a digest of the file it was built from (see
+# palo.snapshot.get_log_digest, only the end of the cached content is hashed):
+# - same size and mtime: the cached table is used as is.
+# - the file grew and still starts with the cached content (our tables are
+#   append only): only the new lines are parsed and added to the cache.
+# - anything else: the file is parsed again.
+# The columns of CATEGORICAL_COLUMNS are parsed as categoricals.
+
+CACHE_DIR_NAME = ".palo_cache"
+# Bumped whenever the cached tables change, entries of other versions are
+# parsed again.
+CACHE_VERSION = 3
+
+# dtype of the columns of the CSV tables whichever way they're parsed. As
+# categoricals, names are parsed as strings even when they look like numbers.
+CSV_DTYPES = {column: "category" for column in CATEGORICAL_COLUMNS}
+
+
+def read_csv_cached(file_path: str) -> pd.DataFrame:
+    directory, file_name = os.path.split(file_path)
+    cache_path = os.path.join(directory, CACHE_DIR_NAME, f"{file_name}.pkl")
+    stat = os.stat(file_path)
+
+    entry = load_entry(cache_path)
+    if entry is not None and entry.get("version") != CACHE_VERSION:
+        entry = None
+    if entry is not None and (entry["size"], entry["mtime_ns"]) == (
+        stat.st_size,
+        stat.st_mtime_ns,
+    ):
+        count("cache_hits")
+        return entry["df"]
+
+    count("files_opened")
+    with open(file_path, "rb") as f:
+        if (
+            entry is not None
+            and entry["appendable"]
+            and entry["offset"] < stat.st_size
+            and get_log_digest(f, entry["offset"]) == entry["digest"]
+        ):
+            # Append only: parse the new lines only. The file grew since it
+            # was cached, a writer may be in the middle of appending a line:
+            # it is left for the next call.
+            f.seek(entry["offset"])
+            tail = f.read()
+            complete = tail[: tail.rfind(b"\n") + 1]
+            if complete:
+                new_rows = parse_csv(entry["header"] + complete)
+                entry["df"] = concat_tables(entry["df"], new_rows)
+            offset = entry["offset"] + len(complete)
+            entry.update(
+                offset=offset,
+                digest=get_log_digest(f, offset),
+                # The size of the complete lines: a file with a half written
+                # line doesn't match the entry and is read again.
+                size=offset,
+                mtime_ns=stat.st_mtime_ns,
+            )
+            save_entry(cache_path, entry)
+            return entry["df"]
+
+        f.seek(0)
+        content = f.read()
+        df = parse_csv(content)
+        entry = {
+            "version": CACHE_VERSION,
+            "df": df,
+            "header": content[: content.find(b"\n") + 1],
+            "offset": len(content),
+            "digest": get_log_digest(f, len(content)),
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            # Lines are appended after a complete line: when the last line
+            # has no newline, the next change parses the whole file again.
+            "appendable": content.endswith(b"\n"),
+        }
+    save_entry(cache_path, entry)
+    return df
+
+
+def parse_csv(content: bytes) -> pd.DataFrame:
+    import pandas as pd
+
+    return pd.read_csv(io.BytesIO(content), dtype=CSV_DTYPES)
+
+
+def concat_tables(df: pd.DataFrame, new_rows: pd.DataFrame) -> pd.DataFrame:
+    """
+    Appends new_rows to df. Categoricals are concatenated with the union of
+    their categories, pd.concat would otherwise turn them back into strings.
+    """
+    import pandas as pd
+
+    df = df.copy(deep=False)
+    new_rows = new_rows.copy(deep=False)
+    for column in df.columns:
+        if column not in new_rows or not isinstance(
+            df[column].dtype, pd.CategoricalDtype
+        ):
+            continue
+        categories = df[column].cat.categories
+        added = pd.Index(new_rows[column].dropna().unique()).difference(categories)
+        df[column] = df[column].cat.add_categories(added)
+        new_rows[column] = new_rows[column].astype(df[column].dtype)
+    return pd.concat([df, new_rows], ignore_index=True)
+
+
+def load_entry(cache_path: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(cache_path, "rb") as f:
+            return pickle.load(f)  # type: ignore[no-any-return]
+    except (OSError, pickle.UnpicklingError, EOFError):
+        return None
+
+
+def save_entry(cache_path: str, entry: Dict[str, Any]) -> None:
+    # The cache is an optimisation, failing to write it is not an error.
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        pass
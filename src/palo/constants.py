@@ -0,0 +1,19 @@
+# Kept free of heavy imports: every entry point imports this module.
+
+LEVEL_NAMES = ["Junior", "Mid", "Senior", "Team_Lead", "Director"]
+LEVEL_RANKS = {level_name: rank for rank, level_name in enumerate(LEVEL_NAMES)}
+
+# Columns of the referential tables with few distinct values, loaded as pandas
+# categoricals: each value is stored once and rows hold integer codes.
+CATEGORICAL_COLUMNS = frozenset(
+    ["username", "hive", "levelName", "badgeName", "badgeType"]
+)
+
+# Share of the difference with the base salary of the previous level which is
+# paid through the badges of a level, and how it is split between badge types.
+BADGE_VALUE_SHARE = 0.5
+BADGE_TYPE_WEIGHTS = {"bronze": 0.4, "silver": 0.6}
+
+# Generated badge names end with a number between 1 and BADGE_NAME_NUMBERS,
+# unique within the badges of a hive, level and type.
+BADGE_NAME_NUMBERS = 9_999_999
@@ -1,5 +1,12 @@
-from typing import Optional, Tuple
-from pydantic import BaseModel
+from typing import Dict, Optional, Tuple
+from pydantic import BaseModel, validator
+
+from palo.constants import (
+    BADGE_NAME_NUMBERS,
+    BADGE_TYPE_WEIGHTS,
+    BADGE_VALUE_SHARE,
+    LEVEL_NAMES,
+)
 
 
 class User(BaseModel):
@@ -7,3 +14,86 @@ class User(BaseModel):
     hive: str
     level_name: Optional[str]
     badge_names: Optional[Tuple[str, ...]]
+
+
+class BaseSalaryChange(BaseModel):
+    # Multiplies the base salary of level_name in hive. None means every hive
+    # or every level.
+    hive: Optional[str] = None
+    level_name: Optional[str] = None
+    factor: float
+
+
+class Scenario(BaseModel):
+    """
+    Salary rules to evaluate with palo.scenarios. The defaults are the rules
+    applied by palo.main.
+    """
+
+    name: str
+    badge_value_share: float = BADGE_VALUE_SHARE
+    bronze_weight: float = BADGE_TYPE_WEIGHTS["bronze"]
+    silver_weight: float = BADGE_TYPE_WEIGHTS["silver"]
+    base_salary_changes: Tuple[BaseSalaryChange, ...] = ()
+
+
+class CatalogSpec(BaseModel):
+    """
+    Salary grid and badge referential generated by
+    palo.generate_salary_grid_and_badge_referential, see read_spec.
+    """
+
+    hives: Tuple[str, ...]
+    # Number of badges of each type per level. The first level has none: there
+    # is no previous level whose salary difference they would pay.
+    badges_per_level: Dict[str, Dict[str, int]]
+    badge_values: Dict[str, int]
+    # Starting salary of some hives, the others are drawn from the limits.
+    starting_base_salaries: Dict[str, int] = {}
+    starting_base_salary_limits: Tuple[int, int]
+    value_general_limits: Tuple[int, int]
+    seed: int
+
+    @validator("hives")
+    def validate_hives(cls, hives: Tuple[str, ...]) -> Tuple[str, ...]:
+        if not hives or len(set(hives)) != len(hives) or not all(hives):
+            raise ValueError("hives must be a non empty list of unique names.")
+        return hives
+
+    @validator("badges_per_level")
+    def validate_badges_per_level(
+        cls, badges_per_level: Dict[str, Dict[str, int]]
+    ) -> Dict[str, Dict[str, int]]:
+        for level_name, badges in badges_per_level.items():
+            if level_name not in LEVEL_NAMES[1:]:
+                raise ValueError(
+                    f"Unknown level {level_name}, badges can only be given to "
+                    f"{', '.join(LEVEL_NAMES[1:])}."
+                )
+            for badge_type, number_badges in badges.items():
+                if badge_type not in BADGE_TYPE_WEIGHTS:
+                    raise ValueError(f"Unknown badge type {badge_type}.")
+                if not 0 <= number_badges <= BADGE_NAME_NUMBERS:
+                    raise ValueError(
+                        f"The number of {badge_type} badges of {level_name} must "
+                        f"be between 0 and {BADGE_NAME_NUMBERS}."
+                    )
+        # In the order of the levels, whatever the order of the spec.
+        return {
+            level_name: badges_per_level[level_name]
+            for level_name in LEVEL_NAMES
+            if level_name in badges_per_level
+        }
+
+    @validator("badge_values")
+    def validate_badge_values(cls, badge_values: Dict[str, int]) -> Dict[str, int]:
+        for badge_type in BADGE_TYPE_WEIGHTS:
+            if badge_type not in badge_values:
+                raise ValueError(f"Missing the value of {badge_type} badges.")
+        return badge_values
+
+    @validator("starting_base_salary_limits", "value_general_limits")
+    def validate_limits(cls, limits: Tuple[int, int]) -> Tuple[int, int]:
+        if not 0 <= limits[0] < limits[1]:
+            raise ValueError("Limits must be [low, high) with 0 <= low < high.")
+        return limits
@@ -0,0 +1,286 @@
+from __future__ import annotations
+
+from collections import defaultdict
+from typing import (
+    TYPE_CHECKING,
+    Dict,
+    FrozenSet,
+    Iterable,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+)
+
+from palo.constants import LEVEL_NAMES, LEVEL_RANKS
+from palo.instrumentation import stage
+from palo.plan import SalaryPlan, get_salary_plan
+from palo.snapshot import UserSnapshot, UserState, fold_user_rows
+from palo.storage import Columns, CsvStorage, get_storage
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+    from palo.data_models import User
+
+# The referentials can be given as DataFrames or, to avoid importing pandas,
+# as mappings of column name to values.
+Table = Union["pd.DataFrame", Columns]
+
+
+class SalaryEngine:
+    """
+    Hash indexes over the three referentials so that pricing a user is a
+    handful of dictionary lookups instead of full DataFrame scans.
+
+    The indexes are built once from the tables returned by fetch_data:
+    (hive, levelName, badgeType) -> badges and (username, hive) -> latest
+    levelName and set of earned badges. The base salaries and badge values,
+    which don't depend on the user, come from a SalaryPlan compiled from the
+    tables unless one is given.
+    """
+
+    def __init__(
+        self,
+        salary_grid: Table,
+        user_referential: Table,
+        badge_referential: Table,
+        plan: Optional[SalaryPlan] = None,
+    ) -> None:
+        self.plan = SalaryPlan(salary_grid, badge_referential) if plan is None else plan
+
+        self.level_names: FrozenSet[str] = frozenset(salary_grid["levelName"])
+
+        badges: Dict[Tuple[str, str, str], List[str]] = defaultdict(list)
+        level_badges: Dict[Tuple[str, str], List[str]] = defaultdict(list)
+        for badge_name, badge_type, level_name, hive in zip(
+            badge_referential["badgeName"],
+            badge_referential["badgeType"],
+            badge_referential["levelName"],
+            badge_referential["hive"],
+        ):
+            badges[(hive, level_name, badge_type)].append(badge_name)
+            level_badges[(hive, level_name)].append(badge_name)
+        self.badges: Dict[Tuple[str, str, str], Tuple[str, ...]] = {
+            key: tuple(names) for key, names in badges.items()
+        }
+        # Every badge of a level whatever its type, in the referential's order.
+        self.level_badges: Dict[Tuple[str, str], Tuple[str, ...]] = {
+            key: tuple(names) for key, names in level_badges.items()
+        }
+        self.badge_names: FrozenSet[str] = frozenset(badge_referential["badgeName"])
+        # Badge names are unique, (hive, levelName) each badge is for.
+        self.badge_levels: Dict[str, Tuple[str, str]] = {
+            badge_name: (hive, level_name)
+            for badge_name, level_name, hive in zip(
+                badge_referential["badgeName"],
+                badge_referential["levelName"],
+                badge_referential["hive"],
+            )
+        }
+
+        levels: Dict[Tuple[str, str], str] = {}
+        earned: Dict[Tuple[str, str], Set[str]] = {}
+        fold_user_rows(
+            zip(
+                user_referential["username"],
+                user_referential["hive"],
+                user_referential["levelName"],
+                user_referential["badgeName"],
+            ),
+            levels,
+            earned,
+        )
+        self._set_user_state(levels, earned)
+        self.hives: FrozenSet[str] = frozenset(hive for hive, _ in self.plan.levels)
+
+    @classmethod
+    def from_snapshot(
+        cls,
+        salary_grid: Table,
+        snapshot: UserState,
+        badge_referential: Table,
+        plan: Optional[SalaryPlan] = None,
+    ) -> SalaryEngine:
+        """
+        Builds the engine from a UserState, e.g. a UserSnapshot, instead of the
+        full user_referential log.
+        """
+        empty_log: Columns = {
+            "username": [],
+            "hive": [],
+            "levelName": [],
+            "badgeName": [],
+        }
+        engine = cls(salary_grid, empty_log, badge_referential, plan=plan)
+        # The state is shared, not copied: refreshing the snapshot refreshes
+        # the engine.
+        engine._set_user_state(snapshot.levels, snapshot.earned, snapshot.usernames)
+        return engine
+
+    def _set_user_state(
+        self,
+        levels: Dict[Tuple[str, str], str],
+        earned: Dict[Tuple[str, str], Set[str]],
+        usernames: Optional[Set[str]] = None,
+    ) -> None:
+        self.levels = levels
+        self.earned = earned
+        self.usernames: Set[str] = (
+            {username for username, _ in self.levels}
+            if usernames is None
+            else usernames
+        )
+
+    def apply(self, rows: Iterable[Tuple[str, str, str, Optional[str]]]) -> None:
+        """
+        Folds (username, hive, levelName, badgeName) rows appended to
+        user_referential into the engine.
+        """
+        rows = list(rows)
+        fold_user_rows(rows, self.levels, self.earned)
+        self.usernames.update(row[0] for row in rows)
+
+    def calculate_salary(self, user: User) -> float:
+        return self.get_salary_breakdown(user)[0]
+
+    def get_salary_breakdown(self, user: User) -> Tuple[float, float, float, float]:
+        """
+        Returns salary, base salary, value of the badges yet to complete for
+        the current level and value of the badges earned from the next level.
+        """
+        return self._get_salary_breakdown(user, self.get_current_level(user))
+
+    def _get_salary_breakdown(
+        self, user: User, level_name: str
+    ) -> Tuple[float, float, float, float]:
+        base_salary = self.get_base_salary(level_name, user.hive)
+
+        yet_to_complete_badge_value = self.get_badge_value(
+            level_name, user, total=True
+        ) - self.get_badge_value(level_name, user, total=False)
+        badge_value_from_next_level = self.get_badge_value_for_next_level(
+            level_name, user
+        )
+
+        salary = base_salary - yet_to_complete_badge_value + badge_value_from_next_level
+        return (
+            salary,
+            base_salary,
+            yet_to_complete_badge_value,
+            badge_value_from_next_level,
+        )
+
+    def get_salary_record(self, user: User) -> Dict[str, object]:
+        """
+        Salary breakdown of the user, with the columns of calculate_salaries.
+        """
+        level_name = self.get_current_level(user)
+        salary, base_salary, yet_to_complete, from_next_level = (
+            self._get_salary_breakdown(user, level_name)
+        )
+        return {
+            "username": user.username,
+            "hive": user.hive,
+            "levelName": level_name,
+            "salary": salary,
+            "baseSalary": base_salary,
+            "yetToCompleteBadgeValue": yet_to_complete,
+            "nextLevelBadgeValue": from_next_level,
+        }
+
+    def get_current_level(self, user: User) -> str:
+        return self.levels[(user.username, user.hive)]
+
+    def get_base_salary(self, level_name: str, hive: str) -> float:
+        return self.plan.get_level(hive, level_name).base_salary
+
+    def get_badge_value(
+        self, level_name: str, user: User, total: bool = False
+    ) -> float:
+        level = self.plan.get_level(user.hive, level_name)
+        if total:
+            return level.total_badge_value
+        return level.get_badge_value(
+            len(self.get_badges_earned(level_name, user, "bronze")),
+            len(self.get_badges_earned(level_name, user, "silver")),
+        )
+
+    def get_badge_value_for_next_level(self, level_name: str, user: User) -> float:
+        rank = LEVEL_RANKS[level_name]
+        # There are no badges to receive after the last level.
+        if rank + 1 >= len(LEVEL_NAMES):
+            return 0.0
+        return self.get_badge_value(LEVEL_NAMES[rank + 1], user)
+
+    def get_all_badges(
+        self, level_name: str, hive: str, badge_type: str
+    ) -> Tuple[str, ...]:
+        return self.badges.get((hive, level_name, badge_type), ())
+
+    def get_badges_earned(
+        self, level_name: str, user: User, badge_type: str
+    ) -> List[str]:
+        badges_earned = self.earned.get((user.username, user.hive), set())
+        return [
+            x
+            for x in self.get_all_badges(level_name, user.hive, badge_type)
+            if x in badges_earned
+        ]
+
+    def validate_hive(self, hive: str) -> None:
+        if hive not in self.hives:
+            raise Exception(
+                f"hive {hive} not found in the database."
+                "Either change the hive argument or add it to the database."
+            )
+
+    def validate_username(self, username: str) -> None:
+        if username not in self.usernames:
+            raise Exception(
+                f"username {username} not found in the database."
+                "Either change the username argument or add it to the database."
+            )
+
+    def validate_user(self, user: User) -> None:
+        self.validate_username(user.username)
+        if (user.username, user.hive) not in self.levels:
+            raise Exception(
+                f"username {user.username} not found in the hive {user.hive}."
+                "Either change the hive argument or add it to the database."
+            )
+
+
+def load_engine(
+    data_path: str, username: Optional[str] = None, hive: Optional[str] = None
+) -> SalaryEngine:
+    """
+    Builds a SalaryEngine from the tables in data_path without importing pandas
+    when they are CSV files: the catalog is read with the csv module and the
+    users from the UserSnapshot. Passing username (and hive, with other
+    backends) only reads the rows of that user, which with sharded CSV files
+    is a single shard.
+    """
+    with stage("load_engine"):
+        storage = get_storage(data_path)
+        salary_grid = storage.fetch_columns(
+            "salary_grid", columns=["hive", "levelName", "baseSalary"]
+        )
+        badge_referential = storage.fetch_columns("badge_referential")
+        plan = get_salary_plan(storage, salary_grid, badge_referential)
+        if isinstance(storage, CsvStorage):
+            # Only the lines appended since the last save are read from the log,
+            # and only the users named username from the snapshot.
+            snapshot = UserSnapshot.load(data_path, username=username)
+            snapshot.save()
+            return SalaryEngine.from_snapshot(
+                salary_grid, snapshot, badge_referential, plan=plan
+            )
+        where: Dict[str, str] = {}
+        if username is not None:
+            where["username"] = username
+            if hive is not None:
+                where["hive"] = hive
+        user_referential = storage.fetch_columns("user_referential", where=where)
+        return SalaryEngine(salary_grid, user_referential, badge_referential, plan=plan)
@@ -0,0 +1,90 @@
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from palo.engine import SalaryEngine
+from palo.streaming import UserKey
+
+# A salary table maintained from the rows appended to user_referential. An
+# event only changes the salary of its user, so after an append only the users
+# of the new rows are priced again. The records which changed are sent to the
+# subscribers and can be polled with get_changes.
+
+SalaryRecord = Dict[str, object]
+Subscriber = Callable[[List[SalaryRecord]], None]
+
+
+class SalaryTable:
+    def __init__(self, engine: SalaryEngine) -> None:
+        self.engine = engine
+        # Salary record of every user, see SalaryEngine.get_salary_record, in
+        # the order users first appear in the log.
+        self.records: Dict[Tuple[str, str], SalaryRecord] = {}
+        # Version in which each user last changed, most recent last.
+        self.versions: "OrderedDict[Tuple[str, str], int]" = OrderedDict()
+        self.version = 0
+        self.subscribers: List[Subscriber] = []
+        self.update(engine.levels)
+
+    def subscribe(self, subscriber: Subscriber) -> None:
+        self.subscribers.append(subscriber)
+
+    def unsubscribe(self, subscriber: Subscriber) -> None:
+        self.subscribers.remove(subscriber)
+
+    def apply(
+        self, rows: Iterable[Tuple[str, str, str, Optional[str]]]
+    ) -> List[SalaryRecord]:
+        """
+        Folds rows appended to user_referential into the engine and updates the
+        salaries of their users.
+        """
+        rows = list(rows)
+        self.engine.apply(rows)
+        return self.update((username, hive) for username, hive, _, _ in rows)
+
+    def update(self, users: Iterable[Tuple[str, str]]) -> List[SalaryRecord]:
+        """
+        Prices the users again, e.g. after their rows were folded into the
+        engine. Returns the records which changed, in a new version.
+        """
+        changed = []
+        for key in dict.fromkeys(users):
+            if key not in self.engine.levels:
+                # Only happens when the log was regenerated.
+                self.records.pop(key, None)
+                self.versions.pop(key, None)
+                continue
+            record = self.engine.get_salary_record(UserKey(*key))
+            if self.records.get(key) != record:
+                self.records[key] = record
+                changed.append((key, record))
+        if not changed:
+            return []
+
+        self.version += 1
+        for key, _ in changed:
+            self.versions[key] = self.version
+            self.versions.move_to_end(key)
+        records = [record for _, record in changed]
+        for subscriber in list(self.subscribers):
+            subscriber(records)
+        return records
+
+    def reset(self, engine: SalaryEngine) -> List[SalaryRecord]:
+        """
+        Switches to a new engine, e.g. after the catalog changed, and prices
+        every user again.
+        """
+        self.engine = engine
+        return self.update([*self.records, *engine.levels])
+
+    def get_changes(self, since: int) -> List[SalaryRecord]:
+        """
+        Records which changed after version `since`, oldest change first.
+        """
+        changes = []
+        for key in reversed(self.versions):
+            if self.versions[key] <= since:
+                break
+            changes.append(self.records[key])
+        return changes[::-1]
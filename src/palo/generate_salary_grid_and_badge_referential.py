@@ -1,11 +1,15 @@
+import json
 import click
-import random
+import numpy as np
 import pandas as pd
 
-from typing import Dict, List, Union
-from palo.main import LEVEL_NAMES
+from typing import Dict, Iterable, Iterator, List, Tuple
+from palo.constants import BADGE_NAME_NUMBERS, LEVEL_NAMES
+from palo.data_models import CatalogSpec
+from palo.storage import TABLE_COLUMNS
 
-random.seed(10)
+# Seed of the badge names and salaries. Users have their own seed, see main.
+CATALOG_SEED = 10
 
 # We need to generate three tables:
 # user_referential: username, hive, levelName, badgeName
@@ -19,7 +23,7 @@ random.seed(10)
 # career at Palo IT.
 
 # NOTE: If you change any of the following parameters, you need to
-# re-run the entire script.
+# re-run the entire script. They are the default spec, see read_spec.
 
 HIVES = ["tech", "design"]
 RANKS = [1, 2, 3, 4, 5]
@@ -29,11 +33,11 @@ BADGE_VALUE = {"bronze": 400, "silver": 500}
 # At Level 2 aiming for Level 3 badges.
 # Hence, there'll be no badges for Level 1 because there is no
 # Level 0.
-NUMBER_BADGES_PER_RANK = {
-    "2": {"bronze": 8, "silver": 9},
-    "3": {"bronze": 8, "silver": 9},
-    "4": {"bronze": 8, "silver": 9},
-    "5": {"bronze": 8, "silver": 9},
+NUMBER_BADGES_PER_LEVEL = {
+    "Mid": {"bronze": 8, "silver": 9},
+    "Senior": {"bronze": 8, "silver": 9},
+    "Team_Lead": {"bronze": 8, "silver": 9},
+    "Director": {"bronze": 8, "silver": 9},
     # Assuming you cannot have badges for Level 6
 }
 
@@ -43,38 +47,27 @@ NUMBER_BADGES_PER_RANK = {
 # can only choose the starting point.
 STARTING_BASE_SALARY = {"tech": 18000, "design": 17000}
 
-BADGE_NAME_SEEDS = {
-    "tech": [
-        "Turing",
-        "Stroustrup",
-        "Jobs",
-        "Einstein",
-        "Newton",
-        "Curie",
-        "Lovelace",
-        "Sandberg",
-        "Zuckerberg",
-        "Gates",
-        "Brin",
-        "Page",
-    ],
-    "design": [
-        "Norman",
-        "Ideo",
-        "Krug",
-        "Amazon",
-        "Miro",
-        "Notion",
-        "AirBnB",
-        "Spreadsheets",
-        "Snapchat",
-        "Instagram",
-        "WhatsApp",
-        "Telegram",
-    ],
-}
+VALUEGENERAL_LIMITS = (10000, 20000)
+STARTING_BASE_SALARY_LIMITS = (15000, 20000)
+# Drawn salaries are multiples of SALARY_STEP above the lower limit.
+SALARY_STEP = 1000
+
+DEFAULT_SPEC = CatalogSpec(
+    hives=HIVES,
+    badges_per_level=NUMBER_BADGES_PER_LEVEL,
+    badge_values=BADGE_VALUE,
+    starting_base_salaries=STARTING_BASE_SALARY,
+    starting_base_salary_limits=STARTING_BASE_SALARY_LIMITS,
+    value_general_limits=VALUEGENERAL_LIMITS,
+    seed=CATALOG_SEED,
+)
 
-VALUEGENERAL_LIMITS = [10000, 20000]
+# Rows of user_referential generated and written at a time, so that logs of
+# any size can be generated without holding them in memory.
+USER_REFERENTIAL_CHUNK_SIZE = 100_000
+USER_COLUMNS = TABLE_COLUMNS["user_referential"]
+# Rows of badge_referential generated and written at a time.
+BADGE_REFERENTIAL_CHUNK_SIZE = 100_000
 
 
 @click.command()
@@ -84,92 +77,356 @@ VALUEGENERAL_LIMITS = [10000, 20000]
     default="data",
     help="Where is the data stored? What's the path?",
 )
-def main(data_path):
-    badge_referential = pd.DataFrame(generate_data_for_badge_referential())
-    salary_grid = pd.DataFrame(generate_data_for_salary_grid())
-    user_referential = pd.DataFrame(
-        columns=["username", "hive", "levelName", "badgeName"]
+@click.option(
+    "--spec",
+    "spec_path",
+    type=click.Path(exists=True, dir_okay=False),
+    default=None,
+    help="JSON file of the hives, badges and salaries to generate, see read_spec.",
+)
+@click.option(
+    "--hives",
+    "number_hives",
+    type=click.IntRange(min=1),
+    default=None,
+    help="Number of hives. Hives after tech and design are named hive2, hive3...",
+)
+@click.option(
+    "--users",
+    "number_users",
+    type=click.IntRange(min=0),
+    default=0,
+    help="Number of users to generate in user_referential.",
+)
+@click.option(
+    "--events",
+    "events_per_user",
+    type=click.IntRange(min=0),
+    default=0,
+    help="Number of earn_badge/upgrade_level events per user after joining.",
+)
+@click.option(
+    "--seed",
+    type=int,
+    default=10,
+    help="Seed of the users generation. The same seed gives the same data.",
+)
+def main(data_path, spec_path, number_hives, number_users, events_per_user, seed):
+    if spec_path is not None and number_hives is not None:
+        raise click.UsageError("--hives can't be used with --spec.")
+    if spec_path is not None:
+        try:
+            spec = read_spec(spec_path)
+        except ValueError as e:
+            raise click.BadParameter(str(e), param_hint="--spec")
+    else:
+        spec = get_default_spec(len(HIVES) if number_hives is None else number_hives)
+
+    generate_data_for_salary_grid(spec).to_csv(
+        f"{data_path}/salary_grid.csv", index=False
     )
-    badge_referential.to_csv(f"{data_path}/badge_referential.csv", index=False)
-    salary_grid.to_csv(f"{data_path}/salary_grid.csv", index=False)
-    user_referential.to_csv(f"{data_path}/user_referential.csv", index=False)
+    # Users only need the name, level and hive of the badges.
+    badge_names: List[pd.DataFrame] = []
 
+    def collect(chunks: Iterable[pd.DataFrame]) -> Iterator[pd.DataFrame]:
+        for chunk in chunks:
+            if number_users:
+                badge_names.append(chunk[["badgeName", "levelName", "hive"]])
+            yield chunk
 
-def generate_data_for_salary_grid() -> List[Dict[str, Union[str, int, float]]]:
-    result = []
-    for hive in HIVES:
-        result.extend(create_fake_salary_grid_for_hive(hive))
-    return result
+    write_chunks(
+        f"{data_path}/badge_referential.csv",
+        collect(iter_badge_referential(spec)),
+        TABLE_COLUMNS["badge_referential"],
+    )
+    write_user_referential(
+        f"{data_path}/user_referential.csv",
+        iter_user_referential(
+            pd.concat(
+                [pd.DataFrame(columns=["badgeName", "levelName", "hive"]), *badge_names]
+            ),
+            list(spec.hives),
+            number_users,
+            events_per_user,
+            seed,
+        ),
+    )
 
 
-def create_fake_salary_grid_for_hive(hive: str) -> List:
-    result = []
-    for rank, levelName in zip(RANKS, LEVEL_NAMES):
-        previous_rank_salary = (
-            STARTING_BASE_SALARY[hive] if not result else result[-1]["baseSalary"]
-        )
-        result.append(
-            {
-                "rank": rank,
-                "levelName": levelName,
-                "hive": hive,
-                "baseSalary": get_salary_for_rank(rank, previous_rank_salary),
-            }
-        )
-    return result
+def read_spec(path: str) -> CatalogSpec:
+    """
+    Reads a JSON spec of the catalog. Missing keys are taken from DEFAULT_SPEC,
+    e.g. 40 hives with 2000 badges of each type per level:
+    {"hives": ["hive0", ..., "hive39"],
+     "badges_per_level": {"Mid": {"bronze": 2000, "silver": 2000},
+                          "Senior": {"bronze": 2000, "silver": 2000},
+                          "Team_Lead": {"bronze": 2000, "silver": 2000},
+                          "Director": {"bronze": 2000, "silver": 2000}},
+     "badge_values": {"bronze": 400, "silver": 500},
+     "starting_base_salaries": {"hive0": 18000},
+     "starting_base_salary_limits": [15000, 20000],
+     "value_general_limits": [10000, 20000],
+     "seed": 10}
+    """
+    with open(path, "r") as f:
+        spec = json.load(f)
+    if not isinstance(spec, dict):
+        raise ValueError(f"{path} must contain a JSON object.")
+    return CatalogSpec(**{**DEFAULT_SPEC.dict(), **spec})
+
+
+def get_hives(number_hives: int) -> List[str]:
+    return HIVES[:number_hives] + [f"hive{i}" for i in range(len(HIVES), number_hives)]
+
+
+def get_default_spec(number_hives: int) -> CatalogSpec:
+    return DEFAULT_SPEC.copy(update={"hives": tuple(get_hives(number_hives))})
+
 
+def get_random_generators(spec: CatalogSpec) -> Tuple[np.random.Generator, ...]:
+    # Independent streams, so that the salaries don't depend on the badges.
+    return tuple(
+        np.random.default_rng(seed)
+        for seed in np.random.SeedSequence(spec.seed).spawn(2)
+    )
+
+
+def draw_multiples(
+    rng: np.random.Generator, limits: Tuple[int, int], size: Tuple[int, ...]
+) -> np.ndarray:
+    # Same distribution as random.randrange(low, high, SALARY_STEP): a uniform
+    # multiple of SALARY_STEP above low, from a different sequence of draws.
+    low, high = limits
+    return low + SALARY_STEP * rng.integers(0, -(-(high - low) // SALARY_STEP), size)
+
+
+def generate_data_for_salary_grid(spec: CatalogSpec = DEFAULT_SPEC) -> pd.DataFrame:
+    """
+    One row per hive and level. The base salary of a level is the one of the
+    previous level plus the value of its badges and a random general value.
+    """
+    rng, _ = get_random_generators(spec)
+    hives = list(spec.hives)
+    starting = draw_multiples(rng, spec.starting_base_salary_limits, (len(hives),))
+    for position, hive in enumerate(hives):
+        if hive in spec.starting_base_salaries:
+            starting[position] = spec.starting_base_salaries[hive]
 
-def get_salary_for_rank(rank: int, previous_rank_salary: float) -> float:
     # Salary for rank 1 doesn't depend upon any badge. It's the starting point.
-    if rank == 1:
-        return previous_rank_salary
-    badge_value = get_total_badge_value(rank, "bronze") + get_total_badge_value(
-        rank, "silver"
+    badge_values = np.array(
+        [
+            sum(
+                number_badges * spec.badge_values[badge_type]
+                for badge_type, number_badges in spec.badges_per_level.get(
+                    level_name, {}
+                ).items()
+            )
+            for level_name in LEVEL_NAMES[1:]
+        ]
     )
-    value_general = random.randrange(
-        VALUEGENERAL_LIMITS[0], VALUEGENERAL_LIMITS[1], 1000
+    value_general = draw_multiples(
+        rng, spec.value_general_limits, (len(hives), len(LEVEL_NAMES) - 1)
+    )
+    increments = np.concatenate(
+        [np.zeros((len(hives), 1), dtype=np.int64), badge_values + value_general],
+        axis=1,
+    )
+    base_salaries = starting[:, None] + np.cumsum(increments, axis=1)
+    return pd.DataFrame(
+        {
+            "rank": np.tile(RANKS, len(hives)),
+            "levelName": np.tile(LEVEL_NAMES, len(hives)),
+            "hive": np.repeat(hives, len(LEVEL_NAMES)),
+            "baseSalary": base_salaries.ravel(),
+        }
     )
-    return previous_rank_salary + badge_value + value_general
 
 
-def get_total_badge_value(rank: int, badge: str) -> float:
-    return NUMBER_BADGES_PER_RANK[str(rank)][badge] * BADGE_VALUE[badge]
+def generate_data_for_badge_referential(
+    spec: CatalogSpec = DEFAULT_SPEC,
+) -> pd.DataFrame:
+    return pd.concat(
+        [
+            pd.DataFrame(columns=TABLE_COLUMNS["badge_referential"]),
+            *iter_badge_referential(spec),
+        ],
+        ignore_index=True,
+    )
 
 
-def generate_data_for_badge_referential() -> List[Dict[str, str]]:
-    result = []
-    for hive in HIVES:
-        result.extend(create_fake_badge_referential_for_hive(hive))
-    return result
+def iter_badge_referential(
+    spec: CatalogSpec, chunk_size: int = BADGE_REFERENTIAL_CHUNK_SIZE
+) -> Iterator[pd.DataFrame]:
+    """
+    Yields the badges of every hive, level and type, at most chunk_size at a
+    time. Badge names are hive-type-level-number and the numbers of a hive,
+    level and type are drawn without replacement, so every name is unique.
+    """
+    _, rng = get_random_generators(spec)
+    for hive in spec.hives:
+        for level_name, badges in spec.badges_per_level.items():
+            for badge_type, number_badges in badges.items():
+                numbers = 1 + rng.choice(
+                    BADGE_NAME_NUMBERS, number_badges, replace=False
+                )
+                names = np.char.add(
+                    "-".join([hive, badge_type, level_name, ""]), numbers.astype(str)
+                )
+                for start in range(0, number_badges, chunk_size):
+                    chunk = names[start : start + chunk_size]
+                    yield pd.DataFrame(
+                        {
+                            "badgeName": chunk,
+                            "badgeType": badge_type,
+                            "levelName": level_name,
+                            "hive": hive,
+                        }
+                    )
 
 
-def create_fake_badge_referential_for_hive(hive: str) -> List[Dict[str, str]]:
-    result = []
-    for rank, badges in NUMBER_BADGES_PER_RANK.items():
-        for badge_type, number_badges in badges.items():
-            result.extend(
-                [
-                    create_fake_data_for_badge(badge_type, rank, hive)
-                    for _ in range(number_badges)
-                ]
-            )
-    return result
+def write_chunks(
+    file_path: str, chunks: Iterable[pd.DataFrame], columns: List[str]
+) -> None:
+    with open(file_path, "w", newline="") as f:
+        pd.DataFrame(columns=columns).to_csv(f, index=False)
+        for chunk in chunks:
+            chunk.to_csv(f, header=False, index=False)
 
 
-def create_fake_data_for_badge(badge_type: str, rank: str, hive: str) -> Dict[str, str]:
-    return {
-        "badgeName": get_random_name(hive, badge_type, rank),
-        "badgeType": badge_type,
-        "levelName": LEVEL_NAMES[RANKS.index(int(rank))],
-        "hive": hive,
+def generate_data_for_user_referential(
+    badge_referential: pd.DataFrame,
+    hives: List[str],
+    number_users: int,
+    events_per_user: int,
+    seed: int,
+) -> pd.DataFrame:
+    chunks = list(
+        iter_user_referential(
+            badge_referential, hives, number_users, events_per_user, seed
+        )
+    )
+    return pd.concat(chunks or [pd.DataFrame(columns=USER_COLUMNS)], ignore_index=True)
+
+
+def iter_user_referential(
+    badge_referential: pd.DataFrame,
+    hives: List[str],
+    number_users: int,
+    events_per_user: int,
+    seed: int,
+    chunk_size: int = USER_REFERENTIAL_CHUNK_SIZE,
+) -> Iterator[pd.DataFrame]:
+    """
+    Yields the rows of user_referential, one user after the other, as written
+    by join_user followed by events_per_user earn_badge or upgrade_level
+    actions, about chunk_size rows at a time. Users earn the badges of the
+    next level in a random order and are upgraded once they have all of them.
+    """
+    rng = np.random.default_rng(seed)
+    badges: Dict[Tuple[str, str], np.ndarray] = {
+        key: badge_names.to_numpy(dtype=object)
+        for key, badge_names in badge_referential.groupby(
+            ["hive", "levelName"], sort=False, observed=True
+        )["badgeName"]
     }
+    # Rows of a user at most: the badges of the starting level and the events.
+    most_rows = max(map(len, badges.values()), default=1) + events_per_user
+    users_per_chunk = max(1, chunk_size // most_rows)
+    width = len(str(number_users))
+    for start in range(0, number_users, users_per_chunk):
+        numbers = np.arange(start, min(start + users_per_chunk, number_users))
+        yield generate_users(rng, badges, hives, numbers, width, events_per_user)
+
+
+def generate_users(
+    rng: np.random.Generator,
+    badges: Dict[Tuple[str, str], np.ndarray],
+    hives: List[str],
+    numbers: np.ndarray,
+    width: int,
+    events_per_user: int,
+) -> pd.DataFrame:
+    """
+    Rows of the users of the given numbers. The users of a hive and starting
+    level have the same rows but for the order of the badges they earn, they
+    are generated together.
+    """
+    user_hives = rng.integers(len(hives), size=len(numbers))
+    # Nobody starts as a Director.
+    ranks = rng.integers(len(LEVEL_NAMES) - 1, size=len(numbers))
+
+    users, level_names, badge_names = [], [], []
+    for hive_index, hive in enumerate(hives):
+        for rank in range(len(LEVEL_NAMES) - 1):
+            group = np.flatnonzero((user_hives == hive_index) & (ranks == rank))
+            if not len(group):
+                continue
+            group_level_names, group_badge_names = generate_user_events(
+                rng, badges, hive, rank, len(group), events_per_user
+            )
+            users.append(np.repeat(group, len(group_level_names)))
+            level_names.append(np.tile(group_level_names, len(group)))
+            badge_names.append(group_badge_names.ravel())
 
+    # Back to one user after the other, the rows of each user in order.
+    rows = np.concatenate(users)
+    order = np.argsort(rows, kind="stable")
+    rows = rows[order]
+    usernames = np.char.add("user", np.char.zfill(numbers.astype(str), width))
+    return pd.DataFrame(
+        {
+            "username": usernames[rows],
+            "hive": np.asarray(hives, dtype=object)[user_hives[rows]],
+            "levelName": np.concatenate(level_names)[order],
+            "badgeName": np.concatenate(badge_names)[order],
+        }
+    ).infer_objects()
 
-def get_random_name(hive: str, badge_type: str, rank: str) -> str:
-    # name = random.sample(BADGE_NAME_SEEDS[hive], 3)
-    level_name = LEVEL_NAMES[RANKS.index(int(rank))]
-    rand_name = str(random.randrange(1, 10000000, 1))
-    return "-".join([hive, badge_type, level_name, rand_name])
+
+def generate_user_events(
+    rng: np.random.Generator,
+    badges: Dict[Tuple[str, str], np.ndarray],
+    hive: str,
+    rank: int,
+    number_users: int,
+    events_per_user: int,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Level names of the rows of users joining hive at rank, and their badge
+    names with one row per user. Each user earns the badges of a level in an
+    order of their own.
+    """
+    no_badge = np.array([None], dtype=object)
+    # join_user backfills the badges of the starting level.
+    joined = badges.get((hive, LEVEL_NAMES[rank]), no_badge)
+    level_names = [np.full(len(joined), LEVEL_NAMES[rank], dtype=object)]
+    badge_names = [np.tile(joined, (number_users, 1))]
+
+    remaining = events_per_user
+    while remaining and rank + 1 < len(LEVEL_NAMES):
+        # Badges of the next level the users haven't earned yet.
+        to_earn = badges.get((hive, LEVEL_NAMES[rank + 1]), no_badge[:0])
+        earned = min(remaining, len(to_earn))
+        if earned:
+            keys = rng.random((number_users, len(to_earn)))
+            badge_names.append(to_earn[np.argsort(keys, axis=1)[:, :earned]])
+            level_names.append(np.full(earned, LEVEL_NAMES[rank], dtype=object))
+            remaining -= earned
+        if remaining:
+            # Every badge is earned, upgrade.
+            rank += 1
+            badge_names.append(np.tile(no_badge, (number_users, 1)))
+            level_names.append(np.array([LEVEL_NAMES[rank]], dtype=object))
+            remaining -= 1
+    return np.concatenate(level_names), np.concatenate(badge_names, axis=1)
+
+
+def write_user_referential(file_path: str, chunks: Iterable[pd.DataFrame]) -> None:
+    write_chunks(
+        file_path,
+        (chunk.reindex(columns=USER_COLUMNS) for chunk in chunks),
+        USER_COLUMNS,
+    )
 
 
 if __name__ == "__main__":
@@ -1,10 +1,30 @@
+from __future__ import annotations
+
 import csv
+import json
+import os
+import sys
 import click
-from typing import Dict
-import pandas as pd
+from typing import (
+    TYPE_CHECKING,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+)
 
-from palo.main import LEVEL_NAMES, get_current_level, validate_username, validate_hive
-from palo.data_models import User
+from palo.constants import LEVEL_NAMES, LEVEL_RANKS
+from palo.engine import SalaryEngine, load_engine
+from palo.instrumentation import PROFILE_MODES, session, stage
+from palo.storage import Record, add_timestamps, get_storage
+
+# pydantic is only imported once the command runs, see palo.main.
+if TYPE_CHECKING:
+    from palo.data_models import User
 
 
 @click.command()
@@ -17,13 +37,11 @@ from palo.data_models import User
     "--username",
     type=str,
     help="User upon whom you're performing the action.",
-    required=True,
 )
 @click.option(
     "--hive",
-    type=click.Choice(["tech", "design"]),
-    help="Which hive are you part of? Currently we support only tech and design.",
-    required=True,
+    type=str,
+    help="Which hive are you part of? It must be a hive of the salary grid.",
 )
 @click.option(
     "--level_name",
@@ -43,44 +61,87 @@ from palo.data_models import User
     default="data",
     help="Where is the data stored? What's the path?",
 )
-def main(action, username, hive, level_name, badge_names, data_path):
-    badge_referential = fetch_data(f"{data_path}/badge_referential.csv")
-    user_referential = fetch_data(f"{data_path}/user_referential.csv")
-    salary_grid = fetch_data(f"{data_path}/salary_grid.csv")
-
-    # Ensure all the inputs are of correct data types
-    user = User(
-        username=username, hive=hive, level_name=level_name, badge_names=badge_names
-    )
-    # Validate hive name actually exists in our database
-    validate_hive(salary_grid, user.hive)
+@click.option(
+    "--events_file",
+    type=click.Path(exists=True, dir_okay=False),
+    default=None,
+    help="Apply every action of this CSV or JSON Lines file, in order, instead "
+    "of a single action. See read_events for the format.",
+)
+@click.option(
+    "--profile",
+    type=click.Choice(PROFILE_MODES),
+    is_flag=False,
+    flag_value="summary",
+    default=None,
+    help="Print the time spent in each stage on stderr, see palo.main.",
+)
+@click.option(
+    "--profile_output",
+    type=click.Path(dir_okay=False, writable=True),
+    default=None,
+    help="Write the --profile report to this file instead of stderr.",
+)
+def main(
+    action,
+    username,
+    hive,
+    level_name,
+    badge_names,
+    data_path,
+    events_file,
+    profile,
+    profile_output,
+):
+    if events_file is not None:
+        with session(
+            "palo.generate_user_referential_data events", profile, profile_output
+        ):
+            ingest_events(events_file, data_path)
+        return
+
+    if action is None or username is None or hive is None:
+        raise click.UsageError(
+            "--action, --username and --hive are required without --events_file."
+        )
 
-    if action == "join_user":
-        join_user(user, data_path, salary_grid, user_referential, badge_referential)
-    elif action == "upgrade_level":
-        upgrade_level(user, data_path, salary_grid, user_referential)
-    elif action == "earn_badge":
-        earn_badge(user, data_path, salary_grid, user_referential, badge_referential)
-    else:
-        print("Invalid input --action")
+    from palo.data_models import User
 
+    with session(
+        f"palo.generate_user_referential_data {action}", profile, profile_output
+    ):
+        # Hash indexes over the referentials, only the rows of this user are
+        # needed.
+        engine = load_engine(data_path, username=username, hive=hive)
+
+        # Ensure all the inputs are of correct data types
+        user = User(
+            username=username, hive=hive, level_name=level_name, badge_names=badge_names
+        )
+        # Validate hive name actually exists in our database
+        engine.validate_hive(user.hive)
 
-def fetch_data(path: str) -> pd.DataFrame:
-    return pd.read_csv(path)
+        if action == "join_user":
+            join_user(user, data_path, engine)
+        elif action == "upgrade_level":
+            upgrade_level(user, data_path, engine)
+        elif action == "earn_badge":
+            earn_badge(user, data_path, engine)
+        else:
+            print("Invalid input --action")
 
 
-def join_user(
-    user: User,
-    path: str,
-    salary_grid: pd.DataFrame,
-    user_referential: pd.DataFrame,
-    badge_referential: pd.DataFrame,
-) -> None:
+def join_user(user: User, path: str, engine: SalaryEngine) -> None:
     """
     Whenever a new user joins Palo IT, we need to put them in our database.
     This function helps them put in the database correctly.
     """
-    validate_new_user(user, salary_grid, user_referential, badge_referential)
+    records = get_join_user_records(user, engine)
+    add_records_to_database(records, path, table="user_referential")
+
+
+def get_join_user_records(user: User, engine: SalaryEngine) -> List[Record]:
+    validate_new_user(user, engine)
 
     # Whenever a new user is added, they're given the badges for their starting
     # level because they've already achieved it. Now they can work for badges
@@ -88,147 +149,294 @@ def join_user(
     # This is the ONLY way we can differentiate new users who start at a level
     # vs old users who are the same level but don't have the badges for that
     # level.
-    backfill_data_for_new_user(user, path, badge_referential)
+    records = get_backfill_records_for_new_user(user, engine)
 
-    record = {
-        "username": user.username,
-        "hive": user.hive,
-        "levelName": user.level_name,
-    }
     # At the start, a user can receive new badges from the level above.
+    validate_badges_can_be_earned(
+        user, engine, user.level_name, {record["badgeName"] for record in records}
+    )
     for badge in user.badge_names:
-        record["badgeName"] = badge
-        add_record_to_database(record, path, table="user_referential")
+        records.append(
+            {
+                "username": user.username,
+                "hive": user.hive,
+                "levelName": user.level_name,
+                "badgeName": badge,
+            }
+        )
+    return records
 
 
-def upgrade_level(
-    user: User,
-    path: str,
-    salary_grid: pd.DataFrame,
-    user_referential: pd.DataFrame,
-) -> None:
-    validate_username(user_referential, user.username)
-    validate_level_name(salary_grid, user.level_name)
+def upgrade_level(user: User, path: str, engine: SalaryEngine) -> None:
+    records = get_upgrade_level_records(user, engine)
+    add_records_to_database(records, path, table="user_referential")
+
+
+def get_upgrade_level_records(user: User, engine: SalaryEngine) -> List[Record]:
+    engine.validate_user(user)
+    validate_level_name(engine, user.level_name)
 
     # Ensure user didn't pass any badge name when upgrading
     if user.badge_names:
         raise ValueError("You can't pass badge_names when upgrading " "user level.")
 
-    # TODO: Ensure user can be upgraded only one level at a time
+    current_user_level = engine.get_current_level(user)
+    # User can't be upgraded to the same level.
+    if user.level_name == current_user_level:
+        raise ValueError(f"{user.username} is already {current_user_level}.")
+    # Ensure user can be upgraded only one level at a time
+    rank = LEVEL_RANKS[current_user_level]
+    if rank + 1 == len(LEVEL_NAMES):
+        raise ValueError(f"{user.username} is already at the highest level.")
+    if LEVEL_RANKS[user.level_name] != rank + 1:
+        raise ValueError(
+            f"{user.username} can only be upgraded one level at a time, from "
+            f"{current_user_level} to {LEVEL_NAMES[rank + 1]}."
+        )
     # TODO: Ensure user need to have completed tech badges of current level
     # before upgrade
-    # TODO: User can't be upgraded to the same level.
-
-    record = {
-        "username": user.username,
-        "hive": user.hive,
-        "levelName": user.level_name,
-        "badgeName": None,
-    }
-    add_record_to_database(record, path, table="user_referential")
-
-
-def earn_badge(
-    user: User,
-    path: str,
-    salary_grid: pd.DataFrame,
-    user_referential: pd.DataFrame,
-    badge_referential: pd.DataFrame,
-) -> None:
-    validate_username(user_referential, user.username)
+
+    return [
+        {
+            "username": user.username,
+            "hive": user.hive,
+            "levelName": user.level_name,
+            "badgeName": None,
+        }
+    ]
+
+
+def earn_badge(user: User, path: str, engine: SalaryEngine) -> None:
+    records = get_earn_badge_records(user, engine)
+    add_records_to_database(records, path, table="user_referential")
+
+
+def get_earn_badge_records(user: User, engine: SalaryEngine) -> List[Record]:
+    engine.validate_user(user)
     for badge in user.badge_names:
-        validate_badge_name(badge_referential, badge)
+        validate_badge_name(engine, badge)
     # Ensure user didn't pass any level name when earning badge. We'll get
     # levelName from the database directly.
     if user.level_name:
         raise ValueError("You can't pass level_name when earning a badge user level.")
 
-    # TODO: Ensure same badge can't be earned twice.
-    # TODO: Ensure can only be earned for current level and the next level.
+    current_user_level = engine.get_current_level(user)
+    validate_badges_can_be_earned(
+        user,
+        engine,
+        current_user_level,
+        engine.earned.get((user.username, user.hive), set()),
+    )
 
-    current_user_level = get_current_level(user, user_referential)
+    return [
+        {
+            "username": user.username,
+            "hive": user.hive,
+            "levelName": current_user_level,
+            "badgeName": badge,
+        }
+        for badge in user.badge_names
+    ]
 
-    record = {
-        "username": user.username,
-        "hive": user.hive,
-        "levelName": current_user_level,
-    }
-    for badge in user.badge_names:
-        record["badgeName"] = badge
-        add_record_to_database(record, path, table="user_referential")
 
+ACTIONS: Dict[str, Callable[[User, SalaryEngine], List[Record]]] = {
+    "join_user": get_join_user_records,
+    "upgrade_level": get_upgrade_level_records,
+    "earn_badge": get_earn_badge_records,
+}
 
-def validate_new_user(
-    user: User,
-    salary_grid: pd.DataFrame,
-    user_referential: pd.DataFrame,
-    badge_referential: pd.DataFrame,
-) -> None:
+EVENT_FIELDS = ["action", "username", "hive", "level_name", "badge_names"]
+# Separator of the badge names of an event in a CSV events file.
+BADGE_NAMES_SEPARATOR = ";"
+
+
+def ingest_events(events_file: str, data_path: str) -> None:
+    """
+    Applies every event of events_file to the referentials in data_path and
+    reports the events which were rejected.
+    """
+    engine = load_engine(data_path)
+    with stage("apply_events"):
+        records, rejected = apply_events(read_events(events_file), engine)
+    add_records_to_database(records, data_path, table="user_referential")
+
+    for line_number, error in rejected:
+        print(f"Rejected event on line {line_number}: {error}", file=sys.stderr)
+    print(
+        f"Appended {len(records)} rows to user_referential, "
+        f"rejected {len(rejected)} events."
+    )
+
+
+def apply_events(
+    events: Iterable[Tuple[int, Dict[str, object]]], engine: SalaryEngine
+) -> Tuple[List[Record], List[Tuple[int, str]]]:
+    """
+    Validates the events in order against the engine, which is updated after
+    each of them so that later events see earlier ones, as if every event was
+    a separate command. Returns the records of the valid events and the line
+    number and error of the others.
+    """
+    from palo.data_models import User
+
+    records: List[Record] = []
+    rejected: List[Tuple[int, str]] = []
+    for line_number, event in events:
+        try:
+            if "error" in event:
+                raise ValueError(event["error"])
+            action = event.get("action")
+            if action not in ACTIONS:
+                raise ValueError(f"Invalid action {action}.")
+            user = User(
+                username=event.get("username"),
+                hive=event.get("hive"),
+                level_name=event.get("level_name") or None,
+                badge_names=event.get("badge_names") or (),
+            )
+            engine.validate_hive(user.hive)
+            event_records = ACTIONS[str(action)](user, engine)
+        except Exception as e:
+            rejected.append((line_number, str(e)))
+            continue
+        engine.apply(
+            (
+                record["username"],
+                record["hive"],
+                record["levelName"],
+                record["badgeName"],
+            )
+            for record in event_records
+        )
+        records.extend(event_records)
+    return records, rejected
+
+
+def read_events(events_file: str) -> Iterator[Tuple[int, Dict[str, object]]]:
+    """
+    Yields (line number, event) for each event of a CSV file, with the columns
+    of EVENT_FIELDS and badge names separated by ";", or of a JSON Lines file
+    (.jsonl or .json) of objects with the same keys, badge_names being a list.
+    """
+    _, extension = os.path.splitext(events_file)
+    with open(events_file, "r", newline="") as f:
+        if extension in (".jsonl", ".json"):
+            for line_number, line in enumerate(f, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    event = json.loads(line)
+                except ValueError as e:
+                    event = {"error": f"Invalid JSON: {e}"}
+                if not isinstance(event, dict):
+                    event = {"error": "An event must be a JSON object."}
+                yield line_number, event
+            return
+        # The header is line 1.
+        for line_number, row in enumerate(csv.DictReader(f), start=2):
+            badge_names = row.get("badge_names") or ""
+            yield line_number, {
+                **row,
+                "badge_names": tuple(
+                    name for name in badge_names.split(BADGE_NAMES_SEPARATOR) if name
+                ),
+            }
+
+
+def validate_new_user(user: User, engine: SalaryEngine) -> None:
     # Ensure this user doesn't exist in the database.
-    if (
-        user.username
-        in user_referential.loc[user_referential["hive"] == user.hive]["username"]
-    ):
+    if (user.username, user.hive) in engine.levels:
         raise ValueError(f"This user {user.username} already exists in the {user.hive}")
     # level_name is required for each user. A new user can't be added without
     # a level_name
     assert user.level_name is not None
-    validate_level_name(salary_grid, user.level_name)
+    validate_level_name(engine, user.level_name)
 
     # A new user can be added without a badge. In that case, for loop will not run.
     # However, if a badge is specified, then we need to validate it.
     for badge in user.badge_names:
-        validate_badge_name(badge_referential, badge)
+        validate_badge_name(engine, badge)
 
 
-def validate_badge_name(badge_referential: pd.DataFrame, badge_name: str) -> None:
-    if badge_name not in badge_referential["badgeName"].values:
+def validate_badges_can_be_earned(
+    user: User, engine: SalaryEngine, level_name: str, earned: Set[str]
+) -> None:
+    """
+    The badges of user.badge_names can only be earned once, and only for
+    level_name or the level after it in the user's hive.
+    """
+    rank = LEVEL_RANKS[level_name]
+    levels = LEVEL_NAMES[rank : rank + 2]
+    seen: Set[str] = set()
+    for badge in user.badge_names:
+        validate_badge_name(engine, badge)
+        # Ensure same badge can't be earned twice.
+        if badge in earned or badge in seen:
+            raise ValueError(f"{user.username} already earned the badge {badge}.")
+        seen.add(badge)
+        # Ensure can only be earned for current level and the next level.
+        hive, badge_level = engine.badge_levels[badge]
+        if hive != user.hive or badge_level not in levels:
+            raise ValueError(
+                f"badge {badge} is a {badge_level} badge of {hive}, "
+                f"{user.username} can only earn {' or '.join(levels)} badges "
+                f"of {user.hive}."
+            )
+
+
+def validate_badge_name(engine: SalaryEngine, badge_name: str) -> None:
+    if badge_name not in engine.badge_names:
         raise Exception(
             f"badgeName {badge_name} not found in the database."
             "Either change the badge_name or add it to the database."
         )
 
 
-def validate_level_name(salary_grid: pd.DataFrame, level_name: str) -> None:
-    if level_name not in salary_grid["levelName"].values:
+def validate_level_name(engine: SalaryEngine, level_name: str) -> None:
+    if level_name not in engine.level_names:
         raise Exception(
             f"levelName {level_name} not found in the database."
             "Either change the level_name or add it to the database."
         )
 
 
-def backfill_data_for_new_user(
-    user: User, path: str, badge_referential: pd.DataFrame
+def backfill_data_for_new_user(user: User, path: str, engine: SalaryEngine) -> None:
+    records = get_backfill_records_for_new_user(user, engine)
+    add_records_to_database(records, path, table="user_referential")
+
+
+def get_backfill_records_for_new_user(
+    user: User, engine: SalaryEngine
+) -> List[Dict[str, Optional[str]]]:
+    badge_names_for_current_user_level = engine.level_badges.get(
+        (user.hive, user.level_name), ()
+    )
+    return [
+        {
+            "username": user.username,
+            "hive": user.hive,
+            "levelName": user.level_name,
+            "badgeName": badge,
+        }
+        for badge in badge_names_for_current_user_level
+    ]
+
+
+def add_record_to_database(record: Dict[str, Optional[str]], path: str, table=None):
+    add_records_to_database([record], path, table=table)
+
+
+def add_records_to_database(
+    records: Iterable[Dict[str, Optional[str]]], path: str, table=None
 ) -> None:
-    badge_names_for_current_user_level = badge_referential.loc[
-        (badge_referential["levelName"] == user.level_name)
-        & (badge_referential["hive"] == user.hive)
-    ]["badgeName"]
-    record = {
-        "username": user.username,
-        "hive": user.hive,
-        "levelName": user.level_name,
-    }
-    for badge in badge_names_for_current_user_level:
-        record["badgeName"] = badge
-        add_record_to_database(record, path, table="user_referential")
-
-
-def add_record_to_database(record: Dict[str, str], path: str, table=None):
+    """
+    Appends all the records to the end of the table in a single write, whatever
+    the number of records.
+    """
     if table is None:
         raise Exception("You forgot to pass table in the parameter.")
-    file_path = f"{path}/{table}.csv"
-
-    # Appending to the end of the csv file.
-    # We want to automatically get the headers from the CSV file
-    header = None
-    with open(file_path, "r") as f:
-        reader = csv.reader(f)
-        header = next(reader)
-    # add row to CSV file
-    with open(file_path, "a", newline="") as f:
-        writer = csv.DictWriter(f, fieldnames=header)
-        writer.writerow(record)
+    with stage("append_records"):
+        get_storage(path).append_records(table, add_timestamps(table, records))
 
 
 if __name__ == "__main__":
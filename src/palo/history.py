@@ -0,0 +1,235 @@
+import csv
+import json
+import os
+import shutil
+from datetime import datetime, time, timezone
+from typing import BinaryIO, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from palo.engine import SalaryEngine
+from palo.instrumentation import count
+from palo.snapshot import UserState, get_log_digest, write_json
+from palo.storage import CsvStorage, get_storage
+
+# State of the users as of any event of user_referential. The sequence number
+# of an event is its position in the log, starting at 1, and its timestamp the
+# time it was appended. Every CHECKPOINT_INTERVAL events a checkpoint is stored
+# next to the log, together with the byte offset of the log it was folded up to
+# and the digest of the log up to that offset. A checkpoint only holds the
+# users changed by the events since the previous one: their latest level and
+# the badges they earned. The checkpoints take as much space as the log at
+# most, instead of a copy of every user each.
+# A query folds the checkpoints up to the last one before the event asked for
+# and only replays the events after it, up to that event. Checkpoints whose
+# digest doesn't match the log, e.g. after it was regenerated, are dropped.
+# Checkpoints written before deltas were stored hold every user, which folds
+# the same.
+
+HISTORY_DIR_NAME = ".palo_history"
+INDEX_FILE_NAME = "index.json"
+CHECKPOINT_INTERVAL = 10_000
+
+
+class Checkpoint(NamedTuple):
+    # Number of events folded, offset of the log after the last one, the
+    # latest timestamp among them and the digest of the log up to offset.
+    sequence: int
+    offset: int
+    timestamp: str
+    # Empty for checkpoints written before digests were stored.
+    digest: str = ""
+
+
+# The start of the log, before the first event.
+START = Checkpoint(0, 0, "")
+
+
+class History:
+    def __init__(
+        self, data_path: str, checkpoint_interval: int = CHECKPOINT_INTERVAL
+    ) -> None:
+        if not isinstance(get_storage(data_path), CsvStorage):
+            raise Exception(
+                "Point in time queries are only supported for CSV data, "
+                f"{data_path} was converted to another storage."
+            )
+        self.log_path = f"{data_path}/user_referential.csv"
+        self.directory = f"{data_path}/{HISTORY_DIR_NAME}"
+        self.checkpoint_interval = checkpoint_interval
+        self.checkpoints: List[Checkpoint] = []
+        index_path = f"{self.directory}/{INDEX_FILE_NAME}"
+        if os.path.exists(index_path):
+            with open(index_path, "r") as f:
+                self.checkpoints = [
+                    Checkpoint(*checkpoint) for checkpoint in json.load(f)
+                ]
+        self.validate()
+
+    def validate(self) -> None:
+        """
+        Drops the checkpoints which weren't folded from the current log. The
+        log is append only: when the last checkpoint matches, every checkpoint
+        does.
+        """
+        if not self.checkpoints:
+            return
+        with open(self.log_path, "rb") as f:
+            if is_valid(self.checkpoints[-1], f):
+                return
+            valid = 0
+            while valid < len(self.checkpoints) and is_valid(
+                self.checkpoints[valid], f
+            ):
+                valid += 1
+        if not valid:
+            # The log was regenerated, the checkpoints are stale.
+            shutil.rmtree(self.directory)
+            self.checkpoints = []
+            return
+        del self.checkpoints[valid:]
+        write_json(f"{self.directory}/{INDEX_FILE_NAME}", self.checkpoints)
+
+    def get_state(
+        self, sequence: Optional[int] = None, timestamp: Optional[str] = None
+    ) -> Tuple[UserState, int]:
+        """
+        State of the users after the event `sequence`, or after the last event
+        appended at or before `timestamp`, and the sequence number of the last
+        event folded. Rows without a timestamp are older than any timestamp.
+        Without either, the state after the last event. Checkpoints are added
+        for the events folded past the last one.
+        """
+        checkpoint = START
+        for candidate in self.checkpoints:
+            if sequence is not None and candidate.sequence > sequence:
+                break
+            if timestamp is not None and candidate.timestamp > timestamp:
+                break
+            checkpoint = candidate
+
+        state = self.load_checkpoints(checkpoint)
+        # Changes since the last checkpoint, stored as the next one.
+        delta: Optional[UserState] = None
+        if checkpoint == (self.checkpoints[-1] if self.checkpoints else START):
+            delta = UserState()
+        last = checkpoint.sequence
+        latest = checkpoint.timestamp
+        for row, offset in self.replay(checkpoint):
+            if sequence is not None and last == sequence:
+                break
+            row_timestamp = get_row_timestamp(row)
+            if timestamp is not None and row_timestamp > timestamp:
+                break
+            rows = [get_row_tuple(row)]
+            state.apply(rows)
+            last += 1
+            if delta is None:
+                continue
+            delta.apply(rows)
+            latest = max(latest, row_timestamp)
+            if last % self.checkpoint_interval == 0:
+                with open(self.log_path, "rb") as f:
+                    digest = get_log_digest(f, offset)
+                self.add_checkpoint(delta, Checkpoint(last, offset, latest, digest))
+                delta = UserState()
+        return state, last
+
+    def update(self) -> None:
+        """
+        Adds a checkpoint every checkpoint_interval events appended since the
+        last one.
+        """
+        self.get_state()
+
+    def replay(self, checkpoint: Checkpoint) -> Iterator[Tuple[Dict[str, str], int]]:
+        """
+        Yields the rows of the log after the checkpoint, with the offset of
+        the end of their record. A quoted value may span several lines, the
+        offset is the one of the last line read by the csv reader. The last
+        line is only read once complete: a writer may be in the middle of
+        appending it.
+        """
+        count("files_opened")
+        with open(self.log_path, "rb") as f:
+            header_line = f.readline()
+            header = next(csv.reader([header_line.decode()]))
+            offset = checkpoint.offset or len(header_line)
+            f.seek(offset)
+
+            def read_lines() -> Iterator[str]:
+                nonlocal offset
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        return
+                    offset += len(line)
+                    yield line.decode()
+
+            for row in csv.DictReader(read_lines(), fieldnames=header):
+                count("rows_scanned")
+                yield row, offset
+
+    def load_checkpoints(self, checkpoint: Checkpoint) -> UserState:
+        """
+        State of the users as of the checkpoint: the changes stored in the
+        checkpoints up to it, folded in order.
+        """
+        state = UserState()
+        for candidate in self.checkpoints:
+            if candidate.sequence > checkpoint.sequence:
+                break
+            with open(self.get_checkpoint_path(candidate), "r") as f:
+                state.merge_users(json.load(f))
+        return state
+
+    def add_checkpoint(self, delta: UserState, checkpoint: Checkpoint) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        write_json(self.get_checkpoint_path(checkpoint), delta.get_users())
+        self.checkpoints.append(checkpoint)
+        write_json(f"{self.directory}/{INDEX_FILE_NAME}", self.checkpoints)
+
+    def get_checkpoint_path(self, checkpoint: Checkpoint) -> str:
+        return f"{self.directory}/checkpoint-{checkpoint.sequence:012d}.json"
+
+
+def is_valid(checkpoint: Checkpoint, f: BinaryIO) -> bool:
+    return checkpoint.digest == get_log_digest(f, checkpoint.offset)
+
+
+def get_row_tuple(row: Dict[str, str]) -> Tuple[str, str, str, str]:
+    return row["username"], row["hive"], row["levelName"], row["badgeName"]
+
+
+def get_row_timestamp(row: Dict[str, str]) -> str:
+    # Logs created before timestamps were recorded don't have the column.
+    return row.get("timestamp") or ""
+
+
+def parse_as_of(as_of: str) -> str:
+    """
+    Converts an ISO 8601 date or time to the format of the timestamps of
+    user_referential. A date means the end of that day, times without a time
+    zone are in UTC.
+    """
+    value = datetime.fromisoformat(as_of)
+    if len(as_of) <= len("YYYY-MM-DD"):
+        value = datetime.combine(value.date(), time.max)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc).isoformat(timespec="microseconds")
+
+
+def load_engine_as_of(
+    data_path: str, sequence: Optional[int] = None, timestamp: Optional[str] = None
+) -> SalaryEngine:
+    """
+    Builds a SalaryEngine from the state of the users after the event
+    `sequence` or at `timestamp`, see History.get_state.
+    """
+    state, _ = History(data_path).get_state(sequence=sequence, timestamp=timestamp)
+    storage = get_storage(data_path)
+    return SalaryEngine.from_snapshot(
+        storage.fetch_columns(
+            "salary_grid", columns=["hive", "levelName", "baseSalary"]
+        ),
+        state,
+        storage.fetch_columns("badge_referential"),
+    )
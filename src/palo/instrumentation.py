@@ -0,0 +1,143 @@
+import sys
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Callable, ContextManager, Dict, Iterator, List, Optional
+
+# Stage timers and counters for the CLIs. Code is instrumented with
+# `with stage("fetch_data"):` and `count("rows_scanned", n)`. Nothing is
+# recorded unless a session is running, i.e. the command was given --profile
+# or a hook was added with add_hook: both are then a single global lookup.
+
+PROFILE_MODES = ["summary", "json", "cprofile"]
+
+
+class Metrics:
+    def __init__(self, command: str) -> None:
+        self.command = command
+        # Seconds spent in each stage. Stages may be nested, in which case the
+        # time of the inner stage is also counted in the outer one.
+        self.timings: Dict[str, float] = {}
+        self.calls: Dict[str, int] = {}
+        self.counters: Dict[str, int] = {}
+
+    def add_time(self, name: str, seconds: float) -> None:
+        self.timings[name] = self.timings.get(name, 0.0) + seconds
+        self.calls[name] = self.calls.get(name, 0) + 1
+
+    def as_dict(self) -> Dict[str, object]:
+        return {
+            "command": self.command,
+            "timings": self.timings,
+            "calls": self.calls,
+            "counters": self.counters,
+        }
+
+    def format(self) -> str:
+        lines = [f"{self.command}:"]
+        for name, seconds in self.timings.items():
+            lines.append(
+                f"  {name:<24}{seconds * 1000:>12.3f} ms{self.calls[name]:>8} calls"
+            )
+        for name, value in self.counters.items():
+            lines.append(f"  {name:<24}{value:>12}")
+        return "\n".join(lines)
+
+
+Hook = Callable[[Metrics], None]
+
+_hooks: List[Hook] = []
+# Metrics of the running session, None when nothing is recorded.
+_metrics: Optional[Metrics] = None
+_null_context = nullcontext()
+
+
+def add_hook(hook: Hook) -> None:
+    """
+    Calls hook with the Metrics of every session once it ends, e.g. to forward
+    them to a metrics collector. Sessions are recorded even without --profile
+    as long as a hook is registered.
+    """
+    _hooks.append(hook)
+
+
+def remove_hook(hook: Hook) -> None:
+    _hooks.remove(hook)
+
+
+def stage(name: str) -> ContextManager[None]:
+    if _metrics is None:
+        return _null_context
+    return _timed(_metrics, name)
+
+
+@contextmanager
+def _timed(metrics: Metrics, name: str) -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.add_time(name, time.perf_counter() - start)
+
+
+def count(name: str, value: int = 1) -> None:
+    if _metrics is not None:
+        _metrics.counters[name] = _metrics.counters.get(name, 0) + value
+
+
+@contextmanager
+def session(
+    command: str, mode: Optional[str] = None, output: Optional[str] = None
+) -> Iterator[Optional[Metrics]]:
+    """
+    Records the stages and counters of a command. Once it ends the metrics are
+    passed to the hooks and reported on stderr, or written to output, as:
+    - summary: one line per stage and counter.
+    - json: Metrics.as_dict.
+    - cprofile: the 30 most expensive functions, or a pstats dump to output.
+    """
+    global _metrics
+    if mode is None and not _hooks:
+        yield None
+        return
+
+    metrics = _metrics = Metrics(command)
+    profiler = None
+    if mode == "cprofile":
+        import cProfile
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+    try:
+        with _timed(metrics, "total"):
+            yield metrics
+    finally:
+        if profiler is not None:
+            profiler.disable()
+        _metrics = None
+        for hook in list(_hooks):
+            hook(metrics)
+        if mode is not None:
+            report(metrics, mode, output, profiler)
+
+
+def report(metrics: Metrics, mode: str, output: Optional[str], profiler) -> None:  # type: ignore[no-untyped-def]
+    if mode == "cprofile" and output is not None:
+        profiler.dump_stats(output)
+        return
+    if mode == "cprofile":
+        import pstats
+
+        stats = pstats.Stats(profiler, stream=sys.stderr)
+        stats.sort_stats("cumulative").print_stats(30)
+        return
+    if mode == "json":
+        import json
+
+        text = json.dumps(metrics.as_dict(), indent=2)
+    else:
+        text = metrics.format()
+    if output is None:
+        print(text, file=sys.stderr)
+    else:
+        with open(output, "w") as f:
+            f.write(text + "\n")
@@ -1,28 +1,75 @@
+from __future__ import annotations
+
+import csv
+import os
+import sys
 import click
-from typing import List, Optional
-import pandas as pd
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional
+
+from palo.constants import LEVEL_NAMES, LEVEL_RANKS
+from palo.engine import SalaryEngine, Table, load_engine
+from palo.instrumentation import PROFILE_MODES, session, stage
+from palo.plan import SalaryPlan
+from palo.storage import TABLE_COLUMNS, ShardedCsvStorage, get_storage
+from palo.streaming import iter_salaries
 
-from palo.data_models import User
+# pandas and pydantic are slow to import. They're only imported by the
+# functions which need them, so that looking up a single user doesn't pay for
+# them.
+if TYPE_CHECKING:
+    import pandas as pd
+
+    from palo.data_models import User
 
 # Assumptions:
 # You cannot have duplicate badge names
 # A user can get multiple badges at the same time.
 
-LEVEL_NAMES = ["Junior", "Mid", "Senior", "Team_Lead", "Director"]
-
 
 @click.command()
 @click.option(
     "--username",
     type=str,
     help="User for whom you want to calculate salary for.",
-    required=True,
 )
 @click.option(
     "--hive",
-    type=click.Choice(["tech", "design"]),
-    help="Which hive are you part of? Currently we support only tech and design.",
-    required=True,
+    type=str,
+    help="Which hive are you part of? It must be a hive of the salary grid.",
+)
+@click.option(
+    "--all",
+    "all_users",
+    is_flag=True,
+    default=False,
+    help="Calculate salary of every user in one pass and print it as CSV.",
+)
+@click.option(
+    "--workers",
+    type=click.IntRange(min=1),
+    default=1,
+    help="Number of processes used to calculate salaries with --all.",
+)
+@click.option(
+    "--chunk_size",
+    type=click.IntRange(min=1),
+    default=None,
+    help="With --all, read user_referential this many rows at a time so that "
+    "memory depends on the number of users, not on the size of the log.",
+)
+@click.option(
+    "--as_of_event",
+    type=click.IntRange(min=0),
+    default=None,
+    help="Calculate the salary as it was right after this event of "
+    "user_referential, the first event being 1.",
+)
+@click.option(
+    "--as_of",
+    type=str,
+    default=None,
+    help="Calculate the salary as it was at this ISO 8601 time, or at the end "
+    "of this day, e.g. 2024-05-31. Times without a time zone are in UTC.",
 )
 @click.option(
     "--data_path",
@@ -30,21 +77,134 @@ LEVEL_NAMES = ["Junior", "Mid", "Senior", "Team_Lead", "Director"]
     default="data",
     help="Where is the data stored? What's the path?",
 )
-def main(username, hive, data_path):
-    badge_referential = fetch_data(f"{data_path}/badge_referential.csv")
-    user_referential = fetch_data(f"{data_path}/user_referential.csv")
-    salary_grid = fetch_data(f"{data_path}/salary_grid.csv")
+@click.option(
+    "--profile",
+    type=click.Choice(PROFILE_MODES),
+    is_flag=False,
+    flag_value="summary",
+    default=None,
+    help="Print the time spent in each stage on stderr (summary, the default), "
+    "the same as JSON, or the cProfile statistics.",
+)
+@click.option(
+    "--profile_output",
+    type=click.Path(dir_okay=False, writable=True),
+    default=None,
+    help="Write the --profile report to this file instead of stderr. cProfile "
+    "statistics are dumped in the pstats format.",
+)
+def main(
+    username,
+    hive,
+    all_users,
+    workers,
+    chunk_size,
+    as_of_event,
+    as_of,
+    data_path,
+    profile,
+    profile_output,
+):
+    with session("palo.main", profile, profile_output):
+        print_salaries(
+            username,
+            hive,
+            all_users,
+            workers,
+            chunk_size,
+            as_of_event,
+            as_of,
+            data_path,
+        )
 
-    # Ensure all the inputs are of correct data types
-    user = User(
-        username=username, hive=hive, level_name=None, badge_names=None
-    )
-    # Validate hive name exists in our database
-    validate_hive(salary_grid, user.hive)
-    # validate username exists in our database
-    validate_username(user_referential, user.username)
 
-    salary = calculate_salary(user, salary_grid, user_referential, badge_referential)
+def print_salaries(
+    username: Optional[str],
+    hive: Optional[str],
+    all_users: bool,
+    workers: int,
+    chunk_size: Optional[int],
+    as_of_event: Optional[int],
+    as_of: Optional[str],
+    data_path: str,
+) -> None:
+    if all_users and (as_of_event is not None or as_of is not None):
+        raise click.UsageError("--as_of and --as_of_event can't be used with --all.")
+    if all_users and chunk_size is not None:
+        if workers > 1:
+            raise click.UsageError("--chunk_size can't be used with --workers.")
+        writer = None
+        for record in iter_salaries(data_path, chunk_size, hive=hive):
+            if writer is None:
+                writer = csv.DictWriter(sys.stdout, fieldnames=list(record))
+                writer.writeheader()
+            writer.writerow(record)
+        return
+
+    if all_users:
+        badge_referential = fetch_data(f"{data_path}/badge_referential.csv")
+        salary_grid = fetch_data(
+            f"{data_path}/salary_grid.csv", columns=["hive", "levelName", "baseSalary"]
+        )
+        if hive is not None:
+            with stage("validate"):
+                validate_hive(salary_grid, hive)
+        # Imported here because palo.payroll depends on this module.
+        from palo.payroll import (
+            calculate_salaries_in_parallel,
+            calculate_salaries_of_shards,
+        )
+
+        storage = get_storage(data_path)
+        if workers > 1 and isinstance(storage, ShardedCsvStorage):
+            # The workers read the shards themselves.
+            with stage("calculate_salaries"):
+                salaries = calculate_salaries_of_shards(
+                    storage, salary_grid, badge_referential, workers, hive=hive
+                )
+        else:
+            user_referential = fetch_data(
+                f"{data_path}/user_referential.csv",
+                where=None if hive is None else {"hive": hive},
+            )
+            with stage("calculate_salaries"):
+                salaries = calculate_salaries_in_parallel(
+                    salary_grid, user_referential, badge_referential, workers
+                )
+        with stage("write_output"):
+            salaries.to_csv(sys.stdout, index=False)
+        return
+
+    if username is None or hive is None:
+        raise click.UsageError("--username and --hive are required without --all.")
+
+    with stage("parse_arguments"):
+        from palo.data_models import User
+
+        # Ensure all the inputs are of correct data types
+        user = User(username=username, hive=hive, level_name=None, badge_names=None)
+    if as_of_event is not None or as_of is not None:
+        from palo.history import load_engine_as_of, parse_as_of
+
+        try:
+            timestamp = None if as_of is None else parse_as_of(as_of)
+        except ValueError as e:
+            raise click.BadParameter(str(e), param_hint="--as_of")
+        with stage("load_engine"):
+            engine = load_engine_as_of(
+                data_path, sequence=as_of_event, timestamp=timestamp
+            )
+    else:
+        engine = load_engine(data_path, username=user.username, hive=user.hive)
+    with stage("validate"):
+        # Validate hive name exists in our database
+        engine.validate_hive(user.hive)
+        # validate username exists in our database
+        engine.validate_username(user.username)
+
+    with stage("calculate_salary"):
+        breakdown = engine.get_salary_breakdown(user)
+    print(*breakdown)
 
 
 def calculate_salary(
@@ -52,43 +212,187 @@ def calculate_salary(
     salary_grid: pd.DataFrame,
     user_referential: pd.DataFrame,
     badge_referential: pd.DataFrame,
+    plan: Optional[SalaryPlan] = None,
 ) -> float:
-    level_name = get_current_level(user, user_referential)
-    base_salary = get_base_salary(level_name, salary_grid, user)
+    """
+    Salary of the user, priced by a SalaryEngine over the rows of the user.
+    Prints the salary breakdown, see SalaryEngine.get_salary_breakdown.
+    """
+    engine = get_user_engine(
+        user, salary_grid, user_referential, badge_referential, plan=plan
+    )
+    engine.validate_user(user)
+    breakdown = engine.get_salary_breakdown(user)
+    print(*breakdown)
+    return breakdown[0]
 
-    total_badge_value_for_current_level = get_badge_value(
-        level_name, salary_grid, badge_referential, user_referential, user, total=True
+
+def calculate_salaries(
+    users: Optional[Iterable[User]],
+    salary_grid: pd.DataFrame,
+    user_referential: pd.DataFrame,
+    badge_referential: pd.DataFrame,
+    progress: bool = False,
+) -> pd.DataFrame:
+    """
+    Vectorized counterpart of calculate_salary. Prices every (username, hive)
+    pair in one pass over the referentials instead of re-filtering them per
+    user. When users is None, every user found in user_referential is priced.
+    With progress, the share of the badges of the current and next levels the
+    user earned is added as badgeCompletion and nextLevelBadgeCompletion, NaN
+    for levels without badges.
+    """
+    import pandas as pd
+
+    states = (
+        user_referential.groupby(["username", "hive"], sort=False, observed=True)[
+            "levelName"
+        ]
+        .last()
+        .reset_index()
+    )
+    if users is not None:
+        wanted = pd.DataFrame(
+            [(user.username, user.hive) for user in users],
+            columns=["username", "hive"],
+        )
+        states = wanted.merge(states, on=["username", "hive"], how="left")
+        for username in states.loc[states["levelName"].isna(), "username"]:
+            raise Exception(
+                f"username {username} not found in the database."
+                "Either change the username argument or add it to the database."
+            )
+
+    plan = get_badge_unit_values(salary_grid, badge_referential)
+    counts = get_badge_counts(user_referential, badge_referential)
+
+    states["rank"] = states["levelName"].map(LEVEL_RANKS).astype(int)
+    states["nextLevelName"] = states["rank"].map(
+        lambda rank: LEVEL_NAMES[rank + 1] if rank + 1 < len(LEVEL_NAMES) else None
     )
-    badge_value_from_current_level = get_badge_value(
-        level_name, salary_grid, badge_referential, user_referential, user, total=False
+
+    current = states.merge(plan, on=["hive", "levelName"], how="left").merge(
+        counts, on=["username", "hive", "levelName"], how="left"
     )
-    yet_to_complete_badge_value = (
-        total_badge_value_for_current_level - badge_value_from_current_level
+    next_level = (
+        states[["username", "hive", "nextLevelName"]]
+        .rename(columns={"nextLevelName": "levelName"})
+        .merge(plan, on=["hive", "levelName"], how="left")
+        .merge(counts, on=["username", "hive", "levelName"], how="left")
+        .fillna({"unitBronze": 0.0, "unitSilver": 0.0, "bronze": 0, "silver": 0})
     )
+    current = current.fillna({"bronze": 0, "silver": 0})
 
-    badge_value_from_next_level = get_badge_value_for_next_level(
-        level_name, salary_grid, badge_referential, user_referential, user
+    earned_current = (
+        current["bronze"] * current["unitBronze"]
+        + current["silver"] * current["unitSilver"]
+    )
+    yet_to_complete = current["totalBadgeValue"] - earned_current
+    from_next_level = (
+        next_level["bronze"] * next_level["unitBronze"]
+        + next_level["silver"] * next_level["unitSilver"]
     )
 
-    salary = base_salary - yet_to_complete_badge_value + badge_value_from_next_level
-    print(salary, base_salary, yet_to_complete_badge_value, badge_value_from_next_level)
-    return salary
+    salaries = pd.DataFrame(
+        {
+            "username": current["username"],
+            "hive": current["hive"],
+            "levelName": current["levelName"],
+            "salary": current["baseSalary"] - yet_to_complete + from_next_level,
+            "baseSalary": current["baseSalary"].astype(float),
+            "yetToCompleteBadgeValue": yet_to_complete,
+            "nextLevelBadgeValue": from_next_level,
+        }
+    )
+    if progress:
+        for column, level in [
+            ("badgeCompletion", current),
+            ("nextLevelBadgeCompletion", next_level),
+        ]:
+            total = level["totalBronze"].fillna(0) + level["totalSilver"].fillna(0)
+            salaries[column] = ((level["bronze"] + level["silver"]) / total).where(
+                total > 0
+            )
+    return salaries
+
+
+def get_badge_unit_values(
+    salary_grid: pd.DataFrame, badge_referential: pd.DataFrame
+) -> pd.DataFrame:
+    """
+    One row per (hive, levelName) with the base salary, the total badge value
+    of the level, the number of bronze and silver badges and the value of a
+    single bronze and silver badge, see SalaryPlan.
+    """
+    return SalaryPlan(salary_grid, badge_referential).to_frame()
+
+
+def get_badge_counts(
+    user_referential: pd.DataFrame, badge_referential: pd.DataFrame
+) -> pd.DataFrame:
+    """
+    Number of distinct bronze and silver badges each user has earned, per
+    level the badges belong to.
+    """
+    earned = user_referential.loc[
+        user_referential["badgeName"].notna(), ["username", "hive", "badgeName"]
+    ].drop_duplicates()
+    earned = earned.merge(
+        badge_referential[["badgeName", "hive", "levelName", "badgeType"]],
+        on=["hive", "badgeName"],
+    )
+    return (
+        earned.groupby(["username", "hive", "levelName", "badgeType"], observed=True)
+        .size()
+        .unstack("badgeType")
+        .reindex(columns=["bronze", "silver"])
+        .fillna(0)
+        .reset_index()
+    )
+
+
+def get_user_engine(
+    user: Optional[User],
+    salary_grid: Optional[pd.DataFrame] = None,
+    user_referential: Optional[pd.DataFrame] = None,
+    badge_referential: Optional[pd.DataFrame] = None,
+    plan: Optional[SalaryPlan] = None,
+) -> SalaryEngine:
+    """
+    SalaryEngine over the rows of the user, for the functions below which
+    look up a single user in DataFrames. The tables not given are empty.
+    """
+    tables: Dict[str, Table] = {
+        table: {column: [] for column in TABLE_COLUMNS[table]}
+        for table in ["salary_grid", "user_referential", "badge_referential"]
+    }
+    if salary_grid is not None:
+        tables["salary_grid"] = salary_grid
+    if badge_referential is not None:
+        tables["badge_referential"] = badge_referential
+    if user_referential is not None and user is not None:
+        tables["user_referential"] = user_referential.loc[
+            (user_referential["username"] == user.username)
+            & (user_referential["hive"] == user.hive)
+        ]
+    return SalaryEngine(
+        tables["salary_grid"],
+        tables["user_referential"],
+        tables["badge_referential"],
+        plan=plan,
+    )
 
 
 def get_current_level(user: User, user_referential: pd.DataFrame) -> str:
-    current_user_level = user_referential.loc[
-        (user_referential["username"] == user.username)
-        & (user_referential["hive"] == user.hive)
-    ]["levelName"].values[-1]
-    assert current_user_level is not None
-    return current_user_level
+    return get_user_engine(user, user_referential=user_referential).get_current_level(
+        user
+    )
 
 
 def get_base_salary(level_name: str, salary_grid: pd.DataFrame, user: User) -> float:
-    base_salary = salary_grid.loc[
-        (salary_grid["levelName"] == level_name) & (salary_grid["hive"] == user.hive)
-    ]["baseSalary"].values[0]
-    return float(base_salary)
+    return get_user_engine(user, salary_grid=salary_grid).get_base_salary(
+        level_name, user.hive
+    )
 
 
 def get_badge_value(
@@ -98,36 +402,12 @@ def get_badge_value(
     user_referential: pd.DataFrame,
     user: User,
     total: bool = False,
+    plan: Optional[SalaryPlan] = None,
 ) -> float:
-    base_salary_current_level = get_base_salary(level_name, salary_grid, user)
-    previous_level_name = LEVEL_NAMES[LEVEL_NAMES.index(level_name) - 1]
-    base_salary_previous_level = get_base_salary(previous_level_name, salary_grid, user)
-
-    salary_differential = base_salary_current_level - base_salary_previous_level
-    if total:
-        return 0.5 * salary_differential
-
-    total_bronze_for_current_level = len(
-        get_all_badges(level_name, user.hive, "bronze", badge_referential)
-    )
-    value_bronze = ((salary_differential * 0.5) / total_bronze_for_current_level) * 0.4
-
-    total_silver_for_current_level = len(
-        get_all_badges(level_name, user.hive, "silver", badge_referential)
-    )
-    value_silver = ((salary_differential * 0.5) / total_silver_for_current_level) * 0.6
-
-    bronze_earned_by_user = get_badges_earned(
-        level_name, user, "bronze", badge_referential, user_referential
-    )
-    silver_earned_by_user = get_badges_earned(
-        level_name, user, "silver", badge_referential, user_referential
-    )
-
-    return (
-        len(bronze_earned_by_user) * value_bronze
-        + len(silver_earned_by_user) * value_silver
+    engine = get_user_engine(
+        user, salary_grid, user_referential, badge_referential, plan=plan
     )
+    return engine.get_badge_value(level_name, user, total=total)
 
 
 def get_badge_value_for_next_level(
@@ -135,23 +415,13 @@ def get_badge_value_for_next_level(
     salary_grid: pd.DataFrame,
     badge_referential: pd.DataFrame,
     user_referential: pd.DataFrame,
-    user: Optional[User] = None,
+    user: User,
+    plan: Optional[SalaryPlan] = None,
 ) -> float:
-    # Adding 1 to counter zero indexing
-    rank = LEVEL_NAMES.index(level_name) + 1
-    # There are no badges to receive after Level 5. A user at Level 5 cannot receive any
-    # more badges from Level 6 because Level 6 doesn't exist.
-    if rank < 5:
-        # Removing 1 because python follows zero-indexing which we changed before
-        rank = rank - 1
-        # Next rank will be previous rank + 1
-        next_level_name = LEVEL_NAMES[rank + 1]
-        badge_value_from_next_level = get_badge_value(
-            next_level_name, salary_grid, badge_referential, user_referential, user
-        )
-    else:
-        badge_value_from_next_level = 0.0
-    return badge_value_from_next_level
+    engine = get_user_engine(
+        user, salary_grid, user_referential, badge_referential, plan=plan
+    )
+    return engine.get_badge_value_for_next_level(level_name, user)
 
 
 def get_all_badges(
@@ -160,12 +430,8 @@ def get_all_badges(
     badge_type: str,
     badge_referential: pd.DataFrame,
 ) -> List[str]:
-    badges_in_level = badge_referential.loc[
-        (badge_referential["hive"] == hive)
-        & (badge_referential["levelName"] == level_name)
-        & (badge_referential["badgeType"] == badge_type)
-    ]["badgeName"].values
-    return [x for x in badges_in_level]
+    engine = get_user_engine(None, badge_referential=badge_referential)
+    return list(engine.get_all_badges(level_name, hive, badge_type))
 
 
 def get_badges_earned(
@@ -175,18 +441,28 @@ def get_badges_earned(
     badge_referential: pd.DataFrame,
     user_referential: pd.DataFrame,
 ) -> List[str]:
-    badges_earned = user_referential.loc[
-        (user_referential["username"] == user.username)
-        & (user_referential["hive"] == user.hive)
-    ]["badgeName"].values
-    badges_in_level = get_all_badges(
-        level_name, user.hive, badge_type, badge_referential
+    engine = get_user_engine(
+        user,
+        user_referential=user_referential,
+        badge_referential=badge_referential,
     )
-    return [x for x in badges_in_level if x in badges_earned]
-
-
-def fetch_data(path: str) -> pd.DataFrame:
-    return pd.read_csv(path)
+    return engine.get_badges_earned(level_name, user, badge_type)
+
+
+def fetch_data(
+    path: str,
+    where: Optional[Dict[str, str]] = None,
+    columns: Optional[List[str]] = None,
+) -> pd.DataFrame:
+    """
+    Reads the table stored at path, e.g. data/user_referential.csv, through the
+    storage backend configured for its directory. Only the rows matching
+    `where` and the given `columns` are returned.
+    """
+    data_path, file_name = os.path.split(path)
+    table, _ = os.path.splitext(file_name)
+    with stage("fetch_data"):
+        return get_storage(data_path).fetch_table(table, where=where, columns=columns)
 
 
 def validate_hive(salary_grid: pd.DataFrame, hive: str) -> None:
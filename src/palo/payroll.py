@@ -0,0 +1,117 @@
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Tuple
+
+import pandas as pd
+
+from palo.main import calculate_salaries
+from palo.storage import CsvStorage, ShardedCsvStorage
+
+# Payroll over every user, split across processes. user_referential is split
+# into partitions by hive and by a hash of the username, so all the rows of a
+# user land in the same partition and partitions can be priced independently.
+# Each worker receives the small salary_grid and badge_referential tables once,
+# when it starts, and then only the partitions it prices.
+#
+# With a ShardedCsvStorage the shards are the partitions and each worker reads
+# the shards it prices. Otherwise the whole table is loaded by the parent and
+# its partitions pickled to the workers, which bounds the speedup: only the
+# pricing itself runs in parallel.
+
+# Set in each worker by init_worker.
+_catalog: Optional[Tuple[pd.DataFrame, pd.DataFrame]] = None
+
+
+def calculate_salaries_in_parallel(
+    salary_grid: pd.DataFrame,
+    user_referential: pd.DataFrame,
+    badge_referential: pd.DataFrame,
+    workers: int,
+) -> pd.DataFrame:
+    """
+    Same result, in the same order, as calculate_salaries(None, ...) but priced
+    by `workers` processes.
+    """
+    partitions = split_user_referential(user_referential, workers)
+    if workers <= 1 or len(partitions) <= 1:
+        return calculate_salaries(
+            None, salary_grid, user_referential, badge_referential
+        )
+
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=init_worker,
+        initargs=(salary_grid, badge_referential),
+    ) as executor:
+        salaries = pd.concat(
+            executor.map(price_partition, partitions), ignore_index=True
+        )
+
+    # Put users back in the order they first appear in the log, like
+    # calculate_salaries does.
+    order = user_referential[["username", "hive"]].drop_duplicates()
+    return order.merge(salaries, on=["username", "hive"])[list(salaries.columns)]
+
+
+def calculate_salaries_of_shards(
+    storage: ShardedCsvStorage,
+    salary_grid: pd.DataFrame,
+    badge_referential: pd.DataFrame,
+    workers: int,
+    hive: Optional[str] = None,
+) -> pd.DataFrame:
+    """
+    Same result, in the same order, as calculate_salaries(None, ...) over the
+    user_referential of the storage, or of a hive of it, priced by `workers`
+    processes which read the shards they price.
+    """
+    where = {} if hive is None else {"hive": hive}
+    shards = [(shard.data_path, name) for shard, name in storage.get_shards(where)]
+    if workers <= 1 or len(shards) <= 1:
+        return calculate_salaries(
+            None,
+            salary_grid,
+            storage.fetch_table("user_referential", where=where),
+            badge_referential,
+        )
+
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=init_worker,
+        initargs=(salary_grid, badge_referential),
+    ) as executor:
+        # All the rows of a user are in a single shard, which are read one
+        # after the other by ShardedCsvStorage.
+        salaries = pd.concat(executor.map(price_shard, shards), ignore_index=True)
+    # The usernames of each shard have different categories.
+    return salaries.astype({"username": "category"})
+
+
+def split_user_referential(
+    user_referential: pd.DataFrame, number_partitions: int
+) -> List[pd.DataFrame]:
+    # hash_array is stable across processes and runs, unlike hash().
+    shard = pd.util.hash_array(user_referential["username"].to_numpy(dtype=object)) % (
+        number_partitions
+    )
+    return [
+        partition
+        for _, partition in user_referential.groupby(
+            [user_referential["hive"], shard], sort=True, observed=True
+        )
+    ]
+
+
+def init_worker(salary_grid: pd.DataFrame, badge_referential: pd.DataFrame) -> None:
+    global _catalog
+    _catalog = (salary_grid, badge_referential)
+
+
+def price_partition(user_referential: pd.DataFrame) -> pd.DataFrame:
+    assert _catalog is not None
+    salary_grid, badge_referential = _catalog
+    return calculate_salaries(None, salary_grid, user_referential, badge_referential)
+
+
+def price_shard(shard: Tuple[str, str]) -> pd.DataFrame:
+    directory, name = shard
+    return price_partition(CsvStorage(directory).fetch_table(name))
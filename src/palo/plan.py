@@ -0,0 +1,174 @@
+from __future__ import annotations
+
+from collections import Counter
+from typing import TYPE_CHECKING, Dict, Mapping, NamedTuple, Optional, Tuple, Union
+
+from palo.constants import (
+    BADGE_TYPE_WEIGHTS,
+    BADGE_VALUE_SHARE,
+    LEVEL_NAMES,
+    LEVEL_RANKS,
+)
+from palo.instrumentation import count, stage
+from palo.storage import Columns, Storage
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# The part of a salary which doesn't depend on the user. Per (hive, levelName),
+# the base salary, the value of the badges of the level and the value of a
+# single bronze and silver badge only depend on salary_grid and
+# badge_referential. They're compiled once into a SalaryPlan, pricing a user is
+# then the number of badges they earned times the unit values.
+
+Table = Union["pd.DataFrame", Columns]
+
+# Tables a SalaryPlan is compiled from, the plan is compiled again when one of
+# them changes.
+PLAN_TABLES = ("salary_grid", "badge_referential")
+
+
+class LevelPlan(NamedTuple):
+    base_salary: float
+    # Base salary of the level minus the one of the previous level, 0 for the
+    # first level or when the previous level is not in the salary grid.
+    salary_differential: float
+    total_badge_value: float
+    total_bronze: int
+    total_silver: int
+    # 0 when the level has no badge of that type.
+    unit_bronze: float
+    unit_silver: float
+
+    def get_badge_value(self, bronze: int, silver: int) -> float:
+        return bronze * self.unit_bronze + silver * self.unit_silver
+
+
+# Columns of SalaryPlan.to_frame, in the order of the fields of LevelPlan.
+FRAME_COLUMNS = [
+    "baseSalary",
+    "salaryDifferential",
+    "totalBadgeValue",
+    "totalBronze",
+    "totalSilver",
+    "unitBronze",
+    "unitSilver",
+]
+
+
+class SalaryPlan:
+    """
+    LevelPlan of every (hive, levelName) of the salary grid, compiled from
+    salary_grid and badge_referential.
+    """
+
+    def __init__(self, salary_grid: Table, badge_referential: Table) -> None:
+        base_salaries: Dict[Tuple[str, str], float] = {
+            (hive, level_name): float(base_salary)
+            for hive, level_name, base_salary in zip(
+                salary_grid["hive"],
+                salary_grid["levelName"],
+                salary_grid["baseSalary"],
+            )
+        }
+        totals = count_badges(badge_referential)
+
+        self.levels: Dict[Tuple[str, str], LevelPlan] = {}
+        # The (hive, levelName) badges of a level are valued against, None for
+        # the first level or when the previous level is not in the grid.
+        self.previous_levels: Dict[Tuple[str, str], Optional[Tuple[str, str]]] = {}
+        for (hive, level_name), base_salary in base_salaries.items():
+            rank = LEVEL_RANKS[level_name]
+            previous_level = (hive, LEVEL_NAMES[rank - 1]) if rank > 0 else None
+            if previous_level not in base_salaries:
+                previous_level = None
+            self.previous_levels[(hive, level_name)] = previous_level
+            differential = (
+                0.0
+                if previous_level is None
+                else base_salary - base_salaries[previous_level]
+            )
+            total_badge_value = BADGE_VALUE_SHARE * differential
+            total_bronze = totals.get((hive, level_name, "bronze"), 0)
+            total_silver = totals.get((hive, level_name, "silver"), 0)
+            self.levels[(hive, level_name)] = LevelPlan(
+                base_salary=base_salary,
+                salary_differential=differential,
+                total_badge_value=total_badge_value,
+                total_bronze=total_bronze,
+                total_silver=total_silver,
+                unit_bronze=get_unit_value(total_badge_value, total_bronze, "bronze"),
+                unit_silver=get_unit_value(total_badge_value, total_silver, "silver"),
+            )
+
+    def get_level(self, hive: str, level_name: str) -> LevelPlan:
+        return self.levels[(hive, level_name)]
+
+    def to_frame(self) -> pd.DataFrame:
+        """
+        One row per (hive, levelName), for the vectorized calculate_salaries.
+        """
+        import pandas as pd
+
+        return pd.DataFrame(
+            [
+                (hive, level_name, *level)
+                for (hive, level_name), level in self.levels.items()
+            ],
+            columns=["hive", "levelName", *FRAME_COLUMNS],
+        )
+
+
+def count_badges(badge_referential: Table) -> Mapping[Tuple[str, str, str], int]:
+    """
+    Number of badges of each (hive, levelName, badgeType).
+    """
+    columns = ["hive", "levelName", "badgeType"]
+    if isinstance(badge_referential, dict):
+        return Counter(zip(*(badge_referential[column] for column in columns)))
+    # Counted by pandas, iterating over the rows of a large catalog is slow.
+    return {
+        key: int(size)
+        for key, size in badge_referential.groupby(columns, observed=True)
+        .size()
+        .items()
+    }
+
+
+def get_unit_value(total_badge_value: float, number: int, badge_type: str) -> float:
+    if number == 0:
+        return 0.0
+    return total_badge_value / number * BADGE_TYPE_WEIGHTS[badge_type]
+
+
+# data_path -> signatures of PLAN_TABLES and the plan compiled from them.
+_plans: Dict[str, Tuple[Tuple[Tuple[int, int], ...], SalaryPlan]] = {}
+
+
+def get_salary_plan(
+    storage: Storage,
+    salary_grid: Optional[Table] = None,
+    badge_referential: Optional[Table] = None,
+) -> SalaryPlan:
+    """
+    SalaryPlan of the tables of storage, compiled once per process and again
+    only when salary_grid or badge_referential changed. The tables, when the
+    caller already fetched them, are used instead of fetching them again.
+    """
+    signatures = tuple(storage.get_signature(table) for table in PLAN_TABLES)
+    cached = _plans.get(storage.data_path)
+    if cached is not None and cached[0] == signatures:
+        count("plan_cache_hits")
+        return cached[1]
+    with stage("compile_plan"):
+        if salary_grid is None:
+            salary_grid = storage.fetch_columns(
+                "salary_grid", columns=["hive", "levelName", "baseSalary"]
+            )
+        if badge_referential is None:
+            badge_referential = storage.fetch_columns(
+                "badge_referential", columns=["hive", "levelName", "badgeType"]
+            )
+        plan = SalaryPlan(salary_grid, badge_referential)
+    _plans[storage.data_path] = (signatures, plan)
+    return plan
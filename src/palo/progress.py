@@ -0,0 +1,318 @@
+import sys
+from typing import Dict, List, Optional, Tuple
+
+import click
+import numpy as np
+import pandas as pd
+
+from palo.constants import BADGE_TYPE_WEIGHTS, LEVEL_NAMES, LEVEL_RANKS
+from palo.data_models import User
+from palo.main import fetch_data, get_badge_unit_values, validate_hive
+
+# Badge progress of every user as a sparse boolean user x badge matrix. Users
+# are the rows, in the order they first appear in user_referential, and badges
+# the columns, in the order of badge_referential. The matrix is stored in CSR
+# form: the badges earned by user u are indices[indptr[u]:indptr[u + 1]].
+# Masks over the badges select a hive, level or type, after which per-user
+# and per-badge counts are matrix-vector products, i.e. a bincount over the
+# non zero entries.
+
+BADGE_TYPES = list(BADGE_TYPE_WEIGHTS)
+
+
+class BadgeMatrix:
+    def __init__(
+        self, user_referential: pd.DataFrame, badge_referential: pd.DataFrame
+    ) -> None:
+        self.badges = badge_referential[
+            ["badgeName", "badgeType", "levelName", "hive"]
+        ].reset_index(drop=True)
+        self.users = (
+            user_referential.groupby(["username", "hive"], sort=False, observed=True)[
+                "levelName"
+            ]
+            .last()
+            .reset_index()
+        )
+        self.user_codes: Dict[Tuple[str, str], int] = {
+            key: code
+            for code, key in enumerate(zip(self.users["username"], self.users["hive"]))
+        }
+
+        # Badges and users are located by the (hive, level) cell they belong to.
+        self.hives = pd.Index(
+            pd.unique(
+                np.concatenate(
+                    [
+                        self.badges["hive"].to_numpy(dtype=object),
+                        self.users["hive"].to_numpy(dtype=object),
+                    ]
+                )
+            )
+        )
+        badge_ranks = self.badges["levelName"].map(LEVEL_RANKS).to_numpy(dtype=np.intp)
+        self.badge_cells = self.get_cells(self.badges["hive"], badge_ranks)
+        self.badge_types = (
+            self.badges["badgeType"].map(BADGE_TYPES.index).to_numpy(dtype=np.intp)
+        )
+        user_ranks = self.users["levelName"].map(LEVEL_RANKS).to_numpy(dtype=np.intp)
+        self.user_cells = self.get_cells(self.users["hive"], user_ranks)
+        # Users at the last level have no next level: -1 matches no badge.
+        self.user_next_cells = np.where(
+            user_ranks + 1 < len(LEVEL_NAMES), self.user_cells + 1, -1
+        )
+
+        earned = user_referential.loc[
+            user_referential["badgeName"].notna(), ["username", "hive", "badgeName"]
+        ].drop_duplicates()
+        # Badges which aren't in badge_referential are ignored, like in
+        # calculate_salaries.
+        earned = earned.merge(
+            self.users[["username", "hive"]].assign(user=np.arange(len(self.users))),
+            on=["username", "hive"],
+        ).merge(
+            self.badges[["hive", "badgeName"]].assign(
+                badge=np.arange(len(self.badges))
+            ),
+            on=["hive", "badgeName"],
+        )
+        users = earned["user"].to_numpy(dtype=np.intp)
+        badges = earned["badge"].to_numpy(dtype=np.intp)
+        order = np.lexsort((badges, users))
+        self.indices = badges[order].astype(np.int32)
+        self.indptr = np.concatenate(
+            [[0], np.cumsum(np.bincount(users, minlength=len(self.users)))]
+        )
+        # User of each non zero entry, i.e. the CSR rows expanded.
+        self.rows = users[order]
+        # Non zero entries in the current level of their user, and in the next.
+        entry_cells = self.badge_cells[self.indices]
+        self.in_level = {
+            False: np.flatnonzero(entry_cells == self.user_cells[self.rows]),
+            True: np.flatnonzero(entry_cells == self.user_next_cells[self.rows]),
+        }
+
+    def get_cells(self, hives: pd.Series, ranks: np.ndarray) -> np.ndarray:
+        return self.hives.get_indexer(hives.to_numpy(dtype=object)) * len(
+            LEVEL_NAMES
+        ) + np.asarray(ranks, dtype=np.intp)
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return len(self.users), len(self.badges)
+
+    def get_mask(
+        self,
+        hive: Optional[str] = None,
+        level_name: Optional[str] = None,
+        badge_type: Optional[str] = None,
+    ) -> np.ndarray:
+        """
+        Boolean mask of the badges of hive, level_name and badge_type. None
+        means any.
+        """
+        mask = np.ones(len(self.badges), dtype=bool)
+        if hive is not None:
+            mask &= self.badges["hive"].to_numpy(dtype=object) == hive
+        if level_name is not None:
+            mask &= self.badge_cells % len(LEVEL_NAMES) == LEVEL_RANKS[level_name]
+        if badge_type is not None:
+            mask &= self.badge_types == BADGE_TYPES.index(badge_type)
+        return mask
+
+    def dot(self, badge_weights: np.ndarray) -> np.ndarray:
+        """
+        Matrix times a vector over the badges: per user, the sum of the weights
+        of the badges they earned.
+        """
+        return np.bincount(
+            self.rows, weights=badge_weights[self.indices], minlength=len(self.users)
+        )
+
+    def rdot(self, user_weights: np.ndarray) -> np.ndarray:
+        """
+        Transposed matrix times a vector over the users: per badge, the sum of
+        the weights of the users who earned it.
+        """
+        return np.bincount(
+            self.indices, weights=user_weights[self.rows], minlength=len(self.badges)
+        )
+
+    def count_earned(self, mask: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Number of badges of the mask earned by each user.
+        """
+        if mask is None:
+            return np.diff(self.indptr)
+        return self.dot(mask.astype(float)).astype(np.int64)
+
+    def count_users(self, user_mask: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Number of users of user_mask who earned each badge.
+        """
+        if user_mask is None:
+            return np.bincount(self.indices, minlength=len(self.badges))
+        return self.rdot(user_mask.astype(float)).astype(np.int64)
+
+    def get_level_weights(
+        self, badge_weights: np.ndarray, next_level: bool = False
+    ) -> np.ndarray:
+        """
+        Per user, the sum of the weights of the badges they earned in their
+        current level, or in the next one.
+        """
+        in_level = self.in_level[next_level]
+        return np.bincount(
+            self.rows[in_level],
+            weights=badge_weights[self.indices[in_level]],
+            minlength=len(self.users),
+        )
+
+    def count_missing(self, next_level: bool = False) -> np.ndarray:
+        """
+        Number of badges of their current level, or of the next one, each user
+        hasn't earned yet.
+        """
+        cells = self.user_next_cells if next_level else self.user_cells
+        totals = np.bincount(
+            self.badge_cells, minlength=len(self.hives) * len(LEVEL_NAMES)
+        )
+        earned = np.bincount(
+            self.rows[self.in_level[next_level]], minlength=len(self.users)
+        )
+        return np.where(cells >= 0, totals[cells] - earned, 0)
+
+    def get_users_missing(
+        self, max_missing: int, next_level: bool = False
+    ) -> pd.DataFrame:
+        """
+        Users missing between 1 and max_missing badges of their current level,
+        or of the next one, with the number of badges they miss.
+        """
+        missing = self.count_missing(next_level)
+        selected = (missing >= 1) & (missing <= max_missing)
+        return (
+            self.users.loc[selected]
+            .assign(missingBadges=missing[selected])
+            .reset_index(drop=True)
+        )
+
+    def get_least_earned(
+        self,
+        number: int,
+        hive: Optional[str] = None,
+        level_name: Optional[str] = None,
+        badge_type: Optional[str] = None,
+    ) -> pd.DataFrame:
+        """
+        The `number` badges earned by the fewest users, with that number.
+        """
+        selected = np.flatnonzero(self.get_mask(hive, level_name, badge_type))
+        users = self.count_users()[selected]
+        # Stable, so that ties keep the order of badge_referential.
+        order = np.argsort(users, kind="stable")[:number]
+        return (
+            self.badges.loc[selected[order]]
+            .assign(users=users[order])
+            .reset_index(drop=True)
+        )
+
+    def get_badge_values(self, salary_grid: pd.DataFrame) -> np.ndarray:
+        """
+        Value of each badge: the unit value of its type in its hive and level.
+        """
+        units = get_badge_unit_values(salary_grid, self.badges)
+        values = self.badges.merge(
+            units[["hive", "levelName", "unitBronze", "unitSilver"]],
+            on=["hive", "levelName"],
+            how="left",
+        )
+        return np.where(
+            self.badge_types == BADGE_TYPES.index("bronze"),
+            values["unitBronze"].to_numpy(dtype=float),
+            values["unitSilver"].to_numpy(dtype=float),
+        )
+
+    def get_badges_earned(
+        self, level_name: str, user: User, badge_type: str
+    ) -> List[str]:
+        """
+        Same as SalaryEngine.get_badges_earned, in the order of badge_referential.
+        """
+        code = self.user_codes[(user.username, user.hive)]
+        badges = self.indices[self.indptr[code] : self.indptr[code + 1]]
+        mask = self.get_mask(user.hive, level_name, badge_type)
+        return (
+            self.badges["badgeName"]
+            .to_numpy(dtype=object)[badges[mask[badges]]]
+            .tolist()
+        )
+
+
+def load_badge_matrix(data_path: str, hive: Optional[str] = None) -> BadgeMatrix:
+    where = None if hive is None else {"hive": hive}
+    return BadgeMatrix(
+        fetch_data(
+            f"{data_path}/user_referential.csv",
+            where=where,
+            columns=["username", "hive", "levelName", "badgeName"],
+        ),
+        fetch_data(f"{data_path}/badge_referential.csv", where=where),
+    )
+
+
+@click.command()
+@click.option(
+    "--hive",
+    type=str,
+    default=None,
+    help="Only query the users and badges of this hive.",
+)
+@click.option(
+    "--missing",
+    "max_missing",
+    type=click.IntRange(min=1),
+    default=None,
+    help="List the users missing at most this many badges of their level.",
+)
+@click.option(
+    "--next_level",
+    is_flag=True,
+    default=False,
+    help="With --missing, count the badges of the next level instead.",
+)
+@click.option(
+    "--least_earned",
+    type=click.IntRange(min=1),
+    default=None,
+    help="List this many badges earned by the fewest users.",
+)
+@click.option(
+    "--data_path",
+    type=str,
+    default="data",
+    help="Where is the data stored? What's the path?",
+)
+def main(hive, max_missing, next_level, least_earned, data_path):
+    """
+    Prints, as CSV, the users missing at most --missing badges of their
+    current level (or next level) and the --least_earned badges earned by the
+    fewest users.
+    """
+    if max_missing is None and least_earned is None:
+        raise click.UsageError("Pass --missing, --least_earned or both.")
+    if hive is not None:
+        validate_hive(
+            fetch_data(f"{data_path}/salary_grid.csv", columns=["hive"]), hive
+        )
+    matrix = load_badge_matrix(data_path, hive)
+    if max_missing is not None:
+        matrix.get_users_missing(max_missing, next_level).to_csv(
+            sys.stdout, index=False
+        )
+    if least_earned is not None:
+        matrix.get_least_earned(least_earned, hive).to_csv(sys.stdout, index=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+import csv
+import json
+import math
+import sys
+from typing import IO, TYPE_CHECKING, Dict, Iterator, Optional, Sequence
+
+import click
+import numpy as np
+import pandas as pd
+
+from palo.constants import LEVEL_NAMES, LEVEL_RANKS
+from palo.main import calculate_salaries, fetch_data, validate_hive
+
+if TYPE_CHECKING:
+    from pandas.core.groupby import DataFrameGroupBy
+
+# Payroll and progression of the users grouped by hive and level, with a
+# rollup row per hive and one for the whole company. Every user is priced by
+# calculate_salaries in one pass over the referentials, the rollups are then
+# aggregations of that table.
+
+REPORT_FORMATS = ["csv", "jsonl"]
+PERCENTILES = (0.1, 0.5, 0.9)
+# Share of the badges of the next level a user must have earned to be counted
+# as near promotion.
+NEAR_PROMOTION = 0.8
+
+
+def get_report(
+    salaries: pd.DataFrame,
+    near_promotion: float = NEAR_PROMOTION,
+    percentiles: Sequence[float] = PERCENTILES,
+) -> pd.DataFrame:
+    """
+    One row per (hive, levelName) of the salaries returned by
+    calculate_salaries with progress, followed by the rollup of the hive,
+    whose levelName is None. The last row, whose hive is None, is the rollup
+    of every hive.
+    """
+    salaries = salaries.assign(
+        hive=salaries["hive"].astype(str),
+        rank=salaries["levelName"].map(LEVEL_RANKS).astype(int),
+        nearPromotion=salaries["nextLevelBadgeCompletion"] >= near_promotion,
+    )
+    levels = summarize(salaries.groupby(["hive", "rank"]), percentiles)
+    hives = summarize(salaries.groupby("hive"), percentiles)
+    total = summarize(salaries.groupby(np.zeros(len(salaries), dtype=int)), percentiles)
+
+    parts = []
+    for hive in hives.index:
+        hive_levels = levels.loc[hive]
+        parts.append(
+            hive_levels.assign(
+                hive=hive,
+                levelName=[LEVEL_NAMES[rank] for rank in hive_levels.index],
+            )
+        )
+        parts.append(hives.loc[[hive]].assign(hive=hive, levelName=None))
+    parts.append(total.assign(hive=None, levelName=None))
+    report = pd.concat(parts, ignore_index=True)
+    return report[["hive", "levelName", *levels.columns]]
+
+
+def summarize(groups: "DataFrameGroupBy", percentiles: Sequence[float]) -> pd.DataFrame:
+    salary = groups["salary"]
+    summary = pd.DataFrame(
+        {
+            "users": salary.size(),
+            "payroll": salary.sum(),
+            "meanSalary": salary.mean(),
+        }
+    )
+    for percentile in percentiles:
+        summary[f"salaryP{round(percentile * 100)}"] = salary.quantile(percentile)
+    summary["yetToCompleteBadgeValue"] = groups["yetToCompleteBadgeValue"].sum()
+    # What the badges already earned for the next level are paid.
+    summary["nextLevelBadgeSpend"] = groups["nextLevelBadgeValue"].sum()
+    summary["meanBadgeCompletion"] = groups["badgeCompletion"].mean()
+    summary["usersNearPromotion"] = groups["nearPromotion"].sum()
+    return summary
+
+
+def iter_records(report: pd.DataFrame) -> Iterator[Dict[str, object]]:
+    # Missing values, e.g. the completion of levels without badges, are None.
+    for record in report.to_dict("records"):
+        yield {
+            column: None if isinstance(value, float) and math.isnan(value) else value
+            for column, value in record.items()
+        }
+
+
+def write_report(report: pd.DataFrame, report_format: str, f: IO[str]) -> None:
+    if report_format == "jsonl":
+        for record in iter_records(report):
+            f.write(json.dumps(record) + "\n")
+        return
+    writer = csv.DictWriter(f, fieldnames=list(report.columns))
+    writer.writeheader()
+    for record in iter_records(report):
+        writer.writerow(record)
+
+
+@click.command()
+@click.option(
+    "--hive",
+    type=str,
+    default=None,
+    help="Only report on the users of this hive.",
+)
+@click.option(
+    "--format",
+    "report_format",
+    type=click.Choice(REPORT_FORMATS),
+    default="csv",
+    help="Print the report as CSV or as JSON Lines.",
+)
+@click.option(
+    "--near_promotion",
+    type=click.FloatRange(min=0, max=1),
+    default=NEAR_PROMOTION,
+    help="Share of the badges of the next level earned from which a user is "
+    "counted as near promotion.",
+)
+@click.option(
+    "--data_path",
+    type=str,
+    default="data",
+    help="Where is the data stored? What's the path?",
+)
+def main(hive, report_format, near_promotion, data_path):
+    """
+    Prints the payroll, salary percentiles, badge completion, next level
+    badge spend and users near promotion of every hive and level, with the
+    totals of each hive and of the company.
+    """
+    print_report(data_path, report_format, near_promotion, hive=hive)
+
+
+def print_report(
+    data_path: str,
+    report_format: str,
+    near_promotion: float = NEAR_PROMOTION,
+    hive: Optional[str] = None,
+    f: Optional[IO[str]] = None,
+) -> None:
+    salary_grid = fetch_data(
+        f"{data_path}/salary_grid.csv", columns=["hive", "levelName", "baseSalary"]
+    )
+    if hive is not None:
+        validate_hive(salary_grid, hive)
+    salaries = calculate_salaries(
+        None,
+        salary_grid,
+        fetch_data(
+            f"{data_path}/user_referential.csv",
+            where=None if hive is None else {"hive": hive},
+        ),
+        fetch_data(f"{data_path}/badge_referential.csv"),
+        progress=True,
+    )
+    report = get_report(salaries, near_promotion)
+    write_report(report, report_format, sys.stdout if f is None else f)
+
+
+if __name__ == "__main__":
+    main()
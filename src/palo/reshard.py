@@ -0,0 +1,139 @@
+import csv
+import os
+import shutil
+from typing import Dict, List, Tuple
+
+import click
+
+from palo.snapshot import write_json
+from palo.storage import (
+    MANIFEST_FILE_NAME,
+    SHARDED_TABLE,
+    TABLE_COLUMNS,
+    CsvStorage,
+    ShardedCsvStorage,
+    get_hive_directory,
+    get_shard,
+    get_shard_name,
+    get_storage,
+    get_version_directory,
+    locked,
+)
+
+# Splits user_referential into the shards of ShardedCsvStorage, or changes the
+# number of shards. The new shards are written as a new version next to the
+# current one and swapped in by replacing the manifest once complete, appends
+# wait for the swap. The rows of each user keep their order.
+
+DEFAULT_NUMBER_SHARDS = 16
+# Rows read before they are written to their shards.
+RESHARD_BATCH_SIZE = 100_000
+
+
+@click.command()
+@click.option(
+    "--data_path",
+    type=str,
+    default="data",
+    help="Where is the data stored? What's the path?",
+)
+@click.option(
+    "--shards",
+    "number_shards",
+    type=click.IntRange(min=1),
+    default=DEFAULT_NUMBER_SHARDS,
+    help="Number of shards of each hive.",
+)
+def main(data_path, number_shards):
+    """
+    Splits user_referential.csv into
+    user_referential/v<version>/<hive>/<shard>.csv, or reshards an already
+    sharded user_referential. From then on, every command reading or writing
+    data_path uses the shards and user_referential.csv is not read anymore.
+    """
+    rows = reshard(data_path, number_shards)
+    print(
+        f"Resharded {rows} rows of {SHARDED_TABLE} into {number_shards} shards "
+        "per hive."
+    )
+
+
+def reshard(data_path: str, number_shards: int) -> int:
+    """
+    Writes user_referential into number_shards shards per hive and returns the
+    number of rows written.
+    """
+    directory = f"{data_path}/{SHARDED_TABLE}"
+    columns = TABLE_COLUMNS[SHARDED_TABLE]
+    rows = 0
+    with locked(f"{data_path}/{SHARDED_TABLE}.lock"):
+        # Under the lock: no append is left behind and concurrent runs write
+        # versions one after the other.
+        storage = get_storage(data_path)
+        if isinstance(storage, CsvStorage):
+            sources = [storage.get_file_path(SHARDED_TABLE)]
+            version = 1
+        elif isinstance(storage, ShardedCsvStorage):
+            sources = [
+                shard.get_file_path(name) for shard, name in storage.get_shards({})
+            ]
+            version = storage.get_manifest()["version"] + 1
+        else:
+            raise click.ClickException(
+                f"{data_path} was converted to another storage, only CSV data can "
+                "be sharded."
+            )
+
+        new_directory = get_version_directory(directory, version)
+        # Left over by an interrupted run.
+        shutil.rmtree(new_directory, ignore_errors=True)
+        os.makedirs(new_directory)
+        # Rows are written a batch at a time, one shard file open at a time:
+        # there may be more shards than file descriptors.
+        shards: Dict[Tuple[str, int], List[Dict[str, str]]] = {}
+        for source in sources:
+            with open(source, "r", newline="") as f:
+                for row in csv.DictReader(f):
+                    key = (row["hive"], get_shard(row["username"], number_shards))
+                    shards.setdefault(key, []).append(row)
+                    rows += 1
+                    if rows % RESHARD_BATCH_SIZE == 0:
+                        write_shards(new_directory, shards, columns)
+                        shards = {}
+        write_shards(new_directory, shards, columns)
+        # Readers switch to the new shards when the manifest is replaced, an
+        # interrupted run leaves the table as it was. Readers which read the
+        # previous manifest may still be reading its shards, only the older
+        # versions are removed.
+        write_json(
+            f"{directory}/{MANIFEST_FILE_NAME}",
+            {"number_shards": number_shards, "columns": columns, "version": version},
+        )
+        for old_version in range(1, version - 1):
+            shutil.rmtree(
+                get_version_directory(directory, old_version), ignore_errors=True
+            )
+    return rows
+
+
+def write_shards(
+    directory: str,
+    shards: Dict[Tuple[str, int], List[Dict[str, str]]],
+    columns: List[str],
+) -> None:
+    for (hive, shard), shard_rows in shards.items():
+        hive_directory = get_hive_directory(directory, hive)
+        file_path = f"{hive_directory}/{get_shard_name(shard)}.csv"
+        os.makedirs(hive_directory, exist_ok=True)
+        exists = os.path.exists(file_path)
+        with open(file_path, "a", newline="") as f:
+            # Rows of logs created before a column was added have no value
+            # for it.
+            writer = csv.DictWriter(f, fieldnames=columns, extrasaction="ignore")
+            if not exists:
+                writer.writeheader()
+            writer.writerows(shard_rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+import json
+import sys
+from typing import Dict, List, Sequence, Tuple
+
+import click
+import numpy as np
+import pandas as pd
+
+from palo.constants import LEVEL_NAMES, LEVEL_RANKS
+from palo.data_models import Scenario
+from palo.main import fetch_data, get_badge_counts
+from palo.plan import SalaryPlan
+
+# What-if payroll. Every salary is a linear function of the badges a user
+# earned, with coefficients derived from the salary rules. Users are therefore
+# reduced once to the (hive, levelName) cell of their current and next levels
+# and their badge counts in both, after which any number of scenarios are
+# evaluated for every user as array operations over the cells of salary_grid.
+
+BASELINE = Scenario(name="baseline")
+
+
+class ScenarioEngine:
+    def __init__(
+        self,
+        salary_grid: pd.DataFrame,
+        user_referential: pd.DataFrame,
+        badge_referential: pd.DataFrame,
+    ) -> None:
+        # The cells, their base salary, previous level and number of badges
+        # are those of the plan calculate_salaries prices with.
+        plan = SalaryPlan(salary_grid, badge_referential)
+        keys = list(plan.levels)
+        levels = list(plan.levels.values())
+        self.cell_hives = np.array([hive for hive, _ in keys], dtype=object)
+        self.cell_levels = np.array(
+            [level_name for _, level_name in keys], dtype=object
+        )
+        self.base_salaries = np.array([level.base_salary for level in levels])
+        cells: Dict[Tuple[str, str], int] = {key: cell for cell, key in enumerate(keys)}
+        # The cell of the previous level of each cell, -1 when there is none.
+        self.previous_cells = np.array(
+            [
+                -1 if previous is None else cells[previous]
+                for previous in plan.previous_levels.values()
+            ],
+            dtype=np.intp,
+        )
+        self.total_bronze = np.array(
+            [level.total_bronze for level in levels], dtype=float
+        )
+        self.total_silver = np.array(
+            [level.total_silver for level in levels], dtype=float
+        )
+
+        users = (
+            user_referential.groupby(["username", "hive"], sort=False, observed=True)[
+                "levelName"
+            ]
+            .last()
+            .reset_index()
+        )
+        self.users = users[["username", "hive"]]
+        rank = users["levelName"].map(LEVEL_RANKS).astype(int)
+        users["nextLevelName"] = rank.map(
+            lambda rank: LEVEL_NAMES[rank + 1] if rank + 1 < len(LEVEL_NAMES) else None
+        )
+        # Users without a next level point at an extra cell worth nothing.
+        none = len(cells)
+        self.user_cells = np.array(
+            [cells[key] for key in zip(users["hive"], users["levelName"])],
+            dtype=np.intp,
+        )
+        self.user_next_cells = np.array(
+            [
+                cells.get(key, none)
+                for key in zip(users["hive"], users["nextLevelName"])
+            ],
+            dtype=np.intp,
+        )
+
+        counts = get_badge_counts(user_referential, badge_referential)
+        current = users.merge(counts, on=["username", "hive", "levelName"], how="left")
+        next_level = users[["username", "hive", "nextLevelName"]].merge(
+            counts.rename(columns={"levelName": "nextLevelName"}),
+            on=["username", "hive", "nextLevelName"],
+            how="left",
+        )
+        self.bronze = current["bronze"].fillna(0).to_numpy(dtype=float)
+        self.silver = current["silver"].fillna(0).to_numpy(dtype=float)
+        self.next_bronze = next_level["bronze"].fillna(0).to_numpy(dtype=float)
+        self.next_silver = next_level["silver"].fillna(0).to_numpy(dtype=float)
+
+    def get_cell_values(
+        self, scenarios: Sequence[Scenario]
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Base salary, total badge value and value of a single bronze and silver
+        badge of every cell, one row per scenario. The unit values have an
+        extra cell worth nothing, see user_next_cells.
+        """
+        factors = np.ones((len(scenarios), len(self.base_salaries)))
+        for row, scenario in zip(factors, scenarios):
+            for change in scenario.base_salary_changes:
+                mask = np.ones(len(row), dtype=bool)
+                if change.hive is not None:
+                    mask &= self.cell_hives == change.hive
+                if change.level_name is not None:
+                    mask &= self.cell_levels == change.level_name
+                row[mask] *= change.factor
+        base_salaries = self.base_salaries * factors
+
+        # Levels without a previous level have no badges to earn.
+        differential = base_salaries - base_salaries[:, self.previous_cells]
+        differential[:, self.previous_cells < 0] = 0.0
+        share = np.array([scenario.badge_value_share for scenario in scenarios])
+        total = share[:, None] * differential
+
+        units = []
+        for weight, totals in [
+            ([scenario.bronze_weight for scenario in scenarios], self.total_bronze),
+            ([scenario.silver_weight for scenario in scenarios], self.total_silver),
+        ]:
+            unit = np.zeros((len(scenarios), len(totals) + 1))
+            has_badges = totals > 0
+            unit[:, :-1][:, has_badges] = (
+                total[:, has_badges] * np.array(weight)[:, None] / totals[has_badges]
+            )
+            units.append(unit)
+        return base_salaries, total, units[0], units[1]
+
+    def get_salaries(self, scenarios: Sequence[Scenario]) -> np.ndarray:
+        """
+        Salary of every user of self.users, one row per scenario.
+        """
+        base_salaries, total, unit_bronze, unit_silver = self.get_cell_values(scenarios)
+        cells, next_cells = self.user_cells, self.user_next_cells
+        return (
+            base_salaries[:, cells]
+            - total[:, cells]
+            + unit_bronze[:, cells] * self.bronze
+            + unit_silver[:, cells] * self.silver
+            + unit_bronze[:, next_cells] * self.next_bronze
+            + unit_silver[:, next_cells] * self.next_silver
+        )
+
+    def get_deltas(
+        self, scenarios: Sequence[Scenario], batch_size: int = 100
+    ) -> np.ndarray:
+        """
+        Salary of every user in each scenario minus their current salary,
+        evaluated batch_size scenarios at a time to bound memory.
+        """
+        baseline = self.get_salaries([BASELINE])[0]
+        deltas = np.empty((len(scenarios), len(baseline)))
+        for start in range(0, len(scenarios), batch_size):
+            batch = scenarios[start : start + batch_size]
+            deltas[start : start + len(batch)] = self.get_salaries(batch) - baseline
+        return deltas
+
+    def get_payrolls(self, scenarios: Sequence[Scenario]) -> np.ndarray:
+        """
+        Sum of the salaries of every user, per scenario. Salaries are linear
+        in the values of the cells, so the users are summed per cell first and
+        the cost doesn't depend on the number of users.
+        """
+        base_salaries, total, unit_bronze, unit_silver = self.get_cell_values(scenarios)
+        number_cells = len(self.base_salaries) + 1
+
+        def per_cell(cells: np.ndarray, weights: np.ndarray) -> np.ndarray:
+            return np.bincount(cells, weights=weights, minlength=number_cells)
+
+        users = np.bincount(self.user_cells, minlength=number_cells)[:-1]
+        return (
+            (base_salaries - total) @ users
+            + unit_bronze @ per_cell(self.user_cells, self.bronze)
+            + unit_silver @ per_cell(self.user_cells, self.silver)
+            + unit_bronze @ per_cell(self.user_next_cells, self.next_bronze)
+            + unit_silver @ per_cell(self.user_next_cells, self.next_silver)
+        )
+
+
+def read_scenarios(path: str) -> List[Scenario]:
+    """
+    Reads a JSON list of scenarios, e.g.
+    [{"name": "tech seniors +5%",
+      "base_salary_changes": [{"hive": "tech", "level_name": "Senior",
+                               "factor": 1.05}]},
+     {"name": "silver 0.7", "bronze_weight": 0.3, "silver_weight": 0.7}]
+    """
+    with open(path, "r") as f:
+        scenarios = [Scenario(**scenario) for scenario in json.load(f)]
+    # Names are the columns of the deltas, they must be unique.
+    names = [scenario.name for scenario in scenarios]
+    for name in names:
+        if names.count(name) > 1:
+            raise ValueError(f"Scenario name {name} is used more than once.")
+    return scenarios
+
+
+@click.command()
+@click.option(
+    "--scenarios",
+    "scenarios_path",
+    type=click.Path(exists=True, dir_okay=False),
+    required=True,
+    help="JSON file of the scenarios to evaluate, see read_scenarios.",
+)
+@click.option(
+    "--deltas",
+    "deltas_path",
+    type=click.Path(dir_okay=False, writable=True),
+    default=None,
+    help="Also write the salary delta of every user in each scenario to this CSV.",
+)
+@click.option(
+    "--data_path",
+    type=str,
+    default="data",
+    help="Where is the data stored? What's the path?",
+)
+def main(scenarios_path, deltas_path, data_path):
+    """
+    Prints the payroll of each scenario and its difference with the current
+    payroll as CSV.
+    """
+    try:
+        scenarios = read_scenarios(scenarios_path)
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint="--scenarios") from e
+    engine = ScenarioEngine(
+        fetch_data(f"{data_path}/salary_grid.csv"),
+        fetch_data(f"{data_path}/user_referential.csv"),
+        fetch_data(f"{data_path}/badge_referential.csv"),
+    )
+    payrolls = engine.get_payrolls([BASELINE, *scenarios])
+    pd.DataFrame(
+        {
+            "scenario": [scenario.name for scenario in scenarios],
+            "payroll": payrolls[1:],
+            "payrollDelta": payrolls[1:] - payrolls[0],
+        }
+    ).to_csv(sys.stdout, index=False)
+
+    if deltas_path is not None:
+        deltas = engine.get_deltas(scenarios)
+        engine.users.assign(
+            **{scenario.name: delta for scenario, delta in zip(scenarios, deltas)}
+        ).to_csv(deltas_path, index=False)
+
+
+if __name__ == "__main__":
+    main()
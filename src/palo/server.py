@@ -0,0 +1,333 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Set, Tuple
+from urllib.parse import parse_qs, urlparse
+
+import click
+
+from palo.data_models import User
+from palo.engine import SalaryEngine
+from palo.feed import SalaryTable
+from palo.generate_user_referential_data import apply_events
+from palo.main import fetch_data
+from palo.plan import get_salary_plan
+from palo.snapshot import UserSnapshot
+from palo.storage import CsvStorage, get_storage
+from palo.writer import GroupCommitWriter
+
+# A resident process keeping the referentials parsed and indexed in memory, so
+# that a salary is a few dictionary lookups instead of a full CLI run.
+#
+# GET  /salary?username=pallav&hive=tech
+# POST /salaries {"users": [{"username": "pallav", "hive": "tech"}, ...]}
+#      Without "users", the salary of every user.
+# GET  /changes?since=3
+#      {"version": 5, "salaries": [...]}, the salaries which changed after
+#      version 3. Poll again with since=5.
+# POST /events {"events": [{"action": "earn_badge", "username": "pallav",
+#      "hive": "tech", "badge_names": ["tech-bronze-Senior-747533"]}, ...]}
+#      Validates the events in order, like --events_file, and appends the rows
+#      of the valid ones. Answers {"appended": 1, "rejected": [{"event": 2,
+#      "error": ...}]} once they are on disk. Concurrent requests share the
+#      same fsync, see palo.writer.
+
+
+class NotFound(Exception):
+    """
+    The user or hive asked for is not in the data, answered with a 404.
+    """
+
+
+class SalaryService:
+    """
+    Keeps a SalaryEngine up to date with the tables in data_path. A table is
+    reloaded only when its signature (mtime and size) changes. With the CSV
+    storage, lines appended to user_referential are folded in incrementally
+    and only the salaries of their users are calculated again.
+    """
+
+    CATALOG_TABLES = ("salary_grid", "badge_referential")
+
+    def __init__(self, data_path: str) -> None:
+        self.data_path = data_path
+        self.storage = get_storage(data_path)
+        self.signatures: Dict[str, Tuple[int, int]] = {}
+        self.snapshot: Optional[UserSnapshot] = None
+        self.engine: Optional[SalaryEngine] = None
+        self.table: Optional[SalaryTable] = None
+        self.lock = threading.Lock()
+        self.writer = GroupCommitWriter(data_path)
+
+    def refresh(self) -> SalaryEngine:
+        with self.lock:
+            signatures = {
+                table: self.storage.get_signature(table)
+                for table in (*self.CATALOG_TABLES, "user_referential")
+            }
+            catalog_changed = any(
+                signatures[table] != self.signatures.get(table)
+                for table in self.CATALOG_TABLES
+            )
+            users_changed = signatures["user_referential"] != self.signatures.get(
+                "user_referential"
+            )
+
+            engine = self.engine
+            changed: Set[Tuple[str, str]] = set()
+            if isinstance(self.storage, CsvStorage):
+                if self.snapshot is None:
+                    self.snapshot = UserSnapshot.load(self.data_path)
+                    self.snapshot.save()
+                elif users_changed:
+                    self.snapshot.refresh(changed)
+                if engine is None or catalog_changed:
+                    salary_grid, badge_referential = self.fetch_catalog()
+                    engine = SalaryEngine.from_snapshot(
+                        salary_grid,
+                        self.snapshot,
+                        badge_referential,
+                        plan=get_salary_plan(
+                            self.storage, salary_grid, badge_referential
+                        ),
+                    )
+            elif engine is None or catalog_changed or users_changed:
+                salary_grid, badge_referential = self.fetch_catalog()
+                # The plan is only compiled again when the catalog changed.
+                engine = SalaryEngine(
+                    salary_grid,
+                    self.fetch("user_referential"),
+                    badge_referential,
+                    plan=get_salary_plan(self.storage, salary_grid, badge_referential),
+                )
+
+            if self.table is None:
+                self.table = SalaryTable(engine)
+            elif engine is not self.engine:
+                self.table.reset(engine)
+            else:
+                self.table.update(changed)
+            self.engine = engine
+            self.signatures = signatures
+            return self.engine
+
+    def fetch(self, table: str):  # type: ignore[no-untyped-def]
+        return fetch_data(f"{self.data_path}/{table}.csv")
+
+    def fetch_catalog(self):  # type: ignore[no-untyped-def]
+        return tuple(self.fetch(table) for table in self.CATALOG_TABLES)
+
+    def salary(self, username: str, hive: str) -> Dict[str, object]:
+        return self.salaries([(username, hive)])[0]
+
+    def salaries(
+        self, users: Optional[List[Tuple[str, str]]] = None
+    ) -> List[Dict[str, object]]:
+        self.refresh()
+        # The engine shares the state of the snapshot, which refresh folds the
+        # new lines into: users are priced under the same lock.
+        with self.lock:
+            if users is None:
+                return list(self.get_table().records.values())
+            engine = self.get_engine()
+            result = []
+            for username, hive in users:
+                user = User(
+                    username=username, hive=hive, level_name=None, badge_names=None
+                )
+                try:
+                    engine.validate_hive(user.hive)
+                    engine.validate_username(user.username)
+                except Exception as e:
+                    raise NotFound(str(e)) from e
+                if (user.username, user.hive) not in engine.levels:
+                    raise NotFound(f"username {username} not found in the {hive} hive.")
+                result.append(engine.get_salary_record(user))
+            return result
+
+    def append_events(self, events: List[Dict[str, object]]) -> Dict[str, object]:
+        """
+        Validates the events against the engine, which is updated with each
+        of them, and appends the rows of the valid ones. Returns once they are
+        on disk.
+        """
+        self.refresh()
+        with self.lock:
+            records, rejected = apply_events(
+                enumerate(events, start=1), self.get_engine()
+            )
+            # Submitted under the lock: rows are appended in the order their
+            # events were validated in.
+            future = self.writer.submit(records) if records else None
+        if future is not None:
+            try:
+                future.result()
+            except Exception:
+                # The engine has rows which weren't written, it's built again
+                # from the data by the next refresh.
+                with self.lock:
+                    self.snapshot = None
+                    self.engine = None
+                    self.signatures = {}
+                raise
+        return {
+            "appended": len(records),
+            "rejected": [
+                {"event": number, "error": error} for number, error in rejected
+            ],
+        }
+
+    def close(self) -> None:
+        self.writer.close()
+
+    def changes(self, since: int) -> Dict[str, object]:
+        self.refresh()
+        with self.lock:
+            table = self.get_table()
+            return {"version": table.version, "salaries": table.get_changes(since)}
+
+    def get_engine(self) -> SalaryEngine:
+        assert self.engine is not None, "refresh() builds the engine."
+        return self.engine
+
+    def get_table(self) -> SalaryTable:
+        assert self.table is not None, "refresh() builds the table."
+        return self.table
+
+
+class SalaryRequestHandler(BaseHTTPRequestHandler):
+    service: SalaryService
+
+    def do_GET(self) -> None:
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        if url.path == "/changes":
+            try:
+                since = int(query.get("since", ["0"])[0])
+            except ValueError:
+                return self.send_json(400, {"error": "since must be an integer."})
+            return self.respond(lambda: self.service.changes(since))
+        if url.path != "/salary":
+            return self.send_json(404, {"error": f"Unknown path {url.path}."})
+        if "username" not in query or "hive" not in query:
+            return self.send_json(400, {"error": "username and hive are required."})
+        self.respond(
+            lambda: self.service.salary(query["username"][0], query["hive"][0])
+        )
+
+    def do_POST(self) -> None:
+        if self.path not in ("/salaries", "/events"):
+            return self.send_json(404, {"error": f"Unknown path {self.path}."})
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+        except ValueError:
+            length = -1
+        if length < 0:
+            return self.send_json(
+                400, {"error": "Content-Length must be a non-negative integer."}
+            )
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except json.JSONDecodeError as e:
+            return self.send_json(400, {"error": str(e)})
+        if self.path == "/events":
+            error = validate_events_body(body)
+            if error is not None:
+                return self.send_json(400, {"error": error})
+            return self.respond(lambda: self.service.append_events(body["events"]))
+        error = validate_body(body)
+        if error is not None:
+            return self.send_json(400, {"error": error})
+        users = body.get("users")
+        if users is not None:
+            users = [(user["username"], user["hive"]) for user in users]
+        self.respond(lambda: self.service.salaries(users))
+
+    def respond(self, compute) -> None:  # type: ignore[no-untyped-def]
+        try:
+            result = compute()
+        except NotFound as e:
+            return self.send_json(404, {"error": str(e)})
+        except Exception as e:
+            return self.send_json(500, {"error": str(e)})
+        self.send_json(200, result)
+
+    def send_json(self, status: int, body: object) -> None:
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format: str, *args: object) -> None:
+        # Thousands of calls a day, don't log every one of them.
+        pass
+
+
+def validate_body(body: object) -> Optional[str]:
+    """
+    Error message for a body of POST /salaries which is not
+    {"users": [{"username": ..., "hive": ...}, ...]}, users being optional.
+    """
+    if not isinstance(body, dict):
+        return "The body must be a JSON object."
+    users = body.get("users")
+    if users is None:
+        return None
+    if not isinstance(users, list):
+        return "users must be a list."
+    for user in users:
+        if not isinstance(user, dict) or not all(
+            isinstance(user.get(key), str) for key in ["username", "hive"]
+        ):
+            return "Each user must be an object with a username and a hive."
+    return None
+
+
+def validate_events_body(body: object) -> Optional[str]:
+    """
+    Error message for a body of POST /events which is not
+    {"events": [{...}, ...]}. The fields of the events are validated with the
+    events, see apply_events.
+    """
+    if not isinstance(body, dict) or not isinstance(body.get("events"), list):
+        return "The body must be a JSON object with a list of events."
+    if not all(isinstance(event, dict) for event in body["events"]):
+        return "Each event must be an object."
+    return None
+
+
+def create_server(data_path: str, host: str, port: int) -> ThreadingHTTPServer:
+    service = SalaryService(data_path)
+    # Parse and index everything before accepting the first request.
+    service.refresh()
+    handler = type(
+        "BoundSalaryRequestHandler", (SalaryRequestHandler,), {"service": service}
+    )
+    return ThreadingHTTPServer((host, port), handler)
+
+
+@click.command()
+@click.option(
+    "--data_path",
+    type=str,
+    default="data",
+    help="Where is the data stored? What's the path?",
+)
+@click.option("--host", type=str, default="127.0.0.1", help="Address to listen on.")
+@click.option("--port", type=int, default=8765, help="Port to listen on.")
+def main(data_path, host, port):
+    server = create_server(data_path, host, port)
+    print(f"Serving salaries from {data_path} on http://{host}:{server.server_port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.RequestHandlerClass.service.close()  # type: ignore[attr-defined]
+
+
+if __name__ == "__main__":
+    main()
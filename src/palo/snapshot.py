@@ -0,0 +1,431 @@
+from __future__ import annotations
+
+import csv
+import hashlib
+import io
+import json
+import os
+import sys
+from typing import (
+    TYPE_CHECKING,
+    BinaryIO,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+)
+
+from palo.instrumentation import count
+
+if TYPE_CHECKING:
+    import sqlite3
+
+# user_referential is an append only log. Instead of re-reading the whole log
+# on every call, we keep a compacted snapshot of the state of each user next to
+# it, together with the byte offset of the log the snapshot is up to date with.
+# Readers load the snapshot and only parse the lines appended after that offset.
+# The snapshot also stores a digest of the log before that offset: when the log
+# was regenerated, even into a larger file, the digest differs and the
+# snapshot is folded again from the start.
+# The snapshot is a SQLite database keyed by (username, hive): reading one user
+# doesn't read the others, and saving the lines appended since the last save
+# only writes the users of these lines.
+
+SNAPSHOT_FILE_NAME = "user_snapshot.sqlite3"
+
+# Rows of the log appended since the snapshot was saved before it is saved
+# again. Until then, readers fold these rows on every load, which is cheaper
+# than writing the snapshot after every append.
+SAVE_THRESHOLD = 1_000
+
+# Bytes of the log read at a time, memory stays bounded whatever its size.
+READ_CHUNK_SIZE = 1 << 24
+
+# Bytes of the log before an offset which, with the header, make its digest.
+# Hashing the whole prefix would read as much of the log as folding it again,
+# a regenerated log differs in its last lines anyway.
+DIGEST_WINDOW = 1 << 16
+
+UserKey = Tuple[str, str]
+Row = Tuple[str, str, str, Optional[str]]
+
+
+class UserState:
+    """
+    Current level and earned badges of every (username, hive) pair, folded
+    from rows of user_referential. Its size depends on the number of users,
+    not on the number of rows folded.
+    """
+
+    def __init__(self) -> None:
+        self.levels: Dict[UserKey, str] = {}
+        self.earned: Dict[UserKey, Set[str]] = {}
+        self.usernames: Set[str] = set()
+
+    def apply(self, rows: Iterable[Tuple[str, str, str, Optional[str]]]) -> None:
+        rows = list(rows)
+        fold_user_rows(rows, self.levels, self.earned)
+        self.usernames.update(row[0] for row in rows)
+
+    def clear(self) -> None:
+        self.levels.clear()
+        self.earned.clear()
+        self.usernames.clear()
+
+    def get_current_level(self, username: str, hive: str) -> str:
+        return self.levels[(username, hive)]
+
+    def get_badges_earned(self, username: str, hive: str) -> Set[str]:
+        return self.earned.get((username, hive), set())
+
+    def get_users(self) -> List[Dict[str, object]]:
+        """
+        The state as JSON serializable records, see add_users.
+        """
+        return [
+            {
+                "username": username,
+                "hive": hive,
+                "levelName": level_name,
+                "badgeNames": sorted(self.earned[(username, hive)]),
+            }
+            for (username, hive), level_name in self.levels.items()
+        ]
+
+    def add_users(self, users: Iterable[Dict[str, object]]) -> None:
+        intern = sys.intern
+        for user in users:
+            key = (intern(str(user["username"])), intern(str(user["hive"])))
+            self.levels[key] = intern(str(user["levelName"]))
+            self.earned[key] = {
+                intern(badge_name)
+                for badge_name in user["badgeNames"]  # type: ignore[attr-defined]
+            }
+            self.usernames.add(key[0])
+
+    def merge_users(self, users: Iterable[Dict[str, object]]) -> None:
+        """
+        Like add_users, but the badges are added to the ones already earned:
+        folds the changes of rows stored as records.
+        """
+        for user in users:
+            key = (str(user["username"]), str(user["hive"]))
+            badge_names = self.earned.get(key, set())
+            self.add_users([user])
+            self.earned[key].update(badge_names)
+
+
+class UserSnapshot(UserState):
+    """
+    UserState of user_referential as of byte `offset` of the log. When
+    `username` is given, only the rows of that user are folded.
+    """
+
+    def __init__(
+        self, log_path: str, snapshot_path: str, username: Optional[str] = None
+    ) -> None:
+        super().__init__()
+        self.log_path = log_path
+        self.snapshot_path = snapshot_path
+        self.username = username
+        self.offset = 0
+        # Digest of the log up to offset, see get_log_digest.
+        self.digest: Optional[str] = None
+        # Offset and digest of the snapshot stored on disk, None when there is
+        # none or it is of another log.
+        self.saved: Optional[Tuple[int, str]] = None
+        # Rows of the log between saved and offset, merged into the stored
+        # snapshot by save.
+        self.unsaved: List[Row] = []
+
+    @classmethod
+    def load(cls, data_path: str, username: Optional[str] = None) -> "UserSnapshot":
+        """
+        Loads the snapshot stored in data_path, if any, and folds in the lines
+        appended to user_referential since it was written. When username is
+        given, only the users with that username are read.
+        """
+        snapshot = cls(
+            f"{data_path}/user_referential.csv", f"{data_path}/{SNAPSHOT_FILE_NAME}"
+        )
+        if os.path.exists(snapshot.snapshot_path):
+            connection = snapshot.connect()
+            try:
+                # A single transaction, a concurrent save is seen whole or not
+                # at all.
+                connection.execute("BEGIN")
+                snapshot.saved = read_saved(connection)
+                if snapshot.saved is not None:
+                    snapshot.offset, snapshot.digest = snapshot.saved
+                    query = "SELECT username, hive, levelName, badgeNames FROM users"
+                    parameters: Tuple[str, ...] = ()
+                    if username is not None:
+                        query += " WHERE username = ?"
+                        parameters = (username,)
+                    snapshot.add_users(
+                        iter_stored_users(connection.execute(query, parameters))
+                    )
+                    # Without a stored snapshot, every user is folded so that
+                    # it can be saved.
+                    snapshot.username = username
+                connection.execute("COMMIT")
+            finally:
+                connection.close()
+        snapshot.refresh()
+        return snapshot
+
+    def connect(self) -> sqlite3.Connection:
+        import sqlite3
+
+        # Transactions are handled explicitly, see save.
+        count("files_opened")
+        return sqlite3.connect(self.snapshot_path, timeout=30, isolation_level=None)
+
+    def refresh(self, changed: Optional[Set[UserKey]] = None) -> int:
+        """
+        Folds the complete lines appended to the log since `offset` into the
+        snapshot. Returns the number of rows read. The users of these rows are
+        added to `changed`, when given.
+        """
+        read = 0
+        count("files_opened")
+        with open(self.log_path, "rb") as f:
+            header_line = f.readline()
+            header = next(csv.reader([header_line.decode()]))
+            if self.offset and self.digest != get_log_digest(f, self.offset):
+                # The log was regenerated, start over with every user.
+                self.offset = 0
+                if changed is not None:
+                    changed.update(self.levels)
+                self.clear()
+                self.username = None
+                self.saved = None
+                self.unsaved = []
+            self.offset = max(self.offset, len(header_line))
+
+            for block in read_complete_lines(f, self.offset):
+                reader = csv.DictReader(io.StringIO(block.decode()), fieldnames=header)
+                rows = [
+                    (row["username"], row["hive"], row["levelName"], row["badgeName"])
+                    for row in reader
+                ]
+                read += len(rows)
+                self.offset += len(block)
+                if self.saved is not None:
+                    self.unsaved.extend(rows)
+                if self.username is not None:
+                    rows = [row for row in rows if row[0] == self.username]
+                self.apply(rows)
+                if changed is not None:
+                    changed.update((row[0], row[1]) for row in rows)
+            if read or self.digest is None:
+                self.digest = get_log_digest(f, self.offset)
+        count("rows_scanned", read)
+        return read
+
+    def save(self) -> None:
+        """
+        Writes the snapshot when SAVE_THRESHOLD rows were folded since it was
+        saved, or when there is none. Only the users of these rows are
+        written. The snapshot is an optimisation, failing to write it is not
+        an error: the next reader folds the same lines again.
+        """
+        import sqlite3
+
+        if self.saved is not None and len(self.unsaved) < SAVE_THRESHOLD:
+            return
+        assert self.digest is not None
+        try:
+            connection = self.connect()
+            try:
+                connection.executescript("""
+                    CREATE TABLE IF NOT EXISTS users (
+                        username TEXT NOT NULL,
+                        hive TEXT NOT NULL,
+                        levelName TEXT NOT NULL,
+                        badgeNames TEXT NOT NULL,
+                        PRIMARY KEY (username, hive)
+                    ) WITHOUT ROWID;
+                    CREATE TABLE IF NOT EXISTS saved (
+                        offset INTEGER NOT NULL,
+                        digest TEXT NOT NULL
+                    );
+                    """)
+                # BEGIN IMMEDIATE takes the write lock upfront, concurrent
+                # savers wait for each other.
+                connection.execute("BEGIN IMMEDIATE")
+                if self.saved is not None and read_saved(connection) == self.saved:
+                    users = self.merge_unsaved(connection)
+                elif self.username is None:
+                    # No snapshot, or another process saved it since it was
+                    # loaded: every user is written.
+                    connection.execute("DELETE FROM users")
+                    users = self.get_users()
+                else:
+                    # Only the users of username are known, the next reader
+                    # of every user saves.
+                    connection.execute("ROLLBACK")
+                    return
+                connection.executemany(
+                    "INSERT OR REPLACE INTO users VALUES (?, ?, ?, ?)",
+                    (
+                        (
+                            user["username"],
+                            user["hive"],
+                            user["levelName"],
+                            json.dumps(user["badgeNames"]),
+                        )
+                        for user in users
+                    ),
+                )
+                connection.execute("DELETE FROM saved")
+                connection.execute(
+                    "INSERT INTO saved VALUES (?, ?)", (self.offset, self.digest)
+                )
+                connection.execute("COMMIT")
+            except BaseException:
+                if connection.in_transaction:
+                    connection.execute("ROLLBACK")
+                raise
+            finally:
+                connection.close()
+        except (OSError, sqlite3.Error):
+            return
+        self.saved = (self.offset, self.digest)
+        self.unsaved = []
+
+    def merge_unsaved(self, connection: sqlite3.Connection) -> List[Dict[str, object]]:
+        """
+        The stored users of the unsaved rows with these rows folded in.
+        """
+        state = UserState()
+        for key in {(row[0], row[1]) for row in self.unsaved}:
+            state.add_users(
+                iter_stored_users(
+                    connection.execute(
+                        "SELECT username, hive, levelName, badgeNames FROM users "
+                        "WHERE username = ? AND hive = ?",
+                        key,
+                    )
+                )
+            )
+        state.apply(self.unsaved)
+        return state.get_users()
+
+
+def iter_stored_users(
+    users: Iterable[Tuple[str, str, str, str]],
+) -> Iterator[Dict[str, object]]:
+    """
+    Rows of the users table of a snapshot as records of UserState.add_users.
+    """
+    for username, hive, level_name, badge_names in users:
+        yield {
+            "username": username,
+            "hive": hive,
+            "levelName": level_name,
+            "badgeNames": json.loads(badge_names),
+        }
+
+
+def read_saved(connection: sqlite3.Connection) -> Optional[Tuple[int, str]]:
+    """
+    Offset and digest of the snapshot stored in connection, if any.
+    """
+    import sqlite3
+
+    try:
+        row = connection.execute("SELECT offset, digest FROM saved").fetchone()
+    except sqlite3.OperationalError:
+        # The tables are created by the first save.
+        return None
+    return None if row is None else (row[0], row[1])
+
+
+def get_log_digest(f: BinaryIO, offset: int) -> str:
+    """
+    Digest of the header of the log and of the DIGEST_WINDOW bytes before
+    offset. Changes when the log before offset is not the one it was computed
+    from, e.g. when it was regenerated or truncated.
+    """
+    f.seek(0)
+    header_line = f.readline()
+    start = max(len(header_line), offset - DIGEST_WINDOW)
+    f.seek(start)
+    hasher = hashlib.blake2b(header_line)
+    hasher.update(f.read(max(offset - start, 0)))
+    hasher.update(str(offset).encode())
+    return hasher.hexdigest()
+
+
+def read_complete_lines(f: BinaryIO, offset: int) -> Iterator[bytes]:
+    """
+    Yields the content of f from offset, READ_CHUNK_SIZE bytes at a time, cut
+    after the last complete line of each chunk. A writer may be in the middle
+    of appending a line, only complete lines are yielded.
+    """
+    f.seek(offset)
+    pending = b""
+    while True:
+        block = f.read(READ_CHUNK_SIZE)
+        if not block:
+            return
+        block = pending + block
+        end = block.rfind(b"\n") + 1
+        pending = block[end:]
+        if end:
+            yield block[:end]
+
+
+def write_json(path: str, content: object) -> None:
+    # Write to a temporary file first so readers never see half a file. Each
+    # writer has its own, concurrent writers each replace the file in turn.
+    fd, tmp_path = make_temporary_file(os.path.dirname(path) or ".")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(content, f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def make_temporary_file(directory: str) -> Tuple[int, str]:
+    """
+    Like tempfile.mkstemp, but readable by the same users as a file created
+    with open instead of by its owner only, since it replaces such a file. The
+    file is created with mode 0o666, which the kernel restricts with the umask
+    of the process when it is created.
+    """
+    while True:
+        tmp_path = os.path.join(directory, f"tmp{os.urandom(8).hex()}.tmp")
+        try:
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+        except FileExistsError:
+            continue
+        return fd, tmp_path
+
+
+def fold_user_rows(
+    rows: Iterable[Tuple[str, str, str, Optional[str]]],
+    levels: Dict[UserKey, str],
+    earned: Dict[UserKey, Set[str]],
+) -> None:
+    """
+    Folds (username, hive, levelName, badgeName) rows of user_referential into
+    the latest level and the set of earned badges of each user. Strings are
+    interned: every row parsed from the log is a new string otherwise, and the
+    same level and badge names would be stored once per user.
+    """
+    intern = sys.intern
+    for username, hive, level_name, badge_name in rows:
+        key = (intern(username), intern(hive))
+        # user_referential is append only, the last row wins.
+        levels[key] = intern(level_name)
+        badges = earned.setdefault(key, set())
+        # Missing badge names are empty strings in csv and NaN in pandas.
+        if isinstance(badge_name, str) and badge_name:
+            badges.add(intern(badge_name))
@@ -0,0 +1,799 @@
+from __future__ import annotations
+
+import csv
+import io
+import json
+import os
+import shutil
+import tempfile
+import zlib
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from abc import ABC, abstractmethod
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+)
+
+import click
+
+from palo.cache import CSV_DTYPES, read_csv_cached
+from palo.constants import CATEGORICAL_COLUMNS
+from palo.instrumentation import count
+from palo.snapshot import make_temporary_file
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None  # type: ignore[assignment]
+
+if TYPE_CHECKING:
+    import sqlite3
+
+    import pandas as pd
+
+# Every read and write of the referentials goes through a Storage. The backend
+# is picked from what is found in the data directory: if it contains a SQLite
+# database or Parquet tables (see the `import_csv` command below) they are used,
+# otherwise the CSV files are read and appended to directly. user_referential
+# can also be split into CSV shards, see ShardedCsvStorage.
+
+SQLITE_FILE_NAME = "palo.sqlite3"
+PARQUET_SUFFIX = ".parquet"
+SHARDED_TABLE = "user_referential"
+MANIFEST_FILE_NAME = "manifest.json"
+
+TABLE_COLUMNS = {
+    "badge_referential": ["badgeName", "badgeType", "levelName", "hive"],
+    "salary_grid": ["rank", "levelName", "hive", "baseSalary"],
+    # timestamp is the time the row was appended, in UTC (see get_timestamp).
+    # It is empty for rows appended before it was recorded. The position of a
+    # row in the table is its sequence number.
+    "user_referential": ["username", "hive", "levelName", "badgeName", "timestamp"],
+}
+
+Record = Dict[str, Optional[str]]
+# A table as a mapping of column name to values, for callers that don't need
+# (or want to pay for importing) pandas.
+Columns = Dict[str, List[Any]]
+
+
+class Storage(ABC):
+    def __init__(self, data_path: str) -> None:
+        self.data_path = data_path
+
+    @abstractmethod
+    def fetch_table(
+        self,
+        table: str,
+        where: Optional[Dict[str, str]] = None,
+        columns: Optional[List[str]] = None,
+    ) -> pd.DataFrame:
+        """
+        Returns the rows of the table, in insertion order, whose columns are
+        equal to every value in `where`. Only `columns` are read when given.
+        """
+
+    def iter_table(
+        self, table: str, chunk_size: int, columns: Optional[List[str]] = None
+    ) -> Iterator[pd.DataFrame]:
+        """
+        Yields the rows of the table, in insertion order, `chunk_size` rows at
+        a time, so that tables larger than memory can be processed.
+        """
+        yield self.fetch_table(table, columns=columns)
+
+    def fetch_columns(
+        self,
+        table: str,
+        where: Optional[Dict[str, str]] = None,
+        columns: Optional[List[str]] = None,
+    ) -> Columns:
+        """
+        Same as fetch_table, as a mapping of column name to values.
+        """
+        df = self.fetch_table(table, where=where, columns=columns)
+        return {column: df[column].tolist() for column in df.columns}
+
+    @abstractmethod
+    def append_records(self, table: str, records: Iterable[Record]) -> None:
+        """
+        Appends all the records to the table in a single write.
+        """
+
+    @abstractmethod
+    def get_signature(self, table: str) -> Tuple[int, int]:
+        """
+        Changes whenever the table is written to. Used to invalidate caches.
+        """
+
+
+class CsvStorage(Storage):
+    def get_file_path(self, table: str) -> str:
+        return f"{self.data_path}/{table}.csv"
+
+    def get_header(self, table: str) -> List[str]:
+        # Read on every append: another process may have migrated it.
+        count("files_opened")
+        with open(self.get_file_path(table), "r", newline="") as f:
+            return next(csv.reader(f))
+
+    def fetch_table(
+        self,
+        table: str,
+        where: Optional[Dict[str, str]] = None,
+        columns: Optional[List[str]] = None,
+    ) -> pd.DataFrame:
+        # The whole table is parsed once and cached, see palo.cache.
+        df = read_csv_cached(self.get_file_path(table))
+        count("rows_scanned", len(df))
+        for column, value in (where or {}).items():
+            df = df.loc[df[column] == value]
+        return df if columns is None else df[columns]
+
+    def iter_table(
+        self, table: str, chunk_size: int, columns: Optional[List[str]] = None
+    ) -> Iterator[pd.DataFrame]:
+        import pandas as pd
+
+        # Bypasses palo.cache, which holds the whole table.
+        count("files_opened")
+        for chunk in pd.read_csv(
+            self.get_file_path(table),
+            usecols=columns,
+            chunksize=chunk_size,
+            dtype=CSV_DTYPES,
+        ):
+            count("rows_scanned", len(chunk))
+            yield chunk
+
+    def fetch_columns(
+        self,
+        table: str,
+        where: Optional[Dict[str, str]] = None,
+        columns: Optional[List[str]] = None,
+    ) -> Columns:
+        # Plain csv module: no pandas, no type inference, missing values are
+        # empty strings.
+        where = where or {}
+        count("files_opened")
+        with open(self.get_file_path(table), "r", newline="") as f:
+            reader = csv.reader(f)
+            header = next(reader)
+            wanted = columns or header
+            positions = [header.index(column) for column in wanted]
+            filters = [(header.index(column), value) for column, value in where.items()]
+            values: Columns = {column: [] for column in wanted}
+            for row in reader:
+                count("rows_scanned")
+                if all(row[position] == value for position, value in filters):
+                    for column, position in zip(wanted, positions):
+                        values[column].append(row[position])
+        return values
+
+    def append_records(self, table: str, records: Iterable[Record]) -> None:
+        if table != SHARDED_TABLE:
+            self.write_records(table, records)
+            return
+        records = list(records)
+        # Resharding waits for the appends in progress and blocks new ones,
+        # like for ShardedCsvStorage, so that no row is left behind.
+        with locked(f"{self.data_path}/{SHARDED_TABLE}.lock", shared=True):
+            sharded = os.path.exists(
+                f"{self.data_path}/{SHARDED_TABLE}/{MANIFEST_FILE_NAME}"
+            )
+            if not sharded:
+                self.write_records(table, records)
+        if sharded:
+            # Resharded while we waited for the lock.
+            ShardedCsvStorage(self.data_path).append_records(table, records)
+
+    def write_records(self, table: str, records: Iterable[Record]) -> None:
+        records = list(records)
+        if not records:
+            return
+        file_path = self.get_file_path(table)
+        given = {column for record in records for column in record}
+        while True:
+            count("files_opened")
+            with open(file_path, "a", newline="") as f:
+                # Writers from other processes wait for the lock, so the rows
+                # of two appends are never interleaved. It is released on
+                # close.
+                if fcntl is not None:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+                if os.fstat(f.fileno()).st_ino != os.stat(file_path).st_ino:
+                    # Migrated by another writer while we waited for the lock.
+                    continue
+                header = self.get_header(table)
+                # Files created before a column was added to the table are
+                # migrated the first time a record has a value for it.
+                added = [
+                    column
+                    for column in TABLE_COLUMNS.get(table, [])
+                    if column in given and column not in header
+                ]
+                if added:
+                    migrate_header(file_path, header + added)
+                    continue
+                buffer = io.StringIO()
+                # Only columns which aren't part of the table are dropped.
+                csv.DictWriter(
+                    buffer, fieldnames=header, extrasaction="ignore"
+                ).writerows(records)
+                f.write(buffer.getvalue())
+                f.flush()
+                os.fsync(f.fileno())
+            break
+        count("rows_appended", len(records))
+
+    def get_signature(self, table: str) -> Tuple[int, int]:
+        stat = os.stat(self.get_file_path(table))
+        return stat.st_mtime_ns, stat.st_size
+
+
+class SqliteStorage(Storage):
+    # Indexes matching the lookups done when calculating a salary and when
+    # validating badges.
+    INDEXES = {
+        "user_referential_username_hive": ("user_referential", "username, hive"),
+        "badge_referential_hive_level_type": (
+            "badge_referential",
+            "hive, levelName, badgeType",
+        ),
+        "badge_referential_badge_name": ("badge_referential", "badgeName"),
+    }
+
+    def get_file_path(self) -> str:
+        return f"{self.data_path}/{SQLITE_FILE_NAME}"
+
+    def connect(self) -> sqlite3.Connection:
+        import sqlite3
+
+        # Transactions are handled explicitly, see append_records.
+        count("files_opened")
+        return sqlite3.connect(self.get_file_path(), timeout=30, isolation_level=None)
+
+    def create_tables(self) -> None:
+        connection = self.connect()
+        try:
+            connection.executescript("""
+                CREATE TABLE IF NOT EXISTS badge_referential (
+                    badgeName TEXT NOT NULL,
+                    badgeType TEXT NOT NULL,
+                    levelName TEXT NOT NULL,
+                    hive TEXT NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS salary_grid (
+                    rank INTEGER NOT NULL,
+                    levelName TEXT NOT NULL,
+                    hive TEXT NOT NULL,
+                    baseSalary REAL NOT NULL
+                );
+                -- rowid keeps the order in which rows were appended.
+                CREATE TABLE IF NOT EXISTS user_referential (
+                    username TEXT NOT NULL,
+                    hive TEXT NOT NULL,
+                    levelName TEXT NOT NULL,
+                    badgeName TEXT,
+                    timestamp TEXT
+                );
+                """)
+            for name, (table, columns) in self.INDEXES.items():
+                connection.execute(
+                    f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})"
+                )
+        finally:
+            connection.close()
+
+    def fetch_table(
+        self,
+        table: str,
+        where: Optional[Dict[str, str]] = None,
+        columns: Optional[List[str]] = None,
+    ) -> pd.DataFrame:
+        where = where or {}
+        validate_columns(table, [*where, *(columns or [])])
+        columns = columns or TABLE_COLUMNS[table]
+        query = f"SELECT {', '.join(columns)} FROM {table}"
+        if where:
+            query += " WHERE " + " AND ".join(f"{column} = ?" for column in where)
+        query += " ORDER BY rowid"
+        import pandas as pd
+
+        connection = self.connect()
+        try:
+            df = pd.read_sql_query(query, connection, params=list(where.values()))
+        finally:
+            connection.close()
+        count("rows_scanned", len(df))
+        return use_categories(df)
+
+    def iter_table(
+        self, table: str, chunk_size: int, columns: Optional[List[str]] = None
+    ) -> Iterator[pd.DataFrame]:
+        import pandas as pd
+
+        validate_columns(table, columns or [])
+        query = (
+            f"SELECT {', '.join(columns or TABLE_COLUMNS[table])} FROM {table} "
+            "ORDER BY rowid"
+        )
+        connection = self.connect()
+        try:
+            for chunk in pd.read_sql_query(query, connection, chunksize=chunk_size):
+                count("rows_scanned", len(chunk))
+                yield chunk
+        finally:
+            connection.close()
+
+    def append_records(self, table: str, records: Iterable[Record]) -> None:
+        columns = TABLE_COLUMNS[table]
+        rows = [[record.get(column) for column in columns] for record in records]
+        if not rows:
+            return
+        connection = self.connect()
+        try:
+            # BEGIN IMMEDIATE takes the write lock upfront, so concurrent
+            # writers wait for each other instead of interleaving.
+            connection.execute("BEGIN IMMEDIATE")
+            connection.executemany(
+                f"INSERT INTO {table} ({', '.join(columns)}) "
+                f"VALUES ({', '.join('?' for _ in columns)})",
+                rows,
+            )
+            connection.execute("COMMIT")
+            count("rows_appended", len(rows))
+        except BaseException:
+            if connection.in_transaction:
+                connection.execute("ROLLBACK")
+            raise
+        finally:
+            connection.close()
+
+    def get_signature(self, table: str) -> Tuple[int, int]:
+        # All the tables live in the same file.
+        stat = os.stat(self.get_file_path())
+        return stat.st_mtime_ns, stat.st_size
+
+
+class ParquetStorage(Storage):
+    """
+    Each table is a directory of Parquet files, e.g.
+    user_referential.parquet/part-00000000.parquet. Appends add a new part, so
+    the name of the parts gives the order in which rows were appended.
+    Requires the optional pyarrow dependency.
+    """
+
+    SCHEMAS = {
+        "badge_referential": {
+            "badgeName": "string",
+            "badgeType": "string",
+            "levelName": "string",
+            "hive": "string",
+        },
+        "salary_grid": {
+            "rank": "int64",
+            "levelName": "string",
+            "hive": "string",
+            "baseSalary": "float64",
+        },
+        "user_referential": {
+            "username": "string",
+            "hive": "string",
+            "levelName": "string",
+            "badgeName": "string",
+            "timestamp": "string",
+        },
+    }
+
+    def get_file_path(self, table: str) -> str:
+        return f"{self.data_path}/{table}{PARQUET_SUFFIX}"
+
+    def get_schema(self, table: str):  # type: ignore[no-untyped-def]
+        pa = import_pyarrow()
+        return pa.schema(
+            [(column, type_) for column, type_ in self.SCHEMAS[table].items()]
+        )
+
+    def fetch_table(
+        self,
+        table: str,
+        where: Optional[Dict[str, str]] = None,
+        columns: Optional[List[str]] = None,
+    ) -> pd.DataFrame:
+        import_pyarrow()
+        import pandas as pd
+
+        where = where or {}
+        validate_columns(table, [*where, *(columns or [])])
+        directory = self.get_file_path(table)
+        parts = os.listdir(directory)
+        if not parts:
+            return pd.DataFrame(columns=columns or TABLE_COLUMNS[table])
+        count("files_opened", len(parts))
+        # Both the projection and the filters are pushed down to the reader, so
+        # row groups that can't match are skipped without being decoded.
+        df = pd.read_parquet(
+            directory,
+            columns=columns,
+            filters=[(column, "==", value) for column, value in where.items()] or None,
+        )
+        count("rows_scanned", len(df))
+        return use_categories(df)
+
+    def iter_table(
+        self, table: str, chunk_size: int, columns: Optional[List[str]] = None
+    ) -> Iterator[pd.DataFrame]:
+        import_pyarrow()
+        import pyarrow.parquet as pq
+
+        validate_columns(table, columns or [])
+        directory = self.get_file_path(table)
+        for part in sorted(os.listdir(directory)):
+            count("files_opened")
+            parquet_file = pq.ParquetFile(f"{directory}/{part}")
+            for batch in parquet_file.iter_batches(
+                batch_size=chunk_size, columns=columns
+            ):
+                count("rows_scanned", batch.num_rows)
+                yield batch.to_pandas()
+
+    def append_records(self, table: str, records: Iterable[Record]) -> None:
+        pa = import_pyarrow()
+        import pyarrow.parquet as pq
+
+        columns = TABLE_COLUMNS[table]
+        rows = [[record.get(column) for column in columns] for record in records]
+        if not rows:
+            return
+        data = pa.Table.from_arrays(
+            [pa.array(values) for values in zip(*rows)], names=columns
+        ).cast(self.get_schema(table))
+
+        directory = self.get_file_path(table)
+        os.makedirs(directory, exist_ok=True)
+        parts = sorted(os.listdir(directory))
+        number = int(parts[-1].split("-")[1].split(".")[0]) + 1 if parts else 0
+        while True:
+            # Exclusive creation, so two writers never write the same part.
+            try:
+                f = open(f"{directory}/part-{number:08d}{PARQUET_SUFFIX}", "xb")
+            except FileExistsError:
+                number += 1
+                continue
+            count("files_opened")
+            with f:
+                pq.write_table(data, f)
+                f.flush()
+                os.fsync(f.fileno())
+            count("rows_appended", len(rows))
+            return
+
+    def get_signature(self, table: str) -> Tuple[int, int]:
+        # Appends only ever add parts to the directory.
+        directory = self.get_file_path(table)
+        return os.stat(directory).st_mtime_ns, len(os.listdir(directory))
+
+
+class ShardedCsvStorage(Storage):
+    """
+    The CSV tables, except user_referential which is split into shards by hive
+    and by a hash of the username: user_referential/v<version>/<hive>/<shard>.csv.
+    All the rows of a user are in a single shard, so reading or appending the
+    rows of a user only touches that shard and appends to different shards
+    don't wait for each other. Rows are in insertion order within a shard, the
+    shards of the whole table are read one after the other. The number of
+    shards and the version in use are stored in user_referential/manifest.json,
+    see palo.reshard.
+    """
+
+    def __init__(self, data_path: str) -> None:
+        super().__init__(data_path)
+        self.tables = CsvStorage(data_path)
+
+    def get_directory(self, manifest: Dict[str, Any]) -> str:
+        return get_version_directory(
+            f"{self.data_path}/{SHARDED_TABLE}", manifest["version"]
+        )
+
+    def get_manifest(self) -> Dict[str, Any]:
+        count("files_opened")
+        with open(f"{self.data_path}/{SHARDED_TABLE}/{MANIFEST_FILE_NAME}", "r") as f:
+            return json.load(f)  # type: ignore[no-any-return]
+
+    def get_shards(self, where: Dict[str, str]) -> List[Tuple[CsvStorage, str]]:
+        """
+        The shards which may hold rows matching `where`, as the CsvStorage of
+        the directory of their hive and the name of the shard in it.
+        """
+        # A single read of the manifest: the shards of one version.
+        manifest = self.get_manifest()
+        directory = self.get_directory(manifest)
+        if "hive" in where:
+            hives = [where["hive"]]
+        else:
+            hives = sorted(
+                entry.name
+                for entry in os.scandir(directory)
+                if entry.is_dir() and not entry.name.startswith(".")
+            )
+        number_shards = manifest["number_shards"]
+        if "username" in where:
+            shards = [get_shard(where["username"], number_shards)]
+        else:
+            shards = list(range(number_shards))
+        found = []
+        for hive in hives:
+            storage = CsvStorage(get_hive_directory(directory, hive))
+            for shard in shards:
+                if os.path.exists(storage.get_file_path(get_shard_name(shard))):
+                    found.append((storage, get_shard_name(shard)))
+        return found
+
+    def fetch_table(
+        self,
+        table: str,
+        where: Optional[Dict[str, str]] = None,
+        columns: Optional[List[str]] = None,
+    ) -> pd.DataFrame:
+        if table != SHARDED_TABLE:
+            return self.tables.fetch_table(table, where=where, columns=columns)
+        import pandas as pd
+
+        where = where or {}
+        validate_columns(table, [*where, *(columns or [])])
+        # Every row of a shard is in the hive of its directory.
+        filters = {column: value for column, value in where.items() if column != "hive"}
+        dfs = [
+            storage.fetch_table(shard, where=filters, columns=columns)
+            for storage, shard in self.get_shards(where)
+        ]
+        if not dfs:
+            return pd.DataFrame(columns=columns or TABLE_COLUMNS[table])
+        if len(dfs) == 1:
+            return dfs[0]
+        # The categories of each shard are different, pd.concat returns strings.
+        return use_categories(pd.concat(dfs, ignore_index=True))
+
+    def iter_table(
+        self, table: str, chunk_size: int, columns: Optional[List[str]] = None
+    ) -> Iterator[pd.DataFrame]:
+        if table != SHARDED_TABLE:
+            yield from self.tables.iter_table(table, chunk_size, columns=columns)
+            return
+        validate_columns(table, columns or [])
+        for storage, shard in self.get_shards({}):
+            yield from storage.iter_table(shard, chunk_size, columns=columns)
+
+    def fetch_columns(
+        self,
+        table: str,
+        where: Optional[Dict[str, str]] = None,
+        columns: Optional[List[str]] = None,
+    ) -> Columns:
+        if table != SHARDED_TABLE:
+            return self.tables.fetch_columns(table, where=where, columns=columns)
+        where = where or {}
+        validate_columns(table, [*where, *(columns or [])])
+        values: Columns = {column: [] for column in columns or TABLE_COLUMNS[table]}
+        for storage, shard in self.get_shards(where):
+            shard_values = storage.fetch_columns(shard, where=where, columns=columns)
+            for column in values:
+                values[column].extend(shard_values[column])
+        return values
+
+    def append_records(self, table: str, records: Iterable[Record]) -> None:
+        if table != SHARDED_TABLE:
+            self.tables.append_records(table, records)
+            return
+        # Resharding waits for the appends in progress and blocks new ones,
+        # which then read the new manifest.
+        with locked(f"{self.data_path}/{SHARDED_TABLE}.lock", shared=True):
+            manifest = self.get_manifest()
+            shards: Dict[Tuple[str, str], List[Record]] = {}
+            for record in records:
+                shard = get_shard(str(record["username"]), manifest["number_shards"])
+                key = (str(record["hive"]), get_shard_name(shard))
+                shards.setdefault(key, []).append(record)
+            for (hive, shard), shard_records in shards.items():
+                storage = CsvStorage(
+                    get_hive_directory(self.get_directory(manifest), hive)
+                )
+                create_csv(storage.get_file_path(shard), manifest["columns"])
+                storage.append_records(shard, shard_records)
+
+    def get_signature(self, table: str) -> Tuple[int, int]:
+        if table != SHARDED_TABLE:
+            return self.tables.get_signature(table)
+        # Appends change a shard, resharding rewrites the manifest.
+        stats = [os.stat(f"{self.data_path}/{SHARDED_TABLE}/{MANIFEST_FILE_NAME}")] + [
+            os.stat(storage.get_file_path(shard))
+            for storage, shard in self.get_shards({})
+        ]
+        return (
+            max(stat.st_mtime_ns for stat in stats),
+            sum(stat.st_size for stat in stats),
+        )
+
+
+def get_shard(username: str, number_shards: int) -> int:
+    # crc32 is stable across processes and runs, unlike hash().
+    return zlib.crc32(username.encode()) % number_shards
+
+
+def get_shard_name(shard: int) -> str:
+    return f"{shard:04d}"
+
+
+def get_version_directory(directory: str, version: int) -> str:
+    return f"{directory}/v{version}"
+
+
+def get_hive_directory(directory: str, hive: str) -> str:
+    if not hive or hive.startswith(".") or "/" in hive or os.sep in hive:
+        raise ValueError(f"Invalid hive {hive} for a shard directory.")
+    return f"{directory}/{hive}"
+
+
+def migrate_header(file_path: str, columns: List[str]) -> None:
+    """
+    Rewrites the CSV file with the header `columns`, the columns it didn't
+    have are empty in its rows. The new file replaces the old one at once:
+    readers see either, writers waiting for the lock of the old one reopen
+    the file.
+    """
+    directory = os.path.dirname(file_path)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", newline="") as f:
+            with open(file_path, "r", newline="") as source:
+                reader = csv.reader(source)
+                header = next(reader)
+                writer = csv.writer(f)
+                writer.writerow(columns)
+                padding = [""] * (len(columns) - len(header))
+                for row in reader:
+                    writer.writerow(row + padding)
+            f.flush()
+            os.fsync(f.fileno())
+        shutil.copymode(file_path, tmp_path)
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def create_csv(file_path: str, columns: List[str]) -> None:
+    """
+    Creates the CSV file with its header unless it exists. Concurrent writers
+    never see it without its header.
+    """
+    if os.path.exists(file_path):
+        return
+    directory = os.path.dirname(file_path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = make_temporary_file(directory)
+    try:
+        with os.fdopen(fd, "w", newline="") as f:
+            csv.writer(f).writerow(columns)
+        # Unlike os.replace, os.link fails if another writer created it first.
+        os.link(tmp_path, file_path)
+    except FileExistsError:
+        pass
+    finally:
+        os.remove(tmp_path)
+
+
+@contextmanager
+def locked(file_path: str, shared: bool = False) -> Iterator[None]:
+    if fcntl is None:
+        yield
+        return
+    with open(file_path, "a") as f:
+        fcntl.flock(f.fileno(), fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        yield
+
+
+def import_pyarrow():  # type: ignore[no-untyped-def]
+    try:
+        import pyarrow
+    except ImportError as e:
+        raise ImportError(
+            "The Parquet storage requires pyarrow. Install it with "
+            "`pip install palo[parquet]`."
+        ) from e
+    return pyarrow
+
+
+def use_categories(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Converts the columns of CATEGORICAL_COLUMNS to categoricals, like the CSV
+    tables loaded by palo.cache.
+    """
+    return df.astype(
+        {column: "category" for column in CATEGORICAL_COLUMNS if column in df}
+    )
+
+
+def get_timestamp() -> str:
+    # Fixed width, so that timestamps compare as strings.
+    return datetime.now(timezone.utc).isoformat(timespec="microseconds")
+
+
+def add_timestamps(table: str, records: Iterable[Record]) -> List[Record]:
+    """
+    Sets the timestamp of the records which don't have one to now, for the
+    tables which record it.
+    """
+    if "timestamp" not in TABLE_COLUMNS[table]:
+        return list(records)
+    timestamp = get_timestamp()
+    return [
+        {**record, "timestamp": record.get("timestamp") or timestamp}
+        for record in records
+    ]
+
+
+def validate_columns(table: str, columns: Iterable[str]) -> None:
+    for column in columns:
+        if column not in TABLE_COLUMNS[table]:
+            raise ValueError(f"Unknown column {column} for table {table}.")
+
+
+BACKENDS = {"sqlite": SqliteStorage, "parquet": ParquetStorage}
+
+
+def get_storage(data_path: str) -> Storage:
+    if os.path.exists(f"{data_path}/{SQLITE_FILE_NAME}"):
+        return SqliteStorage(data_path)
+    if os.path.exists(f"{data_path}/user_referential{PARQUET_SUFFIX}"):
+        return ParquetStorage(data_path)
+    if os.path.exists(f"{data_path}/{SHARDED_TABLE}/{MANIFEST_FILE_NAME}"):
+        return ShardedCsvStorage(data_path)
+    return CsvStorage(data_path)
+
+
+@click.command()
+@click.option(
+    "--data_path",
+    type=str,
+    default="data",
+    help="Where is the data stored? What's the path?",
+)
+@click.option(
+    "--to",
+    "backend",
+    type=click.Choice(list(BACKENDS)),
+    default="sqlite",
+    help="Which storage should the CSV files be converted to?",
+)
+def import_csv(data_path, backend):
+    """
+    Copies the CSV referentials into a SQLite database or Parquet tables in the
+    same directory. From then on, every command reading or writing data_path
+    uses them.
+    """
+    if not isinstance(get_storage(data_path), CsvStorage):
+        raise click.ClickException(f"{data_path} was already converted.")
+    storage = BACKENDS[backend](data_path)
+    if isinstance(storage, SqliteStorage):
+        storage.create_tables()
+    elif isinstance(storage, ParquetStorage):
+        for table in TABLE_COLUMNS:
+            os.makedirs(storage.get_file_path(table), exist_ok=True)
+    csv_storage = CsvStorage(data_path)
+    for table, columns in TABLE_COLUMNS.items():
+        df = csv_storage.fetch_table(table).reindex(columns=columns)
+        records = df.astype(object).where(df.notna(), None).to_dict("records")
+        storage.append_records(table, records)
+
+
+if __name__ == "__main__":
+    import_csv()
@@ -0,0 +1,66 @@
+from typing import Dict, Iterator, NamedTuple, Optional
+
+from palo.engine import SalaryEngine
+from palo.instrumentation import stage
+from palo.snapshot import UserState
+from palo.storage import Storage, get_storage
+
+# Payroll over a user_referential larger than memory. The log is read in chunks
+# and folded into a UserState, whose size depends on the number of users and
+# not on the number of rows. Salaries are then calculated from that state one
+# user at a time.
+
+USER_REFERENTIAL_COLUMNS = ["username", "hive", "levelName", "badgeName"]
+
+
+class UserKey(NamedTuple):
+    # Quacks like palo.data_models.User without importing pydantic.
+    username: str
+    hive: str
+
+
+def fold_user_referential(
+    storage: Storage, chunk_size: int, hive: Optional[str] = None
+) -> UserState:
+    state = UserState()
+    for chunk in storage.iter_table(
+        "user_referential", chunk_size, columns=USER_REFERENTIAL_COLUMNS
+    ):
+        if hive is not None:
+            chunk = chunk.loc[chunk["hive"] == hive]
+        state.apply(
+            zip(
+                chunk["username"],
+                chunk["hive"],
+                chunk["levelName"],
+                chunk["badgeName"],
+            )
+        )
+    return state
+
+
+def iter_salaries(
+    data_path: str, chunk_size: int, hive: Optional[str] = None
+) -> Iterator[Dict[str, object]]:
+    """
+    Yields the salary of every user, in the order they first appear in the log,
+    with the columns of calculate_salaries.
+    """
+    storage = get_storage(data_path)
+    with stage("fold_user_referential"):
+        state = fold_user_referential(storage, chunk_size, hive=hive)
+    with stage("load_engine"):
+        engine = SalaryEngine.from_snapshot(
+            storage.fetch_columns(
+                "salary_grid", columns=["hive", "levelName", "baseSalary"]
+            ),
+            state,
+            storage.fetch_columns("badge_referential"),
+        )
+    if hive is not None:
+        with stage("validate"):
+            engine.validate_hive(hive)
+    for username, user_hive in engine.levels:
+        with stage("calculate_salary"):
+            record = engine.get_salary_record(UserKey(username, user_hive))
+        yield record
@@ -0,0 +1,104 @@
+import asyncio
+import queue
+import threading
+from concurrent.futures import Future
+from typing import Iterable, List, Optional, Tuple
+
+from palo.instrumentation import count
+from palo.storage import Record, add_timestamps, get_storage
+
+# Group commit for processes appending to user_referential from many threads or
+# asyncio tasks, e.g. a service calling earn_badge for several HR tools.
+# Producers submit their records and wait until they have been written. A
+# single background thread appends everything submitted in the meantime in one
+# write and one fsync, so the cost of the fsync is shared by the whole batch.
+
+# Records written at most in a single append.
+MAX_BATCH_SIZE = 10_000
+
+Submission = Tuple[List[Record], "Future[None]"]
+
+
+class GroupCommitWriter:
+    def __init__(
+        self,
+        data_path: str,
+        table: str = "user_referential",
+        max_batch_size: int = MAX_BATCH_SIZE,
+    ) -> None:
+        self.storage = get_storage(data_path)
+        self.table = table
+        self.max_batch_size = max_batch_size
+        # None asks the thread to stop once everything before it is written.
+        self._queue: "queue.Queue[Optional[Submission]]" = queue.Queue()
+        self._closed = False
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, records: Iterable[Record]) -> "Future[None]":
+        """
+        Queues the records to be appended together, in order. The future is
+        done once they are on disk, or failed if the append failed.
+        """
+        future: "Future[None]" = Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("The writer is closed.")
+            self._queue.put((add_timestamps(self.table, records), future))
+        return future
+
+    def write(self, records: Iterable[Record]) -> None:
+        self.submit(records).result()
+
+    async def write_async(self, records: Iterable[Record]) -> None:
+        await asyncio.wrap_future(self.submit(records))
+
+    def close(self) -> None:
+        """
+        Writes what was submitted so far and stops the writer.
+        """
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(None)
+        self._thread.join()
+
+    def __enter__(self) -> "GroupCommitWriter":
+        return self
+
+    def __exit__(self, *args: object) -> None:
+        self.close()
+
+    def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            batch = [self._queue.get()]
+            # Everything submitted while the previous batch was written goes in
+            # the next one.
+            size = 0 if batch[0] is None else len(batch[0][0])
+            while size < self.max_batch_size:
+                try:
+                    submission = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                batch.append(submission)
+                if submission is not None:
+                    size += len(submission[0])
+            stopping = None in batch
+            self._commit([submission for submission in batch if submission])
+
+    def _commit(self, batch: List[Submission]) -> None:
+        if not batch:
+            return
+        records = [record for records, _ in batch for record in records]
+        try:
+            self.storage.append_records(self.table, records)
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        count("group_commits")
+        for _, future in batch:
+            future.set_result(None)
@@ -0,0 +1,18 @@
+import shutil
+from pathlib import Path
+
+import pytest
+
+# The sample tables of the repository. Tests read them through the data_path
+# fixture: caches and snapshots are written next to the tables they read.
+DATA_PATH = Path(__file__).resolve().parents[2] / "data"
+
+
+@pytest.fixture()
+def data_path(tmp_path):
+    """
+    A copy of the sample tables in tmp_path, which tests can write to.
+    """
+    for table in ["badge_referential", "salary_grid", "user_referential"]:
+        shutil.copy(DATA_PATH / f"{table}.csv", tmp_path / f"{table}.csv")
+    return str(tmp_path)
@@ -0,0 +1,80 @@
+import os
+
+import pandas as pd
+
+from palo.cache import read_csv_cached
+
+
+def test_read_csv_cached(data_path, tmp_path, monkeypatch):
+    file_path = f"{data_path}/user_referential.csv"
+    expected = pd.read_csv(
+        file_path,
+        dtype={
+            column: "category"
+            for column in ["username", "hive", "levelName", "badgeName"]
+        },
+    )
+    pd.testing.assert_frame_equal(read_csv_cached(file_path), expected)
+    assert os.path.exists(tmp_path / ".palo_cache" / "user_referential.csv.pkl")
+
+    parsed = []
+    read_csv = pd.read_csv
+    monkeypatch.setattr(
+        pd, "read_csv", lambda f, **kwargs: parsed.append(f) or read_csv(f, **kwargs)
+    )
+
+    # Unchanged file: nothing is parsed.
+    pd.testing.assert_frame_equal(read_csv_cached(file_path), expected)
+    assert parsed == []
+
+    # Appended lines: only the new lines are parsed.
+    with open(file_path, "a") as f:
+        f.write("ada,tech,Mid,\nada,tech,Mid,tech-bronze-Senior-747533\n")
+    # Categories seen in the new lines are added after the cached ones.
+    df = read_csv_cached(file_path)
+    assert (df.dtypes == "category").all()
+    assert df["username"].cat.categories.tolist() == ["claire", "pallav", "ada"]
+    pd.testing.assert_frame_equal(df.astype(object), read_csv(file_path).astype(object))
+    assert len(parsed) == 1
+    assert parsed[0].getvalue().count(b"\n") == 3
+
+    # Rewritten file: everything is parsed again.
+    with open(file_path, "w") as f:
+        f.write("username,hive,levelName,badgeName\nbob,design,Mid,\n")
+    assert read_csv_cached(file_path)["username"].tolist() == ["bob"]
+
+
+def test_read_csv_cached_without_trailing_newline(data_path):
+    file_path = f"{data_path}/user_referential.csv"
+    with open(file_path, "a") as f:
+        f.write("ada,tech,Mid,tech-bronze-Senior-747533")
+    expected = pd.read_csv(file_path)
+    # A full read parses the file as is, the last line included.
+    df = read_csv_cached(file_path)
+    assert len(df) == len(expected)
+    assert df.iloc[-1]["badgeName"] == "tech-bronze-Senior-747533"
+    assert len(read_csv_cached(file_path)) == len(expected)
+
+    # Lines appended after it parse the whole file again.
+    with open(file_path, "a") as f:
+        f.write("\nbob,design,Mid,\n")
+    df = read_csv_cached(file_path)
+    assert df["username"].tolist()[-2:] == ["ada", "bob"]
+
+
+def test_read_csv_cached_half_written_line(data_path):
+    file_path = f"{data_path}/user_referential.csv"
+    rows = len(pd.read_csv(file_path))
+    assert len(read_csv_cached(file_path)) == rows
+    # A writer is in the middle of appending a line when the table grew since
+    # it was cached: the line is left for later.
+    with open(file_path, "a") as f:
+        f.write("ada,tech,Mid,tech-bronze-")
+    assert len(read_csv_cached(file_path)) == rows
+
+    with open(file_path, "a") as f:
+        f.write("Senior-747533\n")
+    df = read_csv_cached(file_path)
+    assert len(df) == rows + 1
+    assert df.iloc[-1]["username"] == "ada"
+    assert df.iloc[-1]["badgeName"] == "tech-bronze-Senior-747533"
@@ -0,0 +1,33 @@
+import pandas as pd
+import pytest
+
+from palo.data_models import User
+from palo.engine import SalaryEngine
+from palo.main import calculate_salaries, fetch_data
+
+
+def test_salary_engine_matches_calculate_salaries(data_path):
+    salary_grid = fetch_data(f"{data_path}/salary_grid.csv")
+    badge_referential = fetch_data(f"{data_path}/badge_referential.csv")
+    user_referential = fetch_data(f"{data_path}/user_referential.csv")
+    user_referential = pd.concat(
+        [user_referential, user_referential.iloc[:19].assign(username="senior")],
+        ignore_index=True,
+    )
+    engine = SalaryEngine(salary_grid, user_referential, badge_referential)
+
+    expected = calculate_salaries(
+        None, salary_grid, user_referential, badge_referential
+    ).set_index(["username", "hive"])["salary"]
+    for username, hive in [
+        ("pallav", "tech"),
+        ("claire", "design"),
+        ("senior", "tech"),
+    ]:
+        user = User(username=username, hive=hive, level_name=None, badge_names=None)
+        assert engine.calculate_salary(user) == pytest.approx(
+            expected[(username, hive)]
+        )
+
+    with pytest.raises(Exception, match="nobody"):
+        engine.validate_username("nobody")
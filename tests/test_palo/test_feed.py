@@ -0,0 +1,32 @@
+from palo.engine import load_engine
+from palo.feed import SalaryTable
+from palo.streaming import iter_salaries
+
+
+def test_salary_table(data_path):
+    table = SalaryTable(load_engine(data_path))
+    assert table.version == 1
+    received = []
+    table.subscribe(received.append)
+
+    changed = table.apply([("claire", "design", "Team_Lead", None)])
+    assert [record["username"] for record in changed] == ["claire"]
+    assert changed[0]["levelName"] == "Team_Lead"
+    assert received == [changed]
+    # Nothing changes, nothing is emitted.
+    assert table.apply([("claire", "design", "Team_Lead", None)]) == []
+    assert len(received) == 1
+
+    changed = table.apply([("ada", "tech", "Mid", None)])
+    assert table.version == 3
+    assert table.get_changes(1) == [
+        table.records[("claire", "design")],
+        table.records[("ada", "tech")],
+    ]
+    assert table.get_changes(2) == changed
+    assert table.get_changes(3) == []
+
+    with open(f"{data_path}/user_referential.csv", "a") as f:
+        f.write("claire,design,Team_Lead,\n")
+        f.write("ada,tech,Mid,\n")
+    assert list(table.records.values()) == list(iter_salaries(data_path, 10))
@@ -0,0 +1,91 @@
+import json
+
+import pandas as pd
+from click.testing import CliRunner
+
+from palo.generate_salary_grid_and_badge_referential import (
+    iter_badge_referential,
+    main,
+    read_spec,
+)
+from palo.main import calculate_salaries, fetch_data
+
+
+def generate(data_path, seed):
+    result = CliRunner().invoke(
+        main,
+        [
+            "--data_path",
+            data_path,
+            "--hives",
+            "3",
+            "--users",
+            "20",
+            "--events",
+            "40",
+            "--seed",
+            str(seed),
+        ],
+    )
+    assert result.exit_code == 0, result.output
+    with open(f"{data_path}/user_referential.csv") as f:
+        return f.read()
+
+
+def test_generated_users_are_deterministic_and_valid(tmp_path):
+    data_path = str(tmp_path)
+    assert generate(data_path, seed=1) == generate(data_path, seed=1)
+    assert generate(data_path, seed=1) != generate(data_path, seed=2)
+
+    user_referential = fetch_data(f"{data_path}/user_referential.csv")
+    assert set(user_referential["hive"]) <= {"tech", "design", "hive2"}
+    earned = user_referential.dropna(subset=["badgeName"])
+    assert not earned.duplicated(subset=["username", "badgeName"]).any()
+
+    salaries = calculate_salaries(
+        None,
+        fetch_data(f"{data_path}/salary_grid.csv"),
+        user_referential,
+        fetch_data(f"{data_path}/badge_referential.csv"),
+    )
+    assert len(salaries) == 20
+    assert salaries["salary"].notna().all()
+
+
+def test_spec(tmp_path):
+    spec = {
+        "hives": [f"hive{i}" for i in range(4)],
+        "badges_per_level": {
+            "Director": {"bronze": 3, "silver": 1},
+            "Mid": {"bronze": 500, "silver": 700},
+        },
+        "starting_base_salaries": {"hive0": 30000},
+    }
+    spec_path = tmp_path / "spec.json"
+    spec_path.write_text(json.dumps(spec))
+    args = ["--data_path", str(tmp_path), "--spec", str(spec_path), "--users", "5"]
+    result = CliRunner().invoke(main, args)
+    assert result.exit_code == 0, result.output
+
+    badge_referential = pd.read_csv(tmp_path / "badge_referential.csv")
+    assert len(badge_referential) == 4 * (3 + 1 + 500 + 700)
+    assert badge_referential["badgeName"].is_unique
+    counts = badge_referential.groupby(["levelName", "badgeType"]).size()
+    assert counts[("Mid", "silver")] == 4 * 700
+    salary_grid = pd.read_csv(tmp_path / "salary_grid.csv")
+    assert len(salary_grid) == 4 * 5
+    assert salary_grid["baseSalary"].values[0] == 30000
+    user_referential = pd.read_csv(tmp_path / "user_referential.csv")
+    assert user_referential["username"].nunique() == 5
+    assert set(user_referential["hive"]) <= set(spec["hives"])
+    # The catalog only depends on the spec.
+    chunks = list(iter_badge_referential(read_spec(str(spec_path)), chunk_size=64))
+    assert max(len(chunk) for chunk in chunks) == 64
+    pd.testing.assert_frame_equal(
+        pd.concat(chunks, ignore_index=True), badge_referential
+    )
+
+    spec_path.write_text(json.dumps({"badges_per_level": {"Junior": {"bronze": 1}}}))
+    result = CliRunner().invoke(main, args)
+    assert result.exit_code == 2
+    assert "Unknown level Junior" in result.output
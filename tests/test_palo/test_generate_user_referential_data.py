@@ -0,0 +1,166 @@
+import pytest
+from click.testing import CliRunner
+
+from palo.data_models import User
+from palo.engine import load_engine
+from palo.generate_user_referential_data import (
+    earn_badge,
+    join_user,
+    main,
+    upgrade_level,
+)
+from palo.main import fetch_data
+from palo.main import main as salary_main
+
+
+def test_join_user_then_earn_badge(data_path):
+    badge_referential = fetch_data(f"{data_path}/badge_referential.csv")
+    next_badge = badge_referential.loc[
+        (badge_referential["hive"] == "tech")
+        & (badge_referential["levelName"] == "Senior")
+    ]["badgeName"].values[0]
+    user = User(username="ada", hive="tech", level_name="Mid", badge_names=())
+    join_user(user, data_path, load_engine(data_path))
+
+    user_referential = fetch_data(f"{data_path}/user_referential.csv")
+    rows = user_referential.loc[user_referential["username"] == "ada"]
+    assert len(rows) == 17
+    assert set(rows["levelName"]) == {"Mid"}
+
+    user = User(username="ada", hive="tech", level_name=None, badge_names=(next_badge,))
+    earn_badge(user, data_path, load_engine(data_path))
+
+    user_referential = fetch_data(f"{data_path}/user_referential.csv")
+    rows = user_referential.loc[user_referential["username"] == "ada"]
+    assert len(rows) == 18
+    assert rows["badgeName"].values[-1] == next_badge
+
+
+def test_join_user_twice(data_path):
+    user = User(username="claire", hive="design", level_name="Mid", badge_names=())
+    with pytest.raises(ValueError, match="already exists"):
+        join_user(user, data_path, load_engine(data_path))
+
+
+def test_events_file(data_path, tmp_path):
+    events_file = tmp_path / "events.csv"
+    events_file.write_text(
+        "action,username,hive,level_name,badge_names\n"
+        "join_user,ada,tech,Mid,\n"
+        # Sees the user joined on the line above.
+        "upgrade_level,ada,tech,Senior,\n"
+        "join_user,ada,tech,Mid,\n"
+        "earn_badge,bob,tech,,unknown\n"
+    )
+    result = CliRunner().invoke(
+        main, ["--events_file", events_file, "--data_path", data_path]
+    )
+    assert result.exit_code == 0, result.output
+    assert "Rejected event on line 4: This user ada already exists" in result.stderr
+    assert "Rejected event on line 5: username bob not found" in result.stderr
+    assert "Appended 18 rows to user_referential, rejected 2 events." in result.stdout
+
+    user_referential = fetch_data(f"{data_path}/user_referential.csv")
+    rows = user_referential.loc[user_referential["username"] == "ada"]
+    assert list(rows["levelName"]) == ["Mid"] * 17 + ["Senior"]
+
+
+def test_write_rules(data_path):
+    badge_referential = fetch_data(f"{data_path}/badge_referential.csv")
+
+    def get_badge(hive, level_name):
+        return badge_referential.loc[
+            (badge_referential["hive"] == hive)
+            & (badge_referential["levelName"] == level_name)
+        ]["badgeName"].values[0]
+
+    engine = load_engine(data_path)
+    # claire is a Senior of design who already has the Mid badges.
+    claire = {"username": "claire", "hive": "design"}
+    invalid = [
+        (
+            upgrade_level,
+            User(**claire, level_name="Senior", badge_names=()),
+            "already Senior",
+        ),
+        (
+            upgrade_level,
+            User(**claire, level_name="Director", badge_names=()),
+            "one level at a time",
+        ),
+        (
+            earn_badge,
+            User(**claire, level_name=None, badge_names=(get_badge("design", "Mid"),)),
+            "already earned",
+        ),
+        (
+            earn_badge,
+            User(
+                **claire,
+                level_name=None,
+                badge_names=(get_badge("design", "Director"),),
+            ),
+            "can only earn Senior or Team_Lead badges",
+        ),
+        (
+            earn_badge,
+            User(
+                **claire, level_name=None, badge_names=(get_badge("tech", "Team_Lead"),)
+            ),
+            "can only earn Senior or Team_Lead badges of design",
+        ),
+        (
+            upgrade_level,
+            User(username="claire", hive="tech", level_name="Senior", badge_names=()),
+            "not found in the hive tech",
+        ),
+    ]
+    for action, user, message in invalid:
+        with pytest.raises(Exception, match=message):
+            action(user, data_path, engine)
+
+    next_badge = get_badge("design", "Team_Lead")
+    user = User(**claire, level_name=None, badge_names=(next_badge, next_badge))
+    with pytest.raises(ValueError, match="already earned"):
+        earn_badge(user, data_path, engine)
+    user = User(**claire, level_name=None, badge_names=(next_badge,))
+    earn_badge(user, data_path, engine)
+    upgrade_level(
+        User(**claire, level_name="Team_Lead", badge_names=()),
+        data_path,
+        engine,
+    )
+    user_referential = fetch_data(f"{data_path}/user_referential.csv")
+    assert list(
+        user_referential["badgeName"].astype(object).fillna("").values[-2:]
+    ) == [
+        next_badge,
+        "",
+    ]
+
+
+def test_hive_of_the_salary_grid(data_path):
+    # A new hive, ops, with the salaries and badges of tech.
+    for table in ["salary_grid", "badge_referential"]:
+        df = fetch_data(f"{data_path}/{table}.csv").astype(object)
+        ops = df.loc[df["hive"] == "tech"].assign(hive="ops")
+        if "badgeName" in ops:
+            ops["badgeName"] = ops["badgeName"].str.replace("tech", "ops")
+        ops.to_csv(f"{data_path}/{table}.csv", mode="a", header=False, index=False)
+
+    arguments = ["--username", "ada", "--data_path", data_path]
+    result = CliRunner().invoke(
+        main,
+        ["--action", "join_user", "--level_name", "Mid", "--hive", "ops", *arguments],
+    )
+    assert result.exit_code == 0, result.output
+    result = CliRunner().invoke(salary_main, ["--hive", "ops", *arguments])
+    assert result.exit_code == 0, result.output
+    assert result.output.split()[0] == "42700.0"
+
+    # Hives which are not in the salary grid are rejected by the validation.
+    result = CliRunner().invoke(
+        main,
+        ["--action", "join_user", "--level_name", "Mid", "--hive", "sales", *arguments],
+    )
+    assert "hive sales not found in the database" in str(result.exception)
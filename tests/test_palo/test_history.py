@@ -0,0 +1,169 @@
+import json
+from pathlib import Path
+
+from click.testing import CliRunner
+
+from palo.generate_user_referential_data import add_records_to_database
+from palo.history import START, History, parse_as_of
+from palo.main import fetch_data
+from palo.main import main as salary_main
+from palo.snapshot import UserState
+
+
+def test_history(data_path):
+    # claire is upgraded to Team_Lead on the 2nd of May.
+    add_records_to_database(
+        [
+            {
+                "username": "claire",
+                "hive": "design",
+                "levelName": "Team_Lead",
+                "badgeName": None,
+                "timestamp": parse_as_of("2024-05-02T09:00:00"),
+            }
+        ],
+        data_path,
+        table="user_referential",
+    )
+    log = fetch_data(f"{data_path}/user_referential.csv")
+    rows = list(zip(log["username"], log["hive"], log["levelName"], log["badgeName"]))
+
+    history = History(data_path, checkpoint_interval=7)
+    for sequence in [0, 1, 7, 20, 38, len(rows)]:
+        state, last = history.get_state(sequence=sequence)
+        expected = UserState()
+        expected.apply(rows[:sequence])
+        assert last == sequence
+        assert state.levels == expected.levels
+        assert state.earned == expected.earned
+    assert [checkpoint.sequence for checkpoint in history.checkpoints] == [
+        7,
+        14,
+        21,
+        28,
+        35,
+    ]
+    # A checkpoint only holds the users changed since the previous one.
+    with open(history.get_checkpoint_path(history.checkpoints[1])) as f:
+        changed = {(user["username"], user["hive"]) for user in json.load(f)}
+    assert changed == {(row[0], row[1]) for row in rows[7:14]}
+    # Reloaded from the index.
+    assert History(data_path, checkpoint_interval=7).checkpoints == (
+        history.checkpoints
+    )
+
+    state, last = history.get_state(timestamp=parse_as_of("2024-05-01"))
+    assert last == len(rows) - 1
+    assert state.get_current_level("claire", "design") == "Senior"
+    state, last = history.get_state(timestamp=parse_as_of("2024-05-02"))
+    assert last == len(rows)
+    assert state.get_current_level("claire", "design") == "Team_Lead"
+
+    result = CliRunner().invoke(
+        salary_main,
+        [
+            "--username",
+            "claire",
+            "--hive",
+            "design",
+            "--as_of",
+            "2024-05-01",
+            "--data_path",
+            data_path,
+        ],
+    )
+    assert result.exit_code == 0, result.output
+    assert result.output.split()[0] == "49673.333333333336"
+
+
+def test_history_of_regenerated_log(data_path):
+    history = History(data_path, checkpoint_interval=7)
+    history.update()
+    assert len(history.checkpoints) == 5
+
+    # A larger log: the offsets of the checkpoints are still in the file.
+    log_path = Path(data_path) / "user_referential.csv"
+    header = log_path.read_bytes().splitlines(keepends=True)[0]
+    with open(log_path, "wb") as f:
+        f.write(header)
+        for i in range(100):
+            f.write(f"user{i:03d},tech,Junior,,\r\n".encode())
+
+    history = History(data_path, checkpoint_interval=7)
+    assert history.checkpoints == []
+    state, last = history.get_state(sequence=50)
+    assert last == 50
+    assert state.usernames == {f"user{i:03d}" for i in range(50)}
+    assert [checkpoint.sequence for checkpoint in history.checkpoints][:2] == [7, 14]
+
+
+def test_timestamps_added_to_old_logs(data_path):
+    # The sample log was created before timestamps were recorded.
+    log_path = Path(data_path) / "user_referential.csv"
+    lines = log_path.read_text().splitlines()
+    assert "timestamp" not in lines[0]
+    add_records_to_database(
+        [
+            {
+                "username": "claire",
+                "hive": "design",
+                "levelName": "Team_Lead",
+                "badgeName": None,
+                "timestamp": parse_as_of("2024-05-02T09:00:00"),
+            }
+        ],
+        data_path,
+        table="user_referential",
+    )
+    log = fetch_data(f"{data_path}/user_referential.csv")
+    assert list(log.columns) == [
+        "username",
+        "hive",
+        "levelName",
+        "badgeName",
+        "timestamp",
+    ]
+    assert log["timestamp"].isna().sum() == len(lines) - 1
+    assert log["timestamp"].iloc[-1] == parse_as_of("2024-05-02T09:00:00")
+
+    state, _ = History(data_path).get_state(timestamp=parse_as_of("2024-05-01"))
+    assert state.get_current_level("claire", "design") == "Senior"
+
+
+def test_history_folds_up_to_the_event(data_path):
+    history = History(data_path, checkpoint_interval=7)
+    state, last = history.get_state(sequence=10)
+    assert last == 10
+    # Checkpoints are only added for the events folded.
+    assert [checkpoint.sequence for checkpoint in history.checkpoints] == [7]
+    history.get_state(sequence=3)
+    assert [checkpoint.sequence for checkpoint in history.checkpoints] == [7]
+    history.update()
+    assert [checkpoint.sequence for checkpoint in history.checkpoints][-1] == 35
+
+
+def test_replay_offsets_of_quoted_newlines(data_path):
+    add_records_to_database(
+        [
+            {
+                "username": "claire",
+                "hive": "design",
+                "levelName": "Senior",
+                "badgeName": "design-two\nlines",
+            },
+            {
+                "username": "claire",
+                "hive": "design",
+                "levelName": "Team_Lead",
+                "badgeName": None,
+            },
+        ],
+        data_path,
+        table="user_referential",
+    )
+    content = (Path(data_path) / "user_referential.csv").read_bytes()
+    (row, offset), (last_row, last_offset) = list(History(data_path).replay(START))[-2:]
+    assert row["badgeName"] == "design-two\nlines"
+    assert content[offset:].startswith(b"claire,design,Team_Lead,")
+    assert last_row["levelName"] == "Team_Lead"
+    assert last_offset == len(content)
@@ -0,0 +1,58 @@
+import json
+
+from click.testing import CliRunner
+
+from palo import instrumentation
+from palo.instrumentation import add_hook, count, remove_hook, session, stage
+from palo.main import main as salary_main
+
+
+def test_nothing_is_recorded_without_a_session():
+    with stage("fetch_data"):
+        count("rows_scanned", 10)
+    assert instrumentation._metrics is None
+    with session("command") as metrics:
+        assert metrics is None
+
+
+def test_hooks_receive_the_metrics_of_the_command(data_path):
+    received = []
+    add_hook(received.append)
+    try:
+        result = CliRunner().invoke(
+            salary_main,
+            ["--username", "claire", "--hive", "design", "--data_path", data_path],
+        )
+    finally:
+        remove_hook(received.append)
+    assert result.exit_code == 0, result.output
+    # Recorded for the hook, but not reported without --profile.
+    assert result.stderr == ""
+
+    (metrics,) = received
+    assert metrics.command == "palo.main"
+    assert {"load_engine", "validate", "calculate_salary", "total"} <= set(
+        metrics.timings
+    )
+    assert metrics.counters["rows_scanned"] > 0
+    assert instrumentation._metrics is None
+
+
+def test_profile_json(data_path, tmp_path):
+    output = tmp_path / "profile.json"
+    result = CliRunner().invoke(
+        salary_main,
+        [
+            "--all",
+            "--data_path",
+            data_path,
+            "--profile",
+            "json",
+            "--profile_output",
+            output,
+        ],
+    )
+    assert result.exit_code == 0, result.output
+    report = json.loads(output.read_text())
+    assert report["calls"]["fetch_data"] == 3
+    assert report["timings"]["total"] >= report["timings"]["calculate_salaries"]
@@ -0,0 +1,100 @@
+import pandas as pd
+import pytest
+
+from palo.data_models import User
+from palo.main import (
+    calculate_salaries,
+    calculate_salary,
+    fetch_data,
+    get_all_badges,
+    get_badge_value,
+    get_badge_value_for_next_level,
+    get_badges_earned,
+    get_base_salary,
+    get_current_level,
+)
+
+
+@pytest.fixture()
+def referentials(data_path):
+    return (
+        fetch_data(f"{data_path}/salary_grid.csv"),
+        fetch_data(f"{data_path}/user_referential.csv"),
+        fetch_data(f"{data_path}/badge_referential.csv"),
+    )
+
+
+# Salaries of the per-user formula of the original calculate_salary. A Junior
+# has no badge to complete and no previous level: the base salary.
+EXPECTED_SALARIES = {
+    ("pallav", "tech"): 79308.33333333333,
+    ("claire", "design"): 49673.333333333336,
+    ("pallav_senior", "tech"): 69490.83333333333,
+    ("newbie", "tech"): 18000.0,
+}
+
+
+def test_calculate_salaries(referentials):
+    salary_grid, user_referential, badge_referential = referentials
+    # pallav before the upgrade to Team_Lead has badges of the next level.
+    before_upgrade = user_referential.iloc[:19].assign(username="pallav_senior")
+    junior = pd.DataFrame(
+        [{"username": "newbie", "hive": "tech", "levelName": "Junior"}]
+    )
+    user_referential = pd.concat(
+        [user_referential, before_upgrade, junior], ignore_index=True
+    )
+
+    salaries = calculate_salaries(
+        None, salary_grid, user_referential, badge_referential
+    )
+
+    assert len(salaries) == len(EXPECTED_SALARIES)
+    for row in salaries.itertuples():
+        expected = EXPECTED_SALARIES[(row.username, row.hive)]
+        assert row.salary == pytest.approx(expected)
+        user = User(
+            username=row.username, hive=row.hive, level_name=None, badge_names=None
+        )
+        assert calculate_salary(
+            user, salary_grid, user_referential, badge_referential
+        ) == pytest.approx(expected)
+
+
+def test_single_user_helpers(referentials):
+    salary_grid, user_referential, badge_referential = referentials
+    user = User(username="pallav", hive="tech", level_name=None, badge_names=None)
+    assert get_current_level(user, user_referential) == "Team_Lead"
+    assert get_base_salary("Team_Lead", salary_grid, user) == 87100.0
+    total = get_badge_value(
+        "Team_Lead", salary_grid, badge_referential, user_referential, user, True
+    )
+    earned = get_badge_value(
+        "Team_Lead", salary_grid, badge_referential, user_referential, user
+    )
+    assert total - earned == pytest.approx(7791.666666666666)
+    assert get_badge_value_for_next_level(
+        "Team_Lead", salary_grid, badge_referential, user_referential, user
+    ) == pytest.approx(0.0)
+    bronze = get_all_badges("Senior", "tech", "bronze", badge_referential)
+    assert bronze == (
+        badge_referential.loc[
+            (badge_referential["hive"] == "tech")
+            & (badge_referential["levelName"] == "Senior")
+            & (badge_referential["badgeType"] == "bronze"),
+            "badgeName",
+        ].tolist()
+    )
+    earned_bronze = get_badges_earned(
+        "Senior", user, "bronze", badge_referential, user_referential
+    )
+    assert earned_bronze == [
+        badge for badge in bronze if badge in set(user_referential["badgeName"])
+    ]
+
+
+def test_calculate_salaries_unknown_user(referentials):
+    salary_grid, user_referential, badge_referential = referentials
+    user = User(username="nobody", hive="tech", level_name=None, badge_names=None)
+    with pytest.raises(Exception, match="nobody"):
+        calculate_salaries([user], salary_grid, user_referential, badge_referential)
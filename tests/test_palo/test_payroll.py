@@ -0,0 +1,75 @@
+import pandas as pd
+
+from palo.generate_salary_grid_and_badge_referential import (
+    generate_data_for_badge_referential,
+    generate_data_for_salary_grid,
+    generate_data_for_user_referential,
+    get_default_spec,
+)
+from palo.main import calculate_salaries
+from palo.payroll import (
+    calculate_salaries_in_parallel,
+    calculate_salaries_of_shards,
+    split_user_referential,
+)
+from palo.reshard import reshard
+from palo.storage import get_storage
+
+
+def test_calculate_salaries_in_parallel():
+    spec = get_default_spec(3)
+    badge_referential = generate_data_for_badge_referential(spec)
+    salary_grid = generate_data_for_salary_grid(spec)
+    user_referential = pd.DataFrame(
+        generate_data_for_user_referential(
+            badge_referential, list(spec.hives), 200, 20, seed=3
+        )
+    )
+
+    partitions = split_user_referential(user_referential, 4)
+    assert sum(len(partition) for partition in partitions) == len(user_referential)
+    users = [set(zip(p["username"], p["hive"])) for p in partitions]
+    assert sum(len(u) for u in users) == len(set().union(*users))
+
+    expected = calculate_salaries(
+        None, salary_grid, user_referential, badge_referential
+    )
+    salaries = calculate_salaries_in_parallel(
+        salary_grid, user_referential, badge_referential, workers=2
+    )
+    pd.testing.assert_frame_equal(salaries, expected)
+
+
+def test_calculate_salaries_of_shards(tmp_path):
+    spec = get_default_spec(3)
+    badge_referential = generate_data_for_badge_referential(spec)
+    salary_grid = generate_data_for_salary_grid(spec)
+    user_referential = pd.DataFrame(
+        generate_data_for_user_referential(
+            badge_referential, list(spec.hives), 200, 20, seed=3
+        )
+    )
+    user_referential.to_csv(tmp_path / "user_referential.csv", index=False)
+    reshard(str(tmp_path), 4)
+    storage = get_storage(str(tmp_path))
+
+    expected = calculate_salaries(
+        None,
+        salary_grid,
+        storage.fetch_table("user_referential"),
+        badge_referential,
+    )
+    salaries = calculate_salaries_of_shards(
+        storage, salary_grid, badge_referential, workers=2
+    )
+    pd.testing.assert_frame_equal(salaries, expected)
+
+    hive = spec.hives[1]
+    salaries = calculate_salaries_of_shards(
+        storage, salary_grid, badge_referential, workers=2, hive=hive
+    )
+    pd.testing.assert_frame_equal(
+        salaries,
+        expected.loc[expected["hive"] == hive].reset_index(drop=True),
+        check_categorical=False,
+    )
@@ -0,0 +1,88 @@
+import pandas as pd
+import pytest
+
+from palo.constants import BADGE_TYPE_WEIGHTS, BADGE_VALUE_SHARE
+from palo.data_models import User
+from palo.engine import SalaryEngine
+from palo.generate_user_referential_data import add_records_to_database
+from palo.instrumentation import session
+from palo.main import calculate_salary, fetch_data, get_badge_unit_values
+from palo.plan import SalaryPlan, get_salary_plan
+from palo.storage import get_storage
+
+
+def test_salary_plan():
+    salary_grid = {
+        "hive": ["tech", "tech", "tech", "design"],
+        "levelName": ["Junior", "Mid", "Senior", "Senior"],
+        "baseSalary": ["20000", "30000", "45000", "50000"],
+    }
+    badge_referential = {
+        "hive": ["tech", "tech", "tech", "tech", "design"],
+        "levelName": ["Mid", "Mid", "Mid", "Senior", "Senior"],
+        "badgeType": ["bronze", "bronze", "silver", "bronze", "bronze"],
+    }
+    plan = SalaryPlan(salary_grid, badge_referential)
+
+    mid = plan.get_level("tech", "Mid")
+    total = BADGE_VALUE_SHARE * 10000
+    assert mid.total_badge_value == pytest.approx(total)
+    assert mid.unit_bronze == pytest.approx(total / 2 * BADGE_TYPE_WEIGHTS["bronze"])
+    assert mid.unit_silver == pytest.approx(total * BADGE_TYPE_WEIGHTS["silver"])
+    assert mid.get_badge_value(1, 1) == pytest.approx(mid.unit_bronze + mid.unit_silver)
+    # No silver badge in the level, no previous level in the grid.
+    assert plan.get_level("tech", "Senior").unit_silver == 0
+    assert plan.get_level("design", "Senior").total_badge_value == 0
+    assert plan.get_level("tech", "Junior").total_badge_value == 0
+
+    # The pandas tables give the same plan.
+    frame = get_badge_unit_values(
+        pd.DataFrame(salary_grid), pd.DataFrame(badge_referential)
+    )
+    assert frame.set_index(["hive", "levelName"])["unitBronze"].to_dict() == {
+        key: level.unit_bronze for key, level in plan.levels.items()
+    }
+
+
+def test_salary_plan_is_reused(data_path):
+    salary_grid = fetch_data(f"{data_path}/salary_grid.csv")
+    badge_referential = fetch_data(f"{data_path}/badge_referential.csv")
+    user_referential = fetch_data(f"{data_path}/user_referential.csv")
+    plan = SalaryPlan(salary_grid, badge_referential)
+    engine = SalaryEngine(salary_grid, user_referential, badge_referential, plan=plan)
+    assert engine.plan is plan
+
+    user = User(username="pallav", hive="tech", level_name=None, badge_names=None)
+    assert calculate_salary(
+        user, salary_grid, user_referential, badge_referential, plan=plan
+    ) == pytest.approx(engine.calculate_salary(user))
+
+
+def test_get_salary_plan_invalidation(data_path, tmp_path):
+    storage = get_storage(data_path)
+
+    with session("test", "json", str(tmp_path / "metrics.json")) as metrics:
+        plan = get_salary_plan(storage)
+        assert get_salary_plan(storage) is plan
+    assert metrics.counters["plan_cache_hits"] == 1
+
+    # A new badge changes the unit values of its level.
+    level = plan.get_level("tech", "Mid")
+    add_records_to_database(
+        [
+            {
+                "badgeName": "tech-silver-Mid-new",
+                "badgeType": "silver",
+                "levelName": "Mid",
+                "hive": "tech",
+            }
+        ],
+        data_path,
+        table="badge_referential",
+    )
+    new_plan = get_salary_plan(storage)
+    assert new_plan is not plan
+    new_level = new_plan.get_level("tech", "Mid")
+    assert new_level.total_silver == level.total_silver + 1
+    assert new_level.unit_silver < level.unit_silver
+    assert get_salary_plan(storage) is new_plan
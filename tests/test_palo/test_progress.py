@@ -0,0 +1,91 @@
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+from click.testing import CliRunner
+
+from palo.data_models import User
+from palo.engine import load_engine
+from palo.generate_salary_grid_and_badge_referential import main as generate
+from palo.main import calculate_salaries, fetch_data
+from palo.progress import BadgeMatrix, load_badge_matrix, main
+
+
+@pytest.fixture
+def data_path(tmp_path):
+    result = CliRunner().invoke(
+        generate,
+        ["--data_path", str(tmp_path), "--users", "200", "--events", "30"],
+    )
+    assert result.exit_code == 0, result.output
+    return str(tmp_path)
+
+
+def test_badge_matrix_matches_engine(data_path):
+    matrix = load_badge_matrix(data_path)
+    engine = load_engine(data_path)
+    assert matrix.shape == (200, len(fetch_data(f"{data_path}/badge_referential.csv")))
+
+    mask = matrix.get_mask(level_name="Mid", badge_type="silver")
+    per_user = matrix.count_earned(mask)
+    for code, (username, hive) in enumerate(list(engine.levels)[:50]):
+        assert matrix.user_codes[(username, hive)] == code
+        user = User(username=username, hive=hive)
+        for level_name in ["Junior", "Mid", "Senior"]:
+            for badge_type in ["bronze", "silver"]:
+                earned = engine.get_badges_earned(level_name, user, badge_type)
+                assert matrix.get_badges_earned(level_name, user, badge_type) == earned
+        assert per_user[code] == len(engine.get_badges_earned("Mid", user, "silver"))
+
+    # Per badge counts are the transposed product.
+    assert matrix.count_users().sum() == len(matrix.indices)
+    users = matrix.count_users(matrix.users["hive"].to_numpy(dtype=object) == "tech")
+    assert users[matrix.get_mask(hive="design")].sum() == 0
+
+
+def test_badge_matrix_matches_salaries(data_path):
+    salary_grid = fetch_data(f"{data_path}/salary_grid.csv")
+    user_referential = fetch_data(f"{data_path}/user_referential.csv")
+    badge_referential = fetch_data(f"{data_path}/badge_referential.csv")
+    salaries = calculate_salaries(
+        None, salary_grid, user_referential, badge_referential, progress=True
+    )
+    matrix = BadgeMatrix(user_referential, badge_referential)
+    assert matrix.users["username"].tolist() == salaries["username"].tolist()
+
+    values = matrix.get_badge_values(salary_grid)
+    np.testing.assert_allclose(
+        matrix.get_level_weights(values, next_level=True),
+        salaries["nextLevelBadgeValue"],
+    )
+
+    ones = np.ones(matrix.shape[1])
+    for next_level, column in [
+        (False, "badgeCompletion"),
+        (True, "nextLevelBadgeCompletion"),
+    ]:
+        missing = matrix.count_missing(next_level)
+        earned = matrix.get_level_weights(ones, next_level)
+        with np.errstate(invalid="ignore"):
+            completion = earned / (earned + missing)
+        np.testing.assert_allclose(completion, salaries[column])
+
+    near = matrix.get_users_missing(2, next_level=True)
+    assert near["missingBadges"].between(1, 2).all()
+    assert len(near) == ((missing >= 1) & (missing <= 2)).sum()
+
+
+def test_progress_command(data_path):
+    result = CliRunner().invoke(
+        main, ["--data_path", data_path, "--hive", "tech", "--least_earned", "5"]
+    )
+    assert result.exit_code == 0, result.output
+    badges = pd.read_csv(io.StringIO(result.output))
+    assert len(badges) == 5
+    assert set(badges["hive"]) == {"tech"}
+    assert badges["users"].is_monotonic_increasing
+
+    result = CliRunner().invoke(main, ["--data_path", data_path])
+    assert result.exit_code == 2
+    assert "Pass --missing, --least_earned or both." in result.output
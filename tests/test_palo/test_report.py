@@ -0,0 +1,76 @@
+import io
+import json
+
+import pandas as pd
+import pytest
+from click.testing import CliRunner
+
+from palo.engine import load_engine
+from palo.generate_salary_grid_and_badge_referential import main as generate
+from palo.main import calculate_salaries, fetch_data
+from palo.report import get_report, main, write_report
+from palo.streaming import UserKey
+
+
+@pytest.fixture
+def data_path(tmp_path):
+    result = CliRunner().invoke(
+        generate,
+        ["--data_path", str(tmp_path), "--users", "300", "--events", "30"],
+    )
+    assert result.exit_code == 0, result.output
+    return str(tmp_path)
+
+
+def test_report_matches_salaries(data_path):
+    salaries = calculate_salaries(
+        None,
+        fetch_data(f"{data_path}/salary_grid.csv"),
+        fetch_data(f"{data_path}/user_referential.csv"),
+        fetch_data(f"{data_path}/badge_referential.csv"),
+        progress=True,
+    )
+    report = get_report(salaries, near_promotion=0.5)
+
+    engine = load_engine(data_path)
+    expected = pd.DataFrame(
+        engine.get_salary_record(UserKey(*key)) for key in engine.levels
+    )
+    by_level = expected.groupby(["hive", "levelName"])["salary"]
+    levels = report.dropna(subset=["levelName"]).set_index(["hive", "levelName"])
+    assert levels["payroll"].to_dict() == pytest.approx(by_level.sum().to_dict())
+    assert levels["users"].to_dict() == by_level.size().to_dict()
+
+    hives = report.loc[report["levelName"].isna() & report["hive"].notna()]
+    assert hives.set_index("hive")["payroll"].to_dict() == pytest.approx(
+        expected.groupby("hive")["salary"].sum().to_dict()
+    )
+    total = report.iloc[-1]
+    assert total["users"] == 300
+    assert total["payroll"] == pytest.approx(expected["salary"].sum())
+    assert total["nextLevelBadgeSpend"] == pytest.approx(
+        expected["nextLevelBadgeValue"].sum()
+    )
+    assert (
+        total["usersNearPromotion"]
+        == (salaries["nextLevelBadgeCompletion"] >= 0.5).sum()
+    )
+    assert 0 <= total["meanBadgeCompletion"] <= 1
+
+    f = io.StringIO()
+    write_report(report, "jsonl", f)
+    records = [json.loads(line) for line in f.getvalue().splitlines()]
+    assert len(records) == len(report)
+    assert records[-1]["hive"] is None
+
+
+def test_report_command(data_path):
+    result = CliRunner().invoke(main, ["--data_path", data_path, "--hive", "tech"])
+    assert result.exit_code == 0, result.output
+    report = pd.read_csv(io.StringIO(result.output))
+    assert set(report["hive"].dropna()) == {"tech"}
+    assert report.iloc[-1]["users"] == report.iloc[-2]["users"]
+
+    result = CliRunner().invoke(main, ["--data_path", data_path, "--hive", "sales"])
+    assert result.exit_code == 1
+    assert "hive sales not found" in str(result.exception)
@@ -0,0 +1,105 @@
+import json
+import threading
+
+from click.testing import CliRunner
+
+from palo.generate_user_referential_data import add_records_to_database
+from palo.instrumentation import session
+from palo.main import fetch_data
+from palo.reshard import main as reshard
+from palo.storage import (
+    CsvStorage,
+    ShardedCsvStorage,
+    get_shard,
+    get_storage,
+    locked,
+)
+
+
+def get_rows(data_path, username, hive):
+    rows = fetch_data(
+        f"{data_path}/user_referential.csv",
+        where={"username": username, "hive": hive},
+        columns=["levelName", "badgeName"],
+    )
+    return rows.astype(object).fillna("").values.tolist()
+
+
+def test_reshard(data_path, tmp_path, monkeypatch):
+    # Several batches of rows.
+    monkeypatch.setattr("palo.reshard.RESHARD_BATCH_SIZE", 7)
+    claire = get_rows(data_path, "claire", "design")
+    pallav = get_rows(data_path, "pallav", "tech")
+
+    result = CliRunner().invoke(reshard, ["--data_path", data_path, "--shards", "3"])
+    assert result.exit_code == 0, result.output
+    assert result.output == (
+        "Resharded 40 rows of user_referential into 3 shards per hive.\n"
+    )
+    assert isinstance(get_storage(data_path), ShardedCsvStorage)
+    manifest = json.loads((tmp_path / "user_referential" / "manifest.json").read_text())
+    assert manifest["number_shards"] == 3
+    assert manifest["version"] == 1
+    directory = tmp_path / "user_referential" / "v1"
+    assert (directory / "design" / f"{get_shard('claire', 3):04d}.csv").exists()
+
+    # The rows of a user are read from their shard only.
+    with session("test", "json", str(tmp_path / "metrics.json")) as metrics:
+        assert get_rows(data_path, "claire", "design") == claire
+    assert metrics.counters["rows_scanned"] == len(claire)
+
+    # Appends go to the shard of the user, created on first use.
+    add_records_to_database(
+        [{"username": "ada", "hive": "tech", "levelName": "Mid", "badgeName": None}],
+        data_path,
+        table="user_referential",
+    )
+    shard = directory / "tech" / f"{get_shard('ada', 3):04d}.csv"
+    assert shard.read_text().splitlines()[0] == (
+        "username,hive,levelName,badgeName,timestamp"
+    )
+    log_mode = (tmp_path / "user_referential.csv").stat().st_mode
+    assert shard.stat().st_mode & 0o777 == log_mode & 0o777
+    assert get_rows(data_path, "ada", "tech") == [["Mid", ""]]
+
+    # Resharding keeps the rows of every user in order.
+    result = CliRunner().invoke(reshard, ["--data_path", data_path, "--shards", "5"])
+    assert result.exit_code == 0, result.output
+    assert "Resharded 41 rows" in result.output
+    assert get_rows(data_path, "claire", "design") == claire
+    assert get_rows(data_path, "pallav", "tech") == pallav
+    assert len(fetch_data(f"{data_path}/user_referential.csv")) == 41
+
+    # Readers of the previous version can finish, older versions are removed.
+    assert directory.exists()
+    result = CliRunner().invoke(reshard, ["--data_path", data_path, "--shards", "2"])
+    assert result.exit_code == 0, result.output
+    assert not directory.exists()
+    assert sorted(path.name for path in (tmp_path / "user_referential").iterdir()) == [
+        "manifest.json",
+        "v2",
+        "v3",
+    ]
+    assert get_rows(data_path, "claire", "design") == claire
+
+
+def test_append_while_resharding(data_path):
+    storage = CsvStorage(data_path)
+    record = {"username": "ada", "hive": "tech", "levelName": "Mid", "badgeName": None}
+
+    # Appends wait for a reshard in progress.
+    with locked(f"{data_path}/user_referential.lock"):
+        thread = threading.Thread(
+            target=storage.append_records, args=("user_referential", [record])
+        )
+        thread.start()
+        thread.join(0.2)
+        assert thread.is_alive()
+    thread.join()
+    assert get_rows(data_path, "ada", "tech") == [["Mid", ""]]
+
+    # A storage opened before the reshard appends to the shards.
+    result = CliRunner().invoke(reshard, ["--data_path", data_path])
+    assert result.exit_code == 0, result.output
+    storage.append_records("user_referential", [{**record, "badgeName": "b"}])
+    assert get_rows(data_path, "ada", "tech") == [["Mid", ""], ["Mid", "b"]]
@@ -0,0 +1,124 @@
+import json
+
+import numpy as np
+import pandas as pd
+from click.testing import CliRunner
+
+from palo import constants
+from palo.data_models import Scenario
+from palo.generate_salary_grid_and_badge_referential import (
+    generate_data_for_badge_referential,
+    generate_data_for_salary_grid,
+    generate_data_for_user_referential,
+    get_default_spec,
+)
+from palo.main import calculate_salaries
+from palo.scenarios import BASELINE, ScenarioEngine, main
+
+
+def test_scenarios_match_calculate_salaries(monkeypatch, tmp_path):
+    spec = get_default_spec(2)
+    badge_referential = generate_data_for_badge_referential(spec)
+    salary_grid = generate_data_for_salary_grid(spec)
+    user_referential = pd.DataFrame(
+        generate_data_for_user_referential(
+            badge_referential, list(spec.hives), 200, 20, seed=4
+        )
+    )
+    engine = ScenarioEngine(salary_grid, user_referential, badge_referential)
+    scenarios = [
+        Scenario(
+            name="tech seniors +5%",
+            base_salary_changes=[
+                {"hive": "tech", "level_name": "Senior", "factor": 1.05}
+            ],
+        ),
+        Scenario(name="silver 0.7", bronze_weight=0.3, silver_weight=0.7),
+    ]
+    salaries = engine.get_salaries([BASELINE, *scenarios])
+
+    baseline = calculate_salaries(
+        None, salary_grid, user_referential, badge_referential
+    )
+    np.testing.assert_allclose(salaries[0], baseline["salary"])
+
+    raised = salary_grid.copy()
+    seniors = (raised["hive"] == "tech") & (raised["levelName"] == "Senior")
+    raised.loc[seniors, "baseSalary"] *= 1.05
+    expected = calculate_salaries(None, raised, user_referential, badge_referential)
+    np.testing.assert_allclose(salaries[1], expected["salary"])
+
+    monkeypatch.setitem(constants.BADGE_TYPE_WEIGHTS, "bronze", 0.3)
+    monkeypatch.setitem(constants.BADGE_TYPE_WEIGHTS, "silver", 0.7)
+    expected = calculate_salaries(
+        None, salary_grid, user_referential, badge_referential
+    )
+    np.testing.assert_allclose(salaries[2], expected["salary"])
+
+    np.testing.assert_allclose(
+        engine.get_payrolls([BASELINE, *scenarios]), salaries.sum(axis=1)
+    )
+    np.testing.assert_allclose(
+        engine.get_deltas(scenarios, batch_size=1), salaries[1:] - salaries[0]
+    )
+
+    for table, df in [
+        ("badge_referential", badge_referential),
+        ("salary_grid", salary_grid),
+        ("user_referential", user_referential),
+    ]:
+        df.to_csv(tmp_path / f"{table}.csv", index=False)
+    scenarios_path = tmp_path / "scenarios.json"
+    scenarios_path.write_text(json.dumps([scenario.dict() for scenario in scenarios]))
+    result = CliRunner().invoke(
+        main,
+        [
+            "--scenarios",
+            scenarios_path,
+            "--deltas",
+            tmp_path / "deltas.csv",
+            "--data_path",
+            tmp_path,
+        ],
+    )
+    assert result.exit_code == 0, result.output
+    assert result.output.splitlines()[0] == "scenario,payroll,payrollDelta"
+    deltas = pd.read_csv(tmp_path / "deltas.csv")
+    assert list(deltas.columns) == [
+        "username",
+        "hive",
+        "tech seniors +5%",
+        "silver 0.7",
+    ]
+    np.testing.assert_allclose(deltas["silver 0.7"], salaries[2] - salaries[0])
+
+    scenarios_path.write_text(json.dumps([{"name": "a"}, {"name": "a"}]))
+    result = CliRunner().invoke(
+        main, ["--scenarios", scenarios_path, "--data_path", tmp_path]
+    )
+    assert result.exit_code == 2
+    assert "Scenario name a is used more than once." in result.output
+
+
+def test_scenarios_of_partial_grid():
+    spec = get_default_spec(2)
+    badge_referential = generate_data_for_badge_referential(spec)
+    salary_grid = generate_data_for_salary_grid(spec)
+    user_referential = pd.DataFrame(
+        generate_data_for_user_referential(
+            badge_referential, list(spec.hives), 100, 20, seed=4
+        )
+    )
+    # The Junior level of tech is not in the grid, nobody is at that level.
+    salary_grid = salary_grid.loc[
+        (salary_grid["hive"] != "tech") | (salary_grid["levelName"] != "Junior")
+    ]
+    user_referential = user_referential.loc[
+        (user_referential["hive"] != "tech")
+        | (user_referential["levelName"] != "Junior")
+    ]
+    engine = ScenarioEngine(salary_grid, user_referential, badge_referential)
+    expected = calculate_salaries(
+        None, salary_grid, user_referential, badge_referential
+    )
+    np.testing.assert_allclose(engine.get_salaries([BASELINE])[0], expected["salary"])
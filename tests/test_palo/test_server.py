@@ -0,0 +1,147 @@
+import http.client
+import json
+import threading
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+import pytest
+
+from palo.server import create_server
+
+
+@pytest.fixture()
+def server(data_path):
+    server = create_server(data_path, "127.0.0.1", 0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server, data_path
+    server.shutdown()
+    server.server_close()
+    server.RequestHandlerClass.service.close()
+
+
+def get(server, path, body=None):
+    url = f"http://127.0.0.1:{server.server_port}{path}"
+    data = None if body is None else json.dumps(body).encode()
+    with urlopen(Request(url, data=data)) as response:
+        return json.loads(response.read())
+
+
+def test_salary_follows_appends(server):
+    server, data_path = server
+    assert get(server, "/salary?username=claire&hive=design")["salary"] == (
+        pytest.approx(49673.333333333336)
+    )
+
+    version = get(server, "/changes")["version"]
+    with open(f"{data_path}/user_referential.csv", "a") as f:
+        f.write("claire,design,Team_Lead,\n")
+    result = get(server, "/salary?username=claire&hive=design")
+    assert result["levelName"] == "Team_Lead"
+    changes = get(server, f"/changes?since={version}")
+    assert changes["version"] == version + 1
+    assert changes["salaries"] == [result]
+
+    salaries = get(server, "/salaries", {})
+    assert {row["username"] for row in salaries} == {"pallav", "claire"}
+
+    with pytest.raises(HTTPError):
+        get(server, "/salary?username=nobody&hive=design")
+
+
+def test_events(server):
+    server, data_path = server
+    badges = [
+        "design-bronze-Team_Lead-1340920",
+        "design-bronze-Team_Lead-4391727",
+        "design-bronze-Team_Lead-7517132",
+    ]
+    before = get(server, "/salary?username=claire&hive=design")
+
+    def post(badge_name):
+        event = {
+            "action": "earn_badge",
+            "username": "claire",
+            "hive": "design",
+            "badge_names": [badge_name],
+        }
+        results.append(get(server, "/events", {"events": [event]}))
+
+    results = []
+    threads = [threading.Thread(target=post, args=(badge,)) for badge in badges]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == [{"appended": 1, "rejected": []}] * len(badges)
+    with open(f"{data_path}/user_referential.csv") as f:
+        assert sum(badge in line for line in f for badge in badges) == len(badges)
+    after = get(server, "/salary?username=claire&hive=design")
+    assert after["nextLevelBadgeValue"] > before["nextLevelBadgeValue"]
+
+    result = get(
+        server,
+        "/events",
+        {
+            "events": [
+                {
+                    "action": "upgrade_level",
+                    "username": "claire",
+                    "hive": "design",
+                    "level_name": "Team_Lead",
+                },
+                {
+                    "action": "earn_badge",
+                    "username": "claire",
+                    "hive": "design",
+                    "badge_names": [badges[0]],
+                },
+                {"action": "join_user", "username": "bob", "hive": "sales"},
+            ]
+        },
+    )
+    assert result["appended"] == 1
+    assert [error["event"] for error in result["rejected"]] == [2, 3]
+    assert get(server, "/salary?username=claire&hive=design")["levelName"] == (
+        "Team_Lead"
+    )
+
+
+def get_error(server, path, body=None):
+    with pytest.raises(HTTPError) as error:
+        get(server, path, body)
+    return error.value.code, json.loads(error.value.read())["error"]
+
+
+def test_errors(server, monkeypatch):
+    server, _ = server
+    assert get_error(server, "/salary?username=nobody&hive=design")[0] == 404
+    assert get_error(server, "/salary?username=claire&hive=sales")[0] == 404
+    assert get_error(server, "/salaries", {"users": [{"username": "claire"}]}) == (
+        400,
+        "Each user must be an object with a username and a hive.",
+    )
+    assert get_error(server, "/salaries", [1, 2])[0] == 400
+    assert get_error(server, "/salaries", {"users": "claire"})[0] == 400
+    assert get_error(server, "/events", {"events": [1]}) == (
+        400,
+        "Each event must be an object.",
+    )
+
+    for length in ["abc", "-1"]:
+        connection = http.client.HTTPConnection("127.0.0.1", server.server_port)
+        connection.putrequest("POST", "/salaries")
+        connection.putheader("Content-Length", length)
+        connection.endheaders()
+        response = connection.getresponse()
+        assert response.status == 400
+        connection.close()
+
+    def fail(*args):
+        raise RuntimeError("disk full")
+
+    monkeypatch.setattr(server.RequestHandlerClass.service, "refresh", fail)
+    assert get_error(server, "/salary?username=claire&hive=design") == (
+        500,
+        "disk full",
+    )
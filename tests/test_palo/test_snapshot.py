@@ -0,0 +1,86 @@
+import csv
+import sqlite3
+
+from palo.snapshot import UserSnapshot, UserState
+
+
+def test_snapshot_reads_only_new_complete_lines(data_path, tmp_path):
+    snapshot = UserSnapshot.load(data_path)
+    snapshot.save()
+    assert snapshot.get_current_level("pallav", "tech") == "Team_Lead"
+    assert len(snapshot.get_badges_earned("claire", "design")) == 18
+
+    with open(tmp_path / "user_referential.csv", "a") as f:
+        f.write("claire,design,Team_Lead,\nclaire,design,Team_Lead,design-half")
+
+    snapshot = UserSnapshot.load(data_path)
+    assert snapshot.get_current_level("claire", "design") == "Team_Lead"
+    # The last line is still being written and must not be read yet.
+    assert "design-half" not in snapshot.get_badges_earned("claire", "design")
+
+    with open(tmp_path / "user_referential.csv", "a") as f:
+        f.write("-badge\n")
+    assert snapshot.refresh() == 1
+    assert "design-half-badge" in snapshot.get_badges_earned("claire", "design")
+
+
+def test_snapshot_of_regenerated_log(data_path, tmp_path, monkeypatch):
+    log_path = tmp_path / "user_referential.csv"
+    UserSnapshot.load(data_path).save()
+
+    # A new log larger than the old one: the offset of the snapshot falls in
+    # the middle of one of its lines.
+    header = log_path.read_bytes().splitlines(keepends=True)[0]
+    with open(log_path, "wb") as f:
+        f.write(header)
+        for i in range(200):
+            f.write(f"user{i:03d},tech,Junior,,\r\n".encode())
+    snapshot = UserSnapshot.load(data_path)
+    assert "claire" not in snapshot.usernames
+    assert snapshot.usernames == {f"user{i:03d}" for i in range(200)}
+
+    # Failing to save the snapshot doesn't fail the read.
+    def fail(self):
+        raise sqlite3.OperationalError("attempt to write a readonly database")
+
+    monkeypatch.setattr(UserSnapshot, "connect", fail)
+    snapshot.save()
+    assert snapshot.saved is None
+
+
+def test_snapshot_saves_the_users_of_new_rows(data_path, tmp_path, monkeypatch):
+    monkeypatch.setattr("palo.snapshot.SAVE_THRESHOLD", 2)
+    log_path = tmp_path / "user_referential.csv"
+    UserSnapshot.load(data_path).save()
+
+    # Below the threshold, the rows are folded by every reader.
+    with open(log_path, "a") as f:
+        f.write("claire,design,Team_Lead,\n")
+    snapshot = UserSnapshot.load(data_path)
+    saved = snapshot.saved
+    snapshot.save()
+    assert snapshot.saved == saved
+    assert UserSnapshot.load(data_path).unsaved == [
+        ("claire", "design", "Team_Lead", "")
+    ]
+
+    # A reader of one user only reads that user, and saves the others too.
+    with open(log_path, "a") as f:
+        f.write("pallav,tech,Team_Lead,tech-new-badge\n")
+    snapshot = UserSnapshot.load(data_path, username="pallav")
+    assert snapshot.usernames == {"pallav"}
+    assert "tech-new-badge" in snapshot.get_badges_earned("pallav", "tech")
+    snapshot.save()
+    assert snapshot.saved == (snapshot.offset, snapshot.digest)
+
+    stored = UserSnapshot.load(data_path)
+    assert stored.unsaved == []
+    expected = UserState()
+    with open(log_path) as f:
+        expected.apply(
+            (row["username"], row["hive"], row["levelName"], row["badgeName"])
+            for row in csv.DictReader(f)
+        )
+    assert stored.levels == expected.levels
+    assert stored.earned == expected.earned
+    assert stored.get_current_level("claire", "design") == "Team_Lead"
@@ -0,0 +1,118 @@
+import csv
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from palo.generate_salary_grid_and_badge_referential import (
+    generate_data_for_badge_referential,
+    generate_data_for_salary_grid,
+    get_default_spec,
+    iter_user_referential,
+    write_user_referential,
+)
+
+# Cumulative time, in microseconds, allowed to import both entry points. Most of
+# it is click, the rest must stay lazy.
+IMPORT_TIME_BUDGET = 100_000
+
+# Wall clock time, in seconds, allowed to print the salary of one user of a
+# generated dataset, the start of the interpreter included.
+SINGLE_USER_LATENCY_BUDGET = 0.5
+
+HEAVY_MODULES = ["pandas", "numpy", "pyarrow"]
+
+
+def run_python(code, env=None):
+    return subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True,
+        text=True,
+        check=True,
+        env=env,
+    )
+
+
+def get_cached_bytecode_env(pycache_path):
+    # Installed packages start from their cached bytecode: the modules are
+    # compiled by a first run, the next ones are measured.
+    env = {**os.environ, "PYTHONPYCACHEPREFIX": str(pycache_path)}
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    return env
+
+
+def test_entry_points_import_time(tmp_path):
+    env = get_cached_bytecode_env(tmp_path)
+    code = "import palo.main, palo.generate_user_referential_data"
+    run_python(code, env)
+    result = run_python(code, env)
+    imported = {}
+    for line in result.stderr.splitlines()[1:]:
+        _, cumulative, name = line.split("|")
+        imported[name.strip()] = (int(cumulative), not name.startswith("  "))
+
+    for module in [*HEAVY_MODULES, "pydantic"]:
+        assert module not in imported
+    total = sum(
+        cumulative
+        for name, (cumulative, top_level) in imported.items()
+        if top_level and name.startswith("palo")
+    )
+    assert total < IMPORT_TIME_BUDGET
+
+
+def test_single_user_commands_do_not_import_pandas(data_path):
+    code = f"""
+import sys
+from palo.main import main
+from palo.generate_user_referential_data import main as generate
+generate(
+    ["--action", "upgrade_level", "--username", "claire", "--hive", "design",
+     "--level_name", "Team_Lead", "--data_path", "{data_path}"],
+    standalone_mode=False,
+)
+main(
+    ["--username", "claire", "--hive", "design", "--data_path", "{data_path}"],
+    standalone_mode=False,
+)
+print(*[module for module in {HEAVY_MODULES} if module in sys.modules])
+"""
+    result = run_python(code)
+    salary, heavy_modules = result.stdout.split("\n")[:2]
+    assert salary.split()[0] == "68250.0"
+    assert heavy_modules == ""
+
+
+def test_single_user_salary_latency(tmp_path):
+    data_path = tmp_path / "data"
+    data_path.mkdir()
+    spec = get_default_spec(2)
+    badge_referential = generate_data_for_badge_referential(spec)
+    badge_referential.to_csv(data_path / "badge_referential.csv", index=False)
+    generate_data_for_salary_grid(spec).to_csv(
+        data_path / "salary_grid.csv", index=False
+    )
+    write_user_referential(
+        str(data_path / "user_referential.csv"),
+        iter_user_referential(badge_referential, list(spec.hives), 10_000, 10, seed=10),
+    )
+    with open(data_path / "user_referential.csv") as f:
+        user = next(csv.DictReader(f))
+
+    env = get_cached_bytecode_env(tmp_path / "pycache")
+    command = [
+        sys.executable,
+        "-m",
+        "palo.main",
+        *["--username", user["username"], "--hive", user["hive"]],
+        *["--data_path", str(data_path)],
+    ]
+    # The first run also folds the log into the snapshot.
+    subprocess.run(command, env=env, check=True, capture_output=True)
+    timings = []
+    for _ in range(3):
+        start = time.perf_counter()
+        subprocess.run(command, env=env, check=True, capture_output=True)
+        timings.append(time.perf_counter() - start)
+    assert statistics.median(timings) < SINGLE_USER_LATENCY_BUDGET
@@ -0,0 +1,80 @@
+import os
+from threading import Thread
+
+import pytest
+from click.testing import CliRunner
+
+from palo.generate_user_referential_data import add_records_to_database
+from palo.main import fetch_data
+from palo.main import main as salary_main
+from palo.reshard import main as reshard
+from palo.storage import (
+    CsvStorage,
+    ParquetStorage,
+    ShardedCsvStorage,
+    SqliteStorage,
+    get_storage,
+    import_csv,
+)
+
+
+@pytest.fixture(params=["csv", "sqlite", "parquet", "sharded"])
+def data_path(request, data_path):
+    if request.param == "parquet":
+        pytest.importorskip("pyarrow")
+    if request.param == "sharded":
+        result = CliRunner().invoke(
+            reshard, ["--data_path", data_path, "--shards", "4"]
+        )
+        assert result.exit_code == 0, result.output
+        os.remove(f"{data_path}/user_referential.csv")
+    elif request.param != "csv":
+        result = CliRunner().invoke(
+            import_csv, ["--data_path", data_path, "--to", request.param]
+        )
+        assert result.exit_code == 0, result.output
+        # The CSV files are not read anymore once the database exists.
+        os.remove(f"{data_path}/user_referential.csv")
+    return data_path
+
+
+def test_get_storage(data_path):
+    storage = get_storage(data_path)
+    assert isinstance(
+        storage, (CsvStorage, SqliteStorage, ParquetStorage, ShardedCsvStorage)
+    )
+    rows = fetch_data(
+        f"{data_path}/user_referential.csv",
+        where={"username": "claire", "hive": "design"},
+        columns=["levelName"],
+    )
+    assert list(rows.columns) == ["levelName"]
+    assert len(rows) == 19
+    assert rows["levelName"].values[-1] == "Senior"
+
+
+def test_salary_is_the_same_for_every_backend(data_path):
+    result = CliRunner().invoke(
+        salary_main,
+        ["--username", "pallav", "--hive", "tech", "--data_path", data_path],
+    )
+    assert result.exit_code == 0, result.output
+    assert result.output.split()[0] == "79308.33333333333"
+
+
+def test_concurrent_appends(data_path):
+    def append(username):
+        records = [
+            {"username": username, "hive": "tech", "levelName": "Mid", "badgeName": b}
+            for b in range(50)
+        ]
+        add_records_to_database(records, data_path, table="user_referential")
+
+    threads = [Thread(target=append, args=(f"user{i}",)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    user_referential = fetch_data(f"{data_path}/user_referential.csv")
+    assert len(user_referential) == 40 + 4 * 50
@@ -0,0 +1,66 @@
+import pandas as pd
+
+from palo.generate_salary_grid_and_badge_referential import (
+    generate_data_for_badge_referential,
+    generate_data_for_salary_grid,
+    generate_data_for_user_referential,
+    get_default_spec,
+)
+from palo.main import calculate_salaries
+from palo.storage import get_storage
+from palo.streaming import iter_salaries
+
+
+def test_iter_salaries(tmp_path):
+    spec = get_default_spec(2)
+    badge_referential = generate_data_for_badge_referential(spec)
+    salary_grid = generate_data_for_salary_grid(spec)
+    user_referential = pd.DataFrame(
+        generate_data_for_user_referential(
+            badge_referential, list(spec.hives), 100, 20, seed=5
+        )
+    )
+    badge_referential.to_csv(tmp_path / "badge_referential.csv", index=False)
+    salary_grid.to_csv(tmp_path / "salary_grid.csv", index=False)
+    user_referential.to_csv(tmp_path / "user_referential.csv", index=False)
+
+    expected = calculate_salaries(
+        None, salary_grid, user_referential, badge_referential
+    )
+    salaries = pd.DataFrame(iter_salaries(str(tmp_path), chunk_size=37))
+    pd.testing.assert_frame_equal(salaries, expected)
+
+    hive_salaries = pd.DataFrame(iter_salaries(str(tmp_path), 37, hive=spec.hives[1]))
+    pd.testing.assert_frame_equal(
+        hive_salaries,
+        expected.loc[expected["hive"] == spec.hives[1]].reset_index(drop=True),
+    )
+
+
+def test_iter_salaries_numeric_names(tmp_path):
+    spec = get_default_spec(2)
+    badge_referential = generate_data_for_badge_referential(spec)
+    salary_grid = generate_data_for_salary_grid(spec)
+    user_referential = pd.DataFrame(
+        generate_data_for_user_referential(
+            badge_referential, list(spec.hives), 20, 5, seed=5
+        )
+    )
+    # Names which look like numbers stay strings, with their leading zeros.
+    usernames = {
+        username: f"{number:03d}"
+        for number, username in enumerate(user_referential["username"].unique())
+    }
+    user_referential["username"] = user_referential["username"].map(usernames)
+    badge_referential.to_csv(tmp_path / "badge_referential.csv", index=False)
+    salary_grid.to_csv(tmp_path / "salary_grid.csv", index=False)
+    user_referential.to_csv(tmp_path / "user_referential.csv", index=False)
+
+    storage = get_storage(str(tmp_path))
+    chunk = next(storage.iter_table("user_referential", 7))
+    table = storage.fetch_table("user_referential")
+    for column in chunk.columns:
+        assert chunk[column].dtype == "category"
+        assert chunk[column].cat.categories.dtype == table[column].cat.categories.dtype
+    salaries = pd.DataFrame(iter_salaries(str(tmp_path), chunk_size=7))
+    assert salaries["username"].tolist() == list(usernames.values())
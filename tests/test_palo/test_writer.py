@@ -0,0 +1,98 @@
+import asyncio
+import os
+import threading
+import time
+from threading import Thread
+
+from palo.main import fetch_data
+from palo.writer import GroupCommitWriter
+
+
+def get_records(producer, submission, number):
+    return [
+        {
+            "username": f"user{producer}",
+            "hive": "tech",
+            "levelName": "Mid",
+            "badgeName": f"s{submission}-badge{i}",
+        }
+        for i in range(number)
+    ]
+
+
+def test_group_commit(data_path, monkeypatch):
+    before = len(fetch_data(f"{data_path}/user_referential.csv"))
+    fsyncs = []
+    fsync = os.fsync
+    monkeypatch.setattr(os, "fsync", lambda fd: (fsync(fd), fsyncs.append(fd)))
+
+    with GroupCommitWriter(data_path) as writer:
+        appends = []
+        # Badge names of the records appended and fsynced.
+        committed = set()
+        release = threading.Event()
+        append_records = writer.storage.append_records
+
+        def counting_append_records(table, records):
+            if not appends:
+                # The first batch is held until every producer submitted.
+                release.wait(timeout=10)
+            synced = len(fsyncs)
+            append_records(table, records)
+            assert len(fsyncs) > synced
+            appends.append(len(records))
+            committed.update(record["badgeName"] for record in records)
+
+        writer.storage.append_records = counting_append_records
+        submitted = []
+        submit = writer.submit
+
+        def counting_submit(records):
+            future = submit(records)
+            submitted.append(future)
+            return future
+
+        writer.submit = counting_submit
+
+        # Submissions whose write returned before they were on disk.
+        early = []
+
+        def produce(producer):
+            for submission in range(10):
+                records = get_records(producer, submission, 3)
+                writer.write(records)
+                if not {record["badgeName"] for record in records} <= committed:
+                    early.append((producer, submission))
+
+        threads = [Thread(target=produce, args=(producer,)) for producer in range(8)]
+        for thread in threads:
+            thread.start()
+        deadline = time.monotonic() + 10
+        while len(submitted) < len(threads) and time.monotonic() < deadline:
+            time.sleep(0.001)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        async def produce_async():
+            await asyncio.gather(
+                *(writer.write_async(get_records(8 + task, 0, 3)) for task in range(10))
+            )
+
+        asyncio.run(produce_async())
+
+    submissions = 8 * 10 + 10
+    assert sum(appends) == submissions * 3
+    # Submissions made while a batch was written share the next append.
+    assert len(appends) < submissions
+    assert early == []
+    user_referential = fetch_data(f"{data_path}/user_referential.csv")
+    assert len(user_referential) == before + sum(appends)
+    # Records of a submission are written together, in order.
+    for username, rows in user_referential.iloc[before:].groupby("username"):
+        badges = list(rows["badgeName"])
+        assert badges == [
+            f"s{submission}-badge{i}"
+            for submission in range(len(badges) // 3)
+            for i in range(3)
+        ]